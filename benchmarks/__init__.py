@@ -0,0 +1 @@
+"""Benchmarks for spotcast, run with `python -m benchmarks.<name>`"""
@@ -0,0 +1,208 @@
+"""Microbenchmark of the Spotify cast launch handshake against simulated
+receivers.
+
+Drives pychromecast and SpotifyController against fake_cast, with the
+device-auth refresh answered by stub_spotify. Scenarios:
+
+    cold         new connection and app launch, as every spotcast.start
+    reused       app launch over a connection kept open
+    app_running  handshake only, over an open connection to a running app
+    concurrent   one cold launch on every virtual device at once
+
+    python -m benchmarks.bench_cast_launch --devices 50 --iterations 20 \\
+        --launch-delay 0.05 --failure-mode silent --failure-rate 0.1
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pychromecast
+
+from custom_components.spotcast import spotify_controller
+from custom_components.spotcast.metrics import percentile
+from custom_components.spotcast.spotify_controller import SpotifyController
+
+from .fake_cast import FAILURE_MODES, FakeCastReceiver
+from .stub_spotify import StubSpotify
+
+
+class Timings:
+    def __init__(self) -> None:
+        self.connect = []
+        self.launch = []
+        self.failures = 0
+        self._lock = threading.Lock()
+
+    def add(self, name: str, duration: float) -> None:
+        with self._lock:
+            getattr(self, name).append(duration)
+
+    def fail(self) -> None:
+        with self._lock:
+            self.failures += 1
+
+
+def connect(cast_info, timeout: float) -> pychromecast.Chromecast:
+    cast = pychromecast.get_chromecast_from_cast_info(
+        cast_info, None, tries=1, timeout=timeout
+    )
+    cast.wait(timeout)
+    return cast
+
+
+def launch(cast: pychromecast.Chromecast, timeout: float) -> None:
+    controller = SpotifyController(cast, "bench-token", 3600)
+    cast.register_handler(controller)
+    try:
+        controller.launch_app(timeout=timeout)
+    finally:
+        cast.unregister_handler(controller)
+
+
+def timed(timings: Timings, name: str, func, *args):
+    start = time.monotonic()
+    result = func(*args)
+    timings.add(name, time.monotonic() - start)
+    return result
+
+
+def cold_launch(cast_info, timings: Timings, timeout: float) -> None:
+    cast = None
+    try:
+        cast = timed(timings, "connect", connect, cast_info, timeout)
+        timed(timings, "launch", launch, cast, timeout)
+        cast.quit_app()
+    except Exception:  # pylint: disable=broad-except
+        timings.fail()
+    finally:
+        if cast is not None:
+            cast.disconnect(timeout)
+
+
+def run_cold(cast_infos, iterations: int, timeout: float) -> Timings:
+    timings = Timings()
+    for x in range(iterations):
+        cold_launch(cast_infos[x % len(cast_infos)], timings, timeout)
+    return timings
+
+
+def run_reused(cast_info, iterations: int, timeout: float, quit_app: bool) -> Timings:
+    timings = Timings()
+    cast = timed(timings, "connect", connect, cast_info, timeout)
+    try:
+        for _ in range(iterations):
+            try:
+                timed(timings, "launch", launch, cast, timeout)
+                if quit_app:
+                    cast.quit_app()
+            except Exception:  # pylint: disable=broad-except
+                timings.fail()
+    finally:
+        cast.disconnect(timeout)
+    return timings
+
+
+def run_concurrent(cast_infos, timeout: float) -> Timings:
+    timings = Timings()
+    with ThreadPoolExecutor(len(cast_infos)) as executor:
+        for cast_info in cast_infos:
+            executor.submit(cold_launch, cast_info, timings, timeout)
+    return timings
+
+
+def print_row(name: str, timings: Timings, wall: float) -> None:
+    def ms(values, quantile):
+        if not values:
+            return "-"
+        return f"{percentile(sorted(values), quantile) * 1000:.1f}"
+
+    print(
+        f"{name:<12} {len(timings.launch):>8} {timings.failures:>8} "
+        f"{ms(timings.connect, 0.5):>10} {ms(timings.connect, 0.95):>10} "
+        f"{ms(timings.launch, 0.5):>10} {ms(timings.launch, 0.95):>10} "
+        f"{wall:>8.2f}"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--devices", type=int, default=50)
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=5.0)
+    parser.add_argument("--status-delay", type=float, default=0.0)
+    parser.add_argument("--launch-delay", type=float, default=0.05)
+    parser.add_argument("--info-delay", type=float, default=0.01)
+    parser.add_argument("--add-user-delay", type=float, default=0.01)
+    parser.add_argument("--auth-latency", type=float, default=0.02)
+    parser.add_argument("--failure-mode", choices=FAILURE_MODES)
+    parser.add_argument("--failure-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--verbose", action="store_true", help="log failed launches"
+    )
+    args = parser.parse_args()
+
+    # failures are counted in the report, the reconnect attempts of
+    # pychromecast after a dropped connection only add noise
+    logging.basicConfig(level=logging.WARNING if args.verbose else logging.CRITICAL)
+
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+
+    def run(coro):
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    stub = StubSpotify(latency=args.auth_latency)
+    receiver = FakeCastReceiver(
+        devices=args.devices,
+        status_delay=args.status_delay,
+        launch_delay=args.launch_delay,
+        info_delay=args.info_delay,
+        add_user_delay=args.add_user_delay,
+        failure_mode=args.failure_mode,
+        failure_rate=args.failure_rate,
+    )
+    run(stub.start())
+    run(receiver.start())
+    spotify_controller.DEVICE_AUTH_URL = f"{stub.url}/device-auth/v1/refresh"
+    cast_infos = receiver.cast_infos()
+
+    print(
+        f"{'scenario':<12} {'launches':>8} {'failures':>8} {'conn p50':>10} "
+        f"{'conn p95':>10} {'launch p50':>10} {'launch p95':>10} {'wall s':>8}"
+    )
+
+    scenarios = [
+        ("cold", lambda: run_cold(cast_infos, args.iterations, args.timeout)),
+        (
+            "reused",
+            lambda: run_reused(cast_infos[0], args.iterations, args.timeout, True),
+        ),
+        (
+            "app_running",
+            lambda: run_reused(cast_infos[0], args.iterations, args.timeout, False),
+        ),
+        ("concurrent", lambda: run_concurrent(cast_infos, args.timeout)),
+    ]
+
+    for name, scenario in scenarios:
+        start = time.monotonic()
+        timings = scenario()
+        print_row(name, timings, time.monotonic() - start)
+
+    print()
+    print(f"connections: {sum(receiver.connections.values())}, "
+          f"receiver failures: {dict(receiver.failures)}")
+
+    run(receiver.stop())
+    run(stub.stop())
+    loop.call_soon_threadsafe(loop.stop)
+
+
+if __name__ == "__main__":
+    main()
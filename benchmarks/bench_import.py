@@ -0,0 +1,116 @@
+"""Import-time benchmark of spotcast.
+
+Imports the integration in a fresh interpreter with `-X importtime`,
+after the Home Assistant modules the core loads before any integration,
+and reports the time spent importing spotcast and whatever it pulled in
+on top of the core. Lists the slowest modules and the heavy libraries
+that were loaded although no start ran yet.
+
+    python -m benchmarks.bench_import --runs 10 --top 15
+"""
+
+from __future__ import annotations
+
+import argparse
+import statistics
+import subprocess
+import sys
+from collections import defaultdict
+
+MARKER = "spotcast-bench-import"
+
+# loaded by the core before it sets up any integration
+CORE_MODULES = (
+    "homeassistant.core",
+    "homeassistant.helpers.config_validation",
+    "homeassistant.helpers.entity_platform",
+    "homeassistant.helpers.event",
+    "homeassistant.components.websocket_api",
+)
+
+# only needed once spotcast talks to Spotify or a speaker
+DEFERRED_MODULES = (
+    "spotipy",
+    "pychromecast",
+    "requests",
+    "homeassistant.components.cast.media_player",
+    "homeassistant.components.spotify.media_player",
+)
+
+IMPORT_SCRIPT = "\n".join(
+    [
+        "import sys",
+        *(f"import {module}" for module in CORE_MODULES),
+        f"print({MARKER!r}, file=sys.stderr, flush=True)",
+        "import custom_components.spotcast",
+        f"loaded = [m for m in {DEFERRED_MODULES!r} if m in sys.modules]",
+        f"print({MARKER!r}, *loaded, file=sys.stderr)",
+    ]
+)
+
+
+def parse_importtime(lines: list[str]) -> dict[str, tuple[int, int]]:
+    """Self and cumulative microseconds of every imported module"""
+    times = {}
+    for line in lines:
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        times[fields[2].strip()] = (int(fields[0]), int(fields[1]))
+    return times
+
+
+def run_once() -> tuple[dict[str, tuple[int, int]], list[str]]:
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", IMPORT_SCRIPT],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    lines = result.stderr.splitlines()
+    markers = [i for i, line in enumerate(lines) if line.startswith(MARKER)]
+    loaded = lines[markers[1]].split()[1:]
+    return parse_importtime(lines[markers[0] + 1:markers[1]]), loaded
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    parser.add_argument("--top", type=int, default=15)
+    args = parser.parse_args()
+
+    totals = []
+    self_times = defaultdict(list)
+    loaded = set()
+
+    for _ in range(args.runs):
+        times, run_loaded = run_once()
+        totals.append(sum(self_us for self_us, _ in times.values()))
+        for module, (self_us, _) in times.items():
+            self_times[module].append(self_us)
+        loaded.update(run_loaded)
+
+    print(f"spotcast import on top of the core, {args.runs} runs")
+    print(
+        f"  median {statistics.median(totals) / 1000:.1f} ms, "
+        f"min {min(totals) / 1000:.1f} ms, max {max(totals) / 1000:.1f} ms"
+    )
+
+    print("\nslowest modules (median self time)")
+    slowest = sorted(
+        self_times.items(),
+        key=lambda item: statistics.median(item[1]),
+        reverse=True,
+    )
+    for module, samples in slowest[: args.top]:
+        print(f"  {statistics.median(samples) / 1000:8.2f} ms  {module}")
+
+    print("\ndeferred modules loaded at import")
+    for module in DEFERRED_MODULES:
+        print(f"  {'yes' if module in loaded else 'no ':3}  {module}")
+
+
+if __name__ == "__main__":
+    main()
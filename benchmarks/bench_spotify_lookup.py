@@ -0,0 +1,77 @@
+"""Benchmark of get_spotify_media_player lookups against the number of
+Spotify media player entities.
+
+Compares the previous linear scan of the spotify platform with the
+unique_id index of SpotifyPlayerRegistry. The index lookup should stay
+flat while the scan grows with the entity count.
+
+    python -m benchmarks.bench_spotify_lookup
+"""
+
+from __future__ import annotations
+
+import timeit
+from types import SimpleNamespace
+
+from homeassistant.components.spotify.media_player import SpotifyMediaPlayer
+from homeassistant.helpers.entity_platform import DATA_ENTITY_PLATFORM
+
+from custom_components.spotcast.registry import (
+    SpotifyPlayerRegistry,
+    iter_platform_entities,
+)
+
+ENTITY_COUNTS = [1, 10, 100, 1000, 10000]
+LOOKUPS = 2000
+
+
+def make_hass(count: int) -> SimpleNamespace:
+    """Build a minimal hass object holding one spotify platform with
+    `count` media player entities"""
+    entities = {}
+
+    for i in range(count):
+        entity = SpotifyMediaPlayer.__new__(SpotifyMediaPlayer)
+        entity.entity_id = f"media_player.spotify_{i}"
+        entity._attr_unique_id = f"user_{i}"
+        entities[entity.entity_id] = entity
+
+    platform = SimpleNamespace(domain="media_player", entities=entities)
+    return SimpleNamespace(data={DATA_ENTITY_PLATFORM: {"spotify": [platform]}})
+
+
+def scan_lookup(hass, unique_id: str):
+    return next(
+        entity
+        for entity in iter_platform_entities(
+            hass, "spotify", lambda: SpotifyMediaPlayer
+        )
+        if entity.unique_id == unique_id
+    )
+
+
+def main():
+    print(f"{'entities':>10} {'scan (us)':>12} {'index (us)':>12}")
+
+    for count in ENTITY_COUNTS:
+        hass = make_hass(count)
+        registry = SpotifyPlayerRegistry(hass)
+        registry.rebuild()
+
+        # worst case for the scan: the last entity
+        unique_id = f"user_{count - 1}"
+        assert registry.get_by_unique_id(unique_id) is scan_lookup(hass, unique_id)
+
+        scan = timeit.timeit(lambda: scan_lookup(hass, unique_id), number=LOOKUPS)
+        index = timeit.timeit(
+            lambda: registry.get_by_unique_id(unique_id), number=LOOKUPS
+        )
+
+        print(
+            f"{count:>10} {scan / LOOKUPS * 1e6:>12.2f} "
+            f"{index / LOOKUPS * 1e6:>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
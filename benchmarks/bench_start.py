@@ -0,0 +1,304 @@
+"""Offline end-to-end benchmark of spotcast.start and the websocket
+handlers.
+
+Sets spotcast up on a bare Home Assistant core object, points the token
+endpoint and the Web API at the local stand-in of stub_spotify and runs
+every scenario through the real service and websocket handlers. Reports
+throughput and latency per scenario, then the per-stage percentiles
+collected by spotcast itself.
+
+    python -m benchmarks.bench_start --iterations 50 --concurrency 4 \\
+        --latency 0.02 --throttle 0.05 --rate 1000
+
+The account rate limiter of spotcast stays in place; raise `--rate` to
+measure everything else.
+
+Every iteration starts on the next of the Connect devices of the stub,
+and `start_window` is 0, so the starts are neither collapsed as repeats
+nor superseded by the next one on the same device. Starts that still
+were are counted under `skipped` instead of passing for completed ones;
+keep `--concurrency` below the number of stub devices.
+
+`uri_direct` runs the `uri` scenario the way the cast platform does,
+without the service bus; the difference to `uri` is what the direct path
+saves before the speaker is reached. The connection it also saves is
+the `connect` column of bench_cast_launch.
+
+Post-play settings are left out (`repeat` is cleared) as their fixed
+sleeps would hide every other stage.
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import tempfile
+import time
+from types import SimpleNamespace
+
+from homeassistant.components import websocket_api
+from homeassistant.core import HomeAssistant
+
+import custom_components.spotcast as spotcast
+from custom_components.spotcast import client, spotcast_controller
+from custom_components.spotcast.client import RateLimitedSpotify
+from custom_components.spotcast.const import (
+    DOMAIN,
+    SERVICE_START_COMMAND_SCHEMA,
+    SPOTCAST_CONFIG_SCHEMA,
+)
+from custom_components.spotcast.metrics import percentile
+from custom_components.spotcast.ratelimit import (
+    REQUEST_BURST,
+    REQUEST_RATE,
+    RateLimiter,
+)
+
+from .stub_spotify import USER_ID, StubSpotify, device_name, spotify_id
+
+COMMON = {"repeat": ""}
+
+START_SCENARIOS = {
+    "uri": {"uri": f"spotify:playlist:{spotify_id('playlist', 1)}"},
+    "search": {"playlist_name": "Bench playlist"},
+    "category": {"category": "bench"},
+    "random_song": {
+        "uri": f"spotify:playlist:{spotify_id('playlist', 1)}",
+        "random_song": True,
+    },
+    "show": {
+        "uri": f"spotify:show:{spotify_id('show', 1)}",
+        "ignore_fully_played": True,
+    },
+}
+
+WEBSOCKET_SCENARIOS = {
+    "ws_playlists": {"type": "spotcast/playlists", "playlist_type": "user"},
+    "ws_devices": {"type": "spotcast/devices"},
+    "ws_player": {"type": "spotcast/player"},
+}
+
+
+class BenchConnection:
+    """Websocket connection collecting the responses of the handlers"""
+
+    def __init__(self) -> None:
+        self.pending = {}
+        self._next_id = 0
+
+    def request(self, msg: dict) -> tuple[dict, asyncio.Future]:
+        self._next_id += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[self._next_id] = future
+        return {"id": self._next_id, **msg}, future
+
+    def send_message(self, message) -> None:
+        if isinstance(message, (str, bytes)):
+            message = json.loads(message)
+        self.pending.pop(message["id"]).set_result(message)
+
+
+async def async_create_hass(config_dir: str) -> HomeAssistant:
+    try:
+        hass = HomeAssistant(config_dir)
+    except TypeError:
+        # older cores take the config dir after construction
+        hass = HomeAssistant()
+        hass.config.config_dir = config_dir
+    return hass
+
+
+async def async_setup_spotcast(
+    hass: HomeAssistant, stub: StubSpotify, rate: float, burst: int
+) -> None:
+    spotcast_controller.TOKEN_URL = f"{stub.url}/get_access_token"
+    client.API_PREFIX = f"{stub.url}/v1/"
+
+    config = SPOTCAST_CONFIG_SCHEMA(
+        {
+            DOMAIN: {
+                "sp_dc": "bench",
+                "sp_key": "bench",
+                "library_mirror": False,
+                "start_window": 0,
+            }
+        }
+    )
+    await spotcast.async_setup(hass, config)
+    await hass.async_block_till_done()
+
+    hass.data[DOMAIN]["controller"].rate_limiters["default"] = RateLimiter(
+        rate, burst
+    )
+
+    # stands in for the media player of the core spotify integration,
+    # which provides the Spotify Connect device list
+    media_player = SimpleNamespace(
+        entity_id="media_player.spotify_bench",
+        unique_id=USER_ID,
+        data=SimpleNamespace(
+            client=RateLimitedSpotify(RateLimiter(rate, burst), auth="bench")
+        ),
+    )
+    hass.data[DOMAIN]["spotify_registry"]._add(media_player)
+
+
+def skipped_starts(hass: HomeAssistant) -> int:
+    """Starts collapsed into another one or superseded so far"""
+    counts = hass.data[DOMAIN]["coordinator"].counts
+    return counts["collapsed"] + counts["superseded"]
+
+
+async def async_measure(
+    hass: HomeAssistant, iterations: int, concurrency: int, call
+) -> dict:
+    """Run `call(iteration)` `iterations` times, `concurrency` at once"""
+    latencies = []
+    failures = 0
+    skipped = skipped_starts(hass)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(iteration: int):
+        nonlocal failures
+        async with semaphore:
+            start = time.monotonic()
+            try:
+                await call(iteration)
+            except Exception:  # pylint: disable=broad-except
+                failures += 1
+                return
+            latencies.append(time.monotonic() - start)
+
+    start = time.monotonic()
+    await asyncio.gather(*(one(iteration) for iteration in range(iterations)))
+    wall = time.monotonic() - start
+
+    latencies.sort()
+    return {
+        "throughput": iterations / wall,
+        "p50_ms": percentile(latencies, 0.50) * 1000 if latencies else None,
+        "p95_ms": percentile(latencies, 0.95) * 1000 if latencies else None,
+        "failures": failures,
+        "skipped": skipped_starts(hass) - skipped,
+    }
+
+
+def print_row(name: str, result: dict) -> None:
+    def ms(value):
+        return "-" if value is None else f"{value:.1f}"
+
+    print(
+        f"{name:<14} {result['throughput']:>10.1f} {ms(result['p50_ms']):>10} "
+        f"{ms(result['p95_ms']):>10} {result['failures']:>9} "
+        f"{result['skipped']:>8}"
+    )
+
+
+async def async_main(args: argparse.Namespace) -> None:
+    stub = StubSpotify(
+        latency=args.latency,
+        throttle_rate=args.throttle,
+        retry_after=args.retry_after,
+    )
+    await stub.start()
+
+    with tempfile.TemporaryDirectory() as config_dir:
+        hass = await async_create_hass(config_dir)
+        await async_setup_spotcast(hass, stub, args.rate, args.burst)
+
+        print(
+            f"{'scenario':<14} {'req/s':>10} {'p50 ms':>10} {'p95 ms':>10} "
+            f"{'failures':>9} {'skipped':>8}"
+        )
+
+        for name, data in START_SCENARIOS.items():
+            result = await async_measure(
+                hass,
+                args.iterations,
+                args.concurrency,
+                lambda iteration, data=data: hass.services.async_call(
+                    DOMAIN,
+                    "start",
+                    {**COMMON, **data, "device_name": device_name(iteration)},
+                    blocking=True,
+                ),
+            )
+            print_row(name, result)
+
+        # the path of the cast platform, without the service bus
+        start = hass.data[DOMAIN]["start"]
+        data = SERVICE_START_COMMAND_SCHEMA({**COMMON, **START_SCENARIOS["uri"]})
+        print_row(
+            "uri_direct",
+            await async_measure(
+                hass,
+                args.iterations,
+                args.concurrency,
+                lambda iteration: start(
+                    {**data, "device_name": device_name(iteration)}
+                ),
+            ),
+        )
+
+        connection = BenchConnection()
+        handlers = hass.data[websocket_api.DOMAIN]
+
+        for name, msg in WEBSOCKET_SCENARIOS.items():
+            handler, schema = handlers[msg["type"]]
+
+            async def call(_, msg=msg, handler=handler, schema=schema):
+                request, future = connection.request(msg)
+                handler(hass, connection, schema(request))
+                response = await future
+                if not response["success"]:
+                    raise RuntimeError(response["error"])
+
+            print_row(
+                name,
+                await async_measure(hass, args.iterations, args.concurrency, call),
+            )
+
+        print()
+        print(f"{'stage':<22} {'count':>7} {'p50 ms':>10} {'p95 ms':>10}")
+        summary = hass.data[DOMAIN]["controller"].metrics.summary()
+        for stage, values in summary.items():
+            print(
+                f"{stage:<22} {values['count']:>7} {values['p50_ms']:>10} "
+                f"{values['p95_ms']:>10}"
+            )
+
+        print()
+        print(f"stub calls: {sum(stub.calls.values())}, "
+              f"throttled: {sum(stub.throttled.values())}")
+
+        await hass.async_stop(force=True)
+
+    await stub.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument(
+        "--latency", type=float, default=0.02, help="stub response delay (s)"
+    )
+    parser.add_argument(
+        "--throttle", type=float, default=0.0, help="share of 429 responses"
+    )
+    parser.add_argument(
+        "--retry-after", type=float, default=0.1, help="Retry-After of a 429 (s)"
+    )
+    parser.add_argument(
+        "--rate",
+        type=float,
+        default=REQUEST_RATE,
+        help="sustained Web API requests per second of the account",
+    )
+    parser.add_argument("--burst", type=int, default=REQUEST_BURST)
+    asyncio.run(async_main(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
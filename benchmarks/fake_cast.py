@@ -0,0 +1,322 @@
+"""Simulated Chromecast receivers running the Spotify cast app.
+
+Every virtual device listens on its own TLS port and speaks enough CASTV2
+for pychromecast and SpotifyController: the connection, heartbeat and
+receiver namespaces, and the getInfo/addUser handshake of
+urn:x-cast:com.spotify.chromecast.secure.v1. Responses can be delayed per
+stage and a share of the launches can fail in one of FAILURE_MODES.
+
+The device-auth refresh SpotifyController does between getInfo and addUser
+goes to the Web API, see stub_spotify.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import os
+import random
+import ssl
+import struct
+import subprocess
+import tempfile
+import uuid
+from collections import Counter
+from dataclasses import dataclass, field
+
+from pychromecast.const import CAST_TYPE_AUDIO
+from pychromecast.generated.cast_channel_pb2 import CastMessage
+from pychromecast.models import CastInfo, HostServiceInfo
+
+from custom_components.spotcast.const import APP_SPOTIFY
+from custom_components.spotcast.spotify_controller import (
+    APP_NAMESPACE,
+    TYPE_ADD_USER,
+    TYPE_ADD_USER_ERROR,
+    TYPE_ADD_USER_RESPONSE,
+    TYPE_GET_INFO,
+    TYPE_GET_INFO_RESPONSE,
+)
+
+NS_HEARTBEAT = "urn:x-cast:com.google.cast.tp.heartbeat"
+NS_RECEIVER = "urn:x-cast:com.google.cast.receiver"
+
+CLIENT_ID = "d7df0887fb71494ea994202cb473eae7"
+
+# LAUNCH is answered with a LAUNCH_ERROR
+FAILURE_LAUNCH_ERROR = "launch_error"
+# addUser is answered with an addUserError
+FAILURE_ADD_USER_ERROR = "add_user_error"
+# getInfo is never answered
+FAILURE_SILENT = "silent"
+# the connection is dropped on LAUNCH
+FAILURE_DISCONNECT = "disconnect"
+
+FAILURE_MODES = (
+    FAILURE_LAUNCH_ERROR,
+    FAILURE_ADD_USER_ERROR,
+    FAILURE_SILENT,
+    FAILURE_DISCONNECT,
+)
+
+
+def create_certificate(directory: str) -> tuple[str, str]:
+    """Self-signed certificate for the receivers. pychromecast does not
+    verify it, like real devices it only needs TLS"""
+    cert = os.path.join(directory, "cert.pem")
+    key = os.path.join(directory, "key.pem")
+    subprocess.run(
+        [
+            "openssl", "req", "-x509", "-nodes", "-days", "1",
+            "-newkey", "ec", "-pkeyopt", "ec_paramgen_curve:prime256v1",
+            "-subj", "/CN=fake-cast", "-keyout", key, "-out", cert,
+        ],
+        check=True,
+        capture_output=True,
+    )
+    return cert, key
+
+
+def encode(message: CastMessage) -> bytes:
+    payload = message.SerializeToString()
+    return struct.pack(">I", len(payload)) + payload
+
+
+@dataclass
+class VirtualDevice:
+    """State of one simulated speaker"""
+
+    friendly_name: str
+    uuid: uuid.UUID = field(default_factory=uuid.uuid4)
+    port: int = 0
+    session_id: str | None = None
+    transport_id: str | None = None
+
+    @property
+    def app_running(self) -> bool:
+        return self.session_id is not None
+
+    def status(self) -> dict:
+        applications = []
+        if self.app_running:
+            applications.append(
+                {
+                    "appId": APP_SPOTIFY,
+                    "displayName": "Spotify",
+                    "namespaces": [{"name": APP_NAMESPACE}],
+                    "sessionId": self.session_id,
+                    "transportId": self.transport_id,
+                    "statusText": "Spotify",
+                }
+            )
+        return {
+            "applications": applications,
+            "isActiveInput": True,
+            "isStandBy": False,
+            "volume": {"level": 0.5, "muted": False},
+        }
+
+
+class FakeCastReceiver:
+    """Runs `devices` virtual speakers on the local host"""
+
+    def __init__(
+        self,
+        devices: int = 1,
+        status_delay: float = 0.0,
+        launch_delay: float = 0.0,
+        info_delay: float = 0.0,
+        add_user_delay: float = 0.0,
+        failure_mode: str | None = None,
+        failure_rate: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        if failure_mode is not None and failure_mode not in FAILURE_MODES:
+            raise ValueError(f"unknown failure mode {failure_mode}")
+
+        self.devices = [
+            VirtualDevice(f"Fake Speaker {x}", uuid.UUID(int=x + 1))
+            for x in range(devices)
+        ]
+        self.status_delay = status_delay
+        self.launch_delay = launch_delay
+        self.info_delay = info_delay
+        self.add_user_delay = add_user_delay
+        self.failure_mode = failure_mode
+        self.failure_rate = failure_rate
+        self.connections = Counter()
+        self.messages = Counter()
+        self.failures = Counter()
+        self._random = random.Random(seed)
+        self._servers = []
+        self._tasks = set()
+        self._certdir = None
+        self.host = None
+
+    async def start(self, host: str = "127.0.0.1") -> None:
+        self.host = host
+        self._certdir = tempfile.TemporaryDirectory()
+        cert, key = create_certificate(self._certdir.name)
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(cert, key)
+
+        for device in self.devices:
+            server = await asyncio.start_server(
+                lambda reader, writer, device=device: self._serve(
+                    device, reader, writer
+                ),
+                host,
+                0,
+                ssl=context,
+            )
+            device.port = server.sockets[0].getsockname()[1]
+            self._servers.append(server)
+
+    async def stop(self) -> None:
+        for task in list(self._tasks):
+            task.cancel()
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+        if self._certdir is not None:
+            self._certdir.cleanup()
+            self._certdir = None
+
+    def cast_infos(self) -> list[CastInfo]:
+        """pychromecast CastInfo of every device, as provided by the cast
+        integration"""
+        return [
+            CastInfo(
+                {HostServiceInfo(self.host, device.port)},
+                device.uuid,
+                "Fake Speaker",
+                device.friendly_name,
+                self.host,
+                device.port,
+                CAST_TYPE_AUDIO,
+                "spotcast",
+            )
+            for device in self.devices
+        ]
+
+    def _fails(self, mode: str) -> bool:
+        if self.failure_mode != mode or self._random.random() >= self.failure_rate:
+            return False
+        self.failures[mode] += 1
+        return True
+
+    async def _serve(
+        self,
+        device: VirtualDevice,
+        reader: asyncio.StreamReader,
+        writer: asyncio.StreamWriter,
+    ) -> None:
+        self.connections[device.friendly_name] += 1
+
+        try:
+            while True:
+                header = await reader.readexactly(4)
+                message = CastMessage()
+                message.ParseFromString(
+                    await reader.readexactly(struct.unpack(">I", header)[0])
+                )
+                self._dispatch(device, writer, message)
+        except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            writer.close()
+
+    def _dispatch(
+        self,
+        device: VirtualDevice,
+        writer: asyncio.StreamWriter,
+        message: CastMessage,
+    ) -> None:
+        data = json.loads(message.payload_utf8)
+        kind = data.get("type")
+        self.messages[kind] += 1
+
+        def reply(payload: dict, delay: float = 0.0, source: str = None):
+            response = CastMessage(
+                protocol_version=CastMessage.CASTV2_1_0,
+                source_id=source or message.destination_id,
+                destination_id=message.source_id,
+                namespace=message.namespace,
+                payload_type=CastMessage.STRING,
+                payload_utf8=json.dumps(payload),
+            )
+            if not delay:
+                writer.write(encode(response))
+                return
+
+            async def delayed():
+                await asyncio.sleep(delay)
+                if not writer.is_closing():
+                    writer.write(encode(response))
+
+            task = asyncio.ensure_future(delayed())
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        request_id = {"requestId": data["requestId"]} if "requestId" in data else {}
+
+        if message.namespace == NS_HEARTBEAT and kind == "PING":
+            reply({"type": "PONG"})
+
+        elif message.namespace == NS_RECEIVER and kind == "GET_STATUS":
+            reply(
+                {"type": "RECEIVER_STATUS", "status": device.status(), **request_id},
+                self.status_delay,
+            )
+
+        elif message.namespace == NS_RECEIVER and kind == "LAUNCH":
+            if self._fails(FAILURE_DISCONNECT):
+                writer.close()
+                return
+
+            if self._fails(FAILURE_LAUNCH_ERROR):
+                reply(
+                    {"type": "LAUNCH_ERROR", "reason": "NOT_FOUND", **request_id},
+                    self.launch_delay,
+                )
+                return
+
+            device.session_id = str(uuid.uuid4())
+            device.transport_id = device.session_id
+            reply(
+                {"type": "RECEIVER_STATUS", "status": device.status(), **request_id},
+                self.launch_delay,
+            )
+
+        elif message.namespace == NS_RECEIVER and kind == "STOP":
+            device.session_id = device.transport_id = None
+            reply({"type": "RECEIVER_STATUS", "status": device.status(), **request_id})
+
+        elif message.namespace == APP_NAMESPACE and kind == TYPE_GET_INFO:
+            if self._fails(FAILURE_SILENT):
+                return
+
+            reply(
+                {
+                    "type": TYPE_GET_INFO_RESPONSE,
+                    "payload": {
+                        "clientID": CLIENT_ID,
+                        "deviceID": data["payload"]["deviceID"],
+                        "remoteName": data["payload"]["remoteName"],
+                    },
+                },
+                self.info_delay,
+            )
+
+        elif message.namespace == APP_NAMESPACE and kind == TYPE_ADD_USER:
+            if self._fails(FAILURE_ADD_USER_ERROR):
+                reply(
+                    {"type": TYPE_ADD_USER_ERROR, "payload": {"errorCode": 8}},
+                    self.add_user_delay,
+                )
+                return
+
+            reply({"type": TYPE_ADD_USER_RESPONSE}, self.add_user_delay)
+
+        # CONNECT and CLOSE of the connection namespace need no answer
@@ -0,0 +1,223 @@
+"""Local stand-in for the Spotify Web API and token endpoint.
+
+Serves the endpoints spotcast calls, including the device-auth refresh of
+the cast handshake, with canned, deterministic payloads.
+Every response can be delayed by a fixed latency, and a share of the
+requests can be answered with a 429 and a Retry-After header to exercise
+the rate limit handling.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import random
+import re
+import time
+from collections import Counter
+
+from aiohttp import web
+
+USER_ID = "benchuser"
+DEVICE_ID = "0d1841b0976bae2a3a310dd74c0f3df354899bc8"
+DEVICE_NAME = "Bench Speaker"
+# Connect devices listed, the first one is DEVICE_NAME
+DEVICE_COUNT = 16
+SEARCH_TOTAL = 200
+PLAYLIST_TOTAL = 120
+SHOW_EPISODES = 10
+CATEGORY_PLAYLISTS = 20
+
+
+def spotify_id(kind: str, number: int) -> str:
+    """Deterministic 22 character base62 id"""
+    return f"{kind[:2]}{number:020d}"
+
+
+def item(kind: str, number: int) -> dict:
+    item_id = spotify_id(kind, number)
+    return {
+        "id": item_id,
+        "uri": f"spotify:{kind}:{item_id}",
+        "name": f"Bench {kind} {number}",
+        "type": kind,
+        "artists": [{"name": "Bench Artist"}],
+        "owner": {"display_name": USER_ID},
+        "external_urls": {"spotify": f"spotify:{kind}:{item_id}"},
+        "resume_point": {"fully_played": number % 3 == 0},
+    }
+
+
+def device_name(number: int) -> str:
+    """Name of Connect device `number`, the numbers wrap around"""
+    number %= DEVICE_COUNT
+    return DEVICE_NAME if number == 0 else f"{DEVICE_NAME} {number}"
+
+
+def device(number: int) -> dict:
+    return {
+        "id": DEVICE_ID if number == 0 else f"{number:040x}",
+        "name": device_name(number),
+        "type": "Speaker",
+        "is_active": False,
+        "volume_percent": 50,
+    }
+
+
+def page(request: web.Request, kind: str, total: int) -> dict:
+    limit = int(request.query.get("limit", 20))
+    offset = int(request.query.get("offset", 0))
+    end = min(total, offset + limit)
+    return {
+        "items": [item(kind, x) for x in range(offset, end)],
+        "total": total,
+        "limit": limit,
+        "offset": offset,
+        "next": str(request.url) if end < total else None,
+    }
+
+
+class StubSpotify:
+    """aiohttp application answering like the Spotify Web API"""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        throttle_rate: float = 0.0,
+        retry_after: float = 0.1,
+        seed: int = 0,
+    ) -> None:
+        self.latency = latency
+        self.throttle_rate = throttle_rate
+        self.retry_after = retry_after
+        self.calls = Counter()
+        self.throttled = Counter()
+        self._random = random.Random(seed)
+        self._runner = None
+        self.url = None
+
+        self.routes = [
+            ("GET", r"get_access_token", self.access_token),
+            ("POST", r"device-auth/v1/refresh", self.device_auth),
+            ("GET", r"v1/me", self.me),
+            ("GET", r"v1/me/player/devices", self.devices),
+            ("GET", r"v1/me/player", self.player),
+            ("PUT", r"v1/me/player", self.no_content),
+            ("PUT", r"v1/me/player/(play|volume|shuffle|repeat)", self.no_content),
+            ("POST", r"v1/me/player/queue", self.no_content),
+            ("GET", r"v1/search", self.search),
+            ("GET", r"v1/playlists/\w+/(tracks|items)", self.playlist_tracks),
+            ("GET", r"v1/albums/\w+/tracks", self.playlist_tracks),
+            ("GET", r"v1/shows/\w+/episodes", self.show_episodes),
+            ("GET", r"v1/browse/categories/\w+/playlists", self.category),
+            ("GET", r"v1/artists/\w+/top-tracks", self.top_tracks),
+            ("GET", r"v1/(me|users/\w+)/playlists", self.user_playlists),
+        ]
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> str:
+        app = web.Application(middlewares=[self._middleware])
+        app.router.add_route("*", "/{path:.*}", self._dispatch)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, host, port)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        self.url = f"http://{host}:{port}"
+        return self.url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    @web.middleware
+    async def _middleware(self, request: web.Request, handler):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        path = request.path.strip("/")
+
+        if path not in ("get_access_token", "device-auth/v1/refresh") and (
+            self._random.random() < self.throttle_rate
+        ):
+            self.throttled[path] += 1
+            return web.json_response(
+                {"error": {"status": 429, "message": "API rate limit exceeded"}},
+                status=429,
+                headers={"Retry-After": str(self.retry_after)},
+            )
+
+        return await handler(request)
+
+    async def _dispatch(self, request: web.Request) -> web.StreamResponse:
+        path = request.path.strip("/")
+
+        for method, pattern, handler in self.routes:
+            if request.method == method and re.fullmatch(pattern, path):
+                self.calls[f"{method} {pattern}"] += 1
+                return await handler(request)
+
+        return web.json_response(
+            {"error": {"status": 404, "message": f"no stub for {path}"}},
+            status=404,
+        )
+
+    async def access_token(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "accessToken": "bench-token",
+                "accessTokenExpirationTimestampMs": int(
+                    (time.time() + 3600) * 1000
+                ),
+            }
+        )
+
+    async def device_auth(self, request: web.Request) -> web.Response:
+        return web.json_response({"accessToken": "bench-device-token"})
+
+    async def me(self, request: web.Request) -> web.Response:
+        return web.json_response({"id": USER_ID, "country": "SE"})
+
+    async def devices(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {"devices": [device(number) for number in range(DEVICE_COUNT)]}
+        )
+
+    async def player(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                "device": {"id": DEVICE_ID, "name": DEVICE_NAME},
+                "is_playing": True,
+                "progress_ms": 1000,
+                "item": item("track", 0),
+            }
+        )
+
+    async def no_content(self, request: web.Request) -> web.Response:
+        return web.Response(status=204)
+
+    async def search(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {
+                f"{kind}s": page(request, kind, SEARCH_TOTAL)
+                for kind in request.query.get("type", "track").split(",")
+            }
+        )
+
+    async def playlist_tracks(self, request: web.Request) -> web.Response:
+        result = page(request, "track", PLAYLIST_TOTAL)
+        result["items"] = [{"track": x} for x in result["items"]]
+        return web.json_response(result)
+
+    async def show_episodes(self, request: web.Request) -> web.Response:
+        return web.json_response(page(request, "episode", SHOW_EPISODES))
+
+    async def category(self, request: web.Request) -> web.Response:
+        return web.json_response(
+            {"playlists": page(request, "playlist", CATEGORY_PLAYLISTS)}
+        )
+
+    async def top_tracks(self, request: web.Request) -> web.Response:
+        return web.json_response({"tracks": [item("track", x) for x in range(10)]})
+
+    async def user_playlists(self, request: web.Request) -> web.Response:
+        return web.json_response(page(request, "playlist", CATEGORY_PLAYLISTS))
@@ -4,20 +4,44 @@ from __future__ import annotations
 
 __version__ = "3.8.0"
 
+import asyncio
 import collections
+import json
 import logging
 import time
+import uuid
+from functools import wraps
 
 import homeassistant.core as ha_core
+import voluptuous as vol
 from homeassistant.components import websocket_api
 from homeassistant.const import CONF_ENTITY_ID, CONF_OFFSET, CONF_REPEAT
+from homeassistant.const import (
+    EVENT_HOMEASSISTANT_STARTED,
+    EVENT_HOMEASSISTANT_STOP,
+)
 from homeassistant.core import callback
+from homeassistant.helpers.event import async_track_time_interval
 
 from .const import (
     CONF_ACCOUNTS,
+    CONF_API_WORKERS,
+    CONF_CAST_WORKERS,
+    CONF_CIRCUIT_BREAKER,
+    CONF_COOLDOWN,
     CONF_DEVICE_NAME,
+    CONF_DEVICES,
+    CONF_ENABLED,
+    CONF_FAILURE_THRESHOLD,
     CONF_FORCE_PLAYBACK,
+    CONF_HANDLE,
     CONF_IGNORE_FULLY_PLAYED,
+    CONF_KEEP_WARM,
+    CONF_LIBRARY_MIRROR,
+    CONF_MAX_CONCURRENT,
+    CONF_MAX_INTERVAL,
+    CONF_MIN_INTERVAL,
+    CONF_PROBE,
     CONF_RANDOM,
     CONF_SHUFFLE,
     CONF_SP_DC,
@@ -37,40 +61,94 @@ from .const import (
     CONF_SPOTIFY_TRACK_NAME,
     CONF_SPOTIFY_URI,
     CONF_START_VOL,
+    CONF_START_WINDOW,
+    CONF_THRESHOLD,
+    CONF_TRACE,
+    CONF_TRACE_BACKUP_COUNT,
+    CONF_TRACE_MAX_BYTES,
+    CONF_TTL,
+    CONF_WATCHDOG,
     DOMAIN,
+    EVENT_PREPARED,
+    EVENT_START_MULTIPLE,
+    LIBRARY_SYNC_INTERVAL,
     SCHEMA_PLAYLISTS,
     SCHEMA_WS_ACCOUNTS,
+    SCHEMA_WS_BATCH,
     SCHEMA_WS_CASTDEVICES,
     SCHEMA_WS_DEVICES,
+    SCHEMA_WS_DIAGNOSTICS,
+    SCHEMA_WS_METRICS,
     SCHEMA_WS_PLAYER,
+    SCHEMA_WS_PLAYER_SUBSCRIBE,
+    SERVICE_PREPARE_COMMAND_SCHEMA,
     SERVICE_START_COMMAND_SCHEMA,
+    SERVICE_START_MULTIPLE_COMMAND_SCHEMA,
     SPOTCAST_CONFIG_SCHEMA,
+    STORAGE_DIR,
+    TRACE_FILE,
     WS_TYPE_SPOTCAST_ACCOUNTS,
+    WS_TYPE_SPOTCAST_BATCH,
     WS_TYPE_SPOTCAST_CASTDEVICES,
     WS_TYPE_SPOTCAST_DEVICES,
+    WS_TYPE_SPOTCAST_DIAGNOSTICS,
+    WS_TYPE_SPOTCAST_METRICS,
     WS_TYPE_SPOTCAST_PLAYER,
+    WS_TYPE_SPOTCAST_PLAYER_SUBSCRIBE,
     WS_TYPE_SPOTCAST_PLAYLISTS,
 )
+from .breaker import CircuitBreakers
+from .coordinator import StartCoordinator, raise_if_superseded, start_scope
+from .error import StartSuperseded
+from .executor import LANE_API, LANE_CAST, SpotcastExecutor
 from .helpers import (
+    QUEUE_LIMIT,
     add_tracks_to_queue,
     async_wrap,
-    get_cast_devices,
+    get_diagnostics,
     get_random_playlist_from_category,
-    get_search_results,
     get_spotify_devices,
     get_spotify_install_status,
     get_spotify_media_player,
     is_empty_str,
     is_valid_uri,
+    iter_search_results,
+    search_yields_tracks,
+)
+from .keepwarm import KeepWarm
+from .metrics import (
+    STAGE_PLAY,
+    STAGE_POST_PLAY,
+    STAGE_QUEUE,
+    STAGE_RESOLVE,
+    STAGE_SEARCH,
+    STAGE_TOKEN,
+    STAGE_TOTAL,
 )
+from .poller import PlayerPollers
+from .prepare import PreparedStarts, SharedResults, StartContent, StartPlan
+from .prober import CastProber
+from .ratelimit import PRIORITY_BACKGROUND
+from .registry import CastDeviceRegistry, SpotifyPlayerRegistry
+from .singleflight import SingleFlight
 from .spotcast_controller import SpotcastController
+from .tracing import Tracer
+from .updates import (
+    PLAYLIST_LIMIT,
+    USER_PLAYLIST_TYPES,
+    SpotcastData,
+    slice_playlists,
+)
+from .watchdog import LoopWatchdog
 
 CONFIG_SCHEMA = SPOTCAST_CONFIG_SCHEMA
 
 _LOGGER = logging.getLogger(__name__)
 
 
-def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
+async def async_setup(
+    hass: ha_core.HomeAssistant, config: collections.OrderedDict
+) -> bool:
     """setup method for integration with Home Assistant
 
     Args:
@@ -99,35 +177,201 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
     sp_key = conf[CONF_SP_KEY]
     accounts = conf.get(CONF_ACCOUNTS)
 
-    spotcast_controller = SpotcastController(hass, sp_dc, sp_key, accounts)
+    breaker_conf = conf[CONF_CIRCUIT_BREAKER]
+    breakers = CircuitBreakers(
+        breaker_conf[CONF_FAILURE_THRESHOLD], breaker_conf[CONF_COOLDOWN]
+    )
+
+    probe_conf = conf[CONF_PROBE]
+    prober = None
+    if probe_conf[CONF_ENABLED]:
+        prober = CastProber(
+            hass,
+            probe_conf[CONF_MIN_INTERVAL],
+            probe_conf[CONF_MAX_INTERVAL],
+            probe_conf[CONF_MAX_CONCURRENT],
+        )
+
+    spotcast_controller = SpotcastController(
+        hass, sp_dc, sp_key, accounts, breakers, prober
+    )
 
     if DOMAIN not in hass.data:
         hass.data[DOMAIN] = {}
     hass.data[DOMAIN]["controller"] = spotcast_controller
 
+    watchdog_conf = conf.get(CONF_WATCHDOG)
+    if watchdog_conf is not None:
+        watchdog = LoopWatchdog(hass, watchdog_conf[CONF_THRESHOLD])
+        hass.data[DOMAIN]["watchdog"] = watchdog
+        watchdog.async_start()
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, watchdog.async_stop)
+
+    if prober is not None:
+        hass.data[DOMAIN]["prober"] = prober
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STARTED, prober.async_start)
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, prober.async_stop)
+
+    # fetch the tokens of all accounts once Home Assistant started, so
+    # the warm-up does not hold up the startup of the core
+    hass.bus.async_listen_once(
+        EVENT_HOMEASSISTANT_STARTED, spotcast_controller.async_warm_tokens
+    )
+
+    spotcast_executor = SpotcastExecutor(
+        conf[CONF_CAST_WORKERS], conf[CONF_API_WORKERS]
+    )
+    hass.data[DOMAIN]["executor"] = spotcast_executor
+
+    spotcast_data = SpotcastData(hass, spotcast_controller, spotcast_executor)
+    hass.data[DOMAIN]["data"] = spotcast_data
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, spotcast_executor.shutdown)
+
+    cast_registry = CastDeviceRegistry(hass)
+    hass.data[DOMAIN]["cast_registry"] = cast_registry
+    cast_registry.async_setup()
+
+    spotify_registry = SpotifyPlayerRegistry(hass)
+    hass.data[DOMAIN]["spotify_registry"] = spotify_registry
+    spotify_registry.async_setup()
+
+    library_mirror = conf[CONF_LIBRARY_MIRROR]
+
+    async def async_sync_libraries(*_):
+        await spotcast_executor.run(LANE_API, spotcast_controller.sync_libraries)
+
+    if library_mirror:
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STARTED, async_sync_libraries)
+        async_track_time_interval(hass, async_sync_libraries, LIBRARY_SYNC_INTERVAL)
+
+    keep_warm = None
+    if conf[CONF_KEEP_WARM]:
+        keep_warm = KeepWarm(
+            hass, spotcast_controller, spotcast_executor, conf[CONF_KEEP_WARM]
+        )
+        hass.data[DOMAIN]["keep_warm"] = keep_warm
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STARTED, keep_warm.async_start)
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, keep_warm.async_stop)
+
+    metrics = spotcast_controller.metrics
+
+    trace_conf = conf.get(CONF_TRACE)
+    if trace_conf is not None:
+        # creates the storage directory and the writer thread of the file
+        tracer = await hass.async_add_executor_job(
+            Tracer,
+            hass.config.path(STORAGE_DIR, TRACE_FILE),
+            trace_conf[CONF_TRACE_MAX_BYTES],
+            trace_conf[CONF_TRACE_BACKUP_COUNT],
+        )
+    else:
+        tracer = Tracer()
+    hass.data[DOMAIN]["tracer"] = tracer
+    hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, tracer.shutdown)
+
+    def traced(func):
+        """Trace a websocket job as the root span of the command"""
+
+        @wraps(func)
+        def run(msg: dict):
+            with tracer.trace(msg["type"], account=msg.get("account")):
+                return func(msg)
+
+        return run
+
+    coalescer = SingleFlight()
+    hass.data[DOMAIN]["coalescer"] = coalescer
+
+    coordinator = StartCoordinator(conf[CONF_START_WINDOW])
+    hass.data[DOMAIN]["coordinator"] = coordinator
+
+    prepared = PreparedStarts()
+    hass.data[DOMAIN]["prepared"] = prepared
+
+    async def async_coalesced(msg: dict, job):
+        """Result of job(msg). Concurrent messages with the same type and
+        parameters share one computation"""
+        key = tuple(sorted((k, v) for k, v in msg.items() if k != "id"))
+        return await coalescer.run(key, lambda: job(msg), group=msg["type"])
+
+    async def async_send_coalesced(connection, msg: dict, job) -> None:
+        """Answer msg with the result of job(msg)"""
+        await async_send_query(
+            connection, msg, lambda msg: async_coalesced(msg, job)
+        )
+
+    async def async_send_query(connection, msg: dict, query) -> None:
+        """Answer msg with the result of await query(msg)"""
+        try:
+            resp = await query(msg)
+        except Exception as exc:  # pylint: disable=broad-except
+            _LOGGER.error("%s failed: %s", msg["type"], exc)
+            connection.send_message(
+                websocket_api.error_message(msg["id"], "spotcast_error", str(exc))
+            )
+            return
+
+        connection.send_message(websocket_api.result_message(msg["id"], resp))
+
+    @async_wrap(executor=spotcast_executor.api)
+    @traced
+    def get_playlist(msg: dict):
+        """Handle to get playlist"""
+        playlist_type = msg.get("playlist_type")
+        country_code = msg.get("country_code")
+        locale = msg.get("locale", "en")
+        limit = msg.get("limit", 10)
+        account = msg.get("account", None)
+
+        _LOGGER.debug("websocket_handle_playlists msg: %s", msg)
+        return spotcast_controller.get_playlists(
+            account, playlist_type, country_code, locale, limit
+        )
+
+    @async_wrap(executor=spotcast_executor.api)
+    @traced
+    def get_devices(msg: dict):
+        """Handle to get devices. Only for default account"""
+        account = msg.get("account", None)
+        client = spotcast_controller.get_spotify_client(account, PRIORITY_BACKGROUND)
+        me_resp = client._get("me")  # pylint: disable=W0212
+        spotify_media_player = get_spotify_media_player(hass, me_resp["id"])
+        return get_spotify_devices(spotify_media_player)
+
+    def fetch_player(account: str | None):
+        client = spotcast_controller.get_spotify_client(account, PRIORITY_BACKGROUND)
+        return client._get("me/player")  # pylint: disable=W0212
+
+    @async_wrap(executor=spotcast_executor.api)
+    @traced
+    def get_player(msg: dict):
+        """Handle to get player"""
+        _LOGGER.debug("websocket_handle_player msg: %s", msg)
+        return fetch_player(msg.get("account", None))
+
+    pollers = PlayerPollers(
+        hass, async_wrap(fetch_player, executor=spotcast_executor.api)
+    )
+    hass.data[DOMAIN]["pollers"] = pollers
+
     @callback
     def websocket_handle_playlists(
             hass: ha_core.HomeAssistant,
             connection,
             msg: str
     ):
-        @async_wrap
-        def get_playlist():
-            """Handle to get playlist"""
-            playlist_type = msg.get("playlist_type")
-            country_code = msg.get("country_code")
-            locale = msg.get("locale", "en")
-            limit = msg.get("limit", 10)
-            account = msg.get("account", None)
-
-            _LOGGER.debug("websocket_handle_playlists msg: %s", msg)
-            resp = spotcast_controller.get_playlists(
-                account, playlist_type, country_code, locale, limit
-            )
-            connection.send_message(
-                websocket_api.result_message(msg["id"], resp))
+        hass.async_create_task(
+            async_send_query(connection, msg, async_get_playlists)
+        )
 
-        hass.async_create_task(get_playlist())
+    async def async_get_playlists(msg: dict):
+        # user playlists come from the coordinator shared with the sensor
+        limit = msg.get("limit", 10)
+        playlist_type = msg.get("playlist_type")
+        if playlist_type in USER_PLAYLIST_TYPES and limit <= PLAYLIST_LIMIT:
+            resp = await spotcast_data.playlists(msg.get("account")).async_get()
+            return slice_playlists(resp, limit)
+        return await async_coalesced(msg, get_playlist)
 
     @callback
     def websocket_handle_devices(
@@ -135,19 +379,14 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
             connection,
             msg: str,
     ):
-        @async_wrap
-        def get_devices():
-            """Handle to get devices. Only for default account"""
-            account = msg.get("account", None)
-            client = spotcast_controller.get_spotify_client(account)
-            me_resp = client._get("me")  # pylint: disable=W0212
-            spotify_media_player = get_spotify_media_player(
-                hass, me_resp["id"])
-            resp = get_spotify_devices(spotify_media_player)
-            connection.send_message(
-                websocket_api.result_message(msg["id"], resp))
+        hass.async_create_task(async_send_coalesced(connection, msg, get_devices))
 
-        hass.async_create_task(get_devices())
+    async def async_get_player(msg: dict):
+        # a subscription polling the account answers without a request
+        fresh, state = pollers.fresh_state(msg.get("account"))
+        if fresh:
+            return state
+        return await async_coalesced(msg, get_player)
 
     @callback
     def websocket_handle_player(
@@ -155,17 +394,54 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
             connection,
             msg: str,
     ):
-        @async_wrap
-        def get_player():
-            """Handle to get player"""
-            account = msg.get("account", None)
-            _LOGGER.debug("websocket_handle_player msg: %s", msg)
-            client = spotcast_controller.get_spotify_client(account)
-            resp = client._get("me/player")  # pylint: disable=W0212
+        fresh, state = pollers.fresh_state(msg.get("account"))
+        if fresh:
+            connection.send_message(websocket_api.result_message(msg["id"], state))
+            return
+        hass.async_create_task(async_send_coalesced(connection, msg, get_player))
+
+    @callback
+    def websocket_handle_player_subscribe(
+            hass: ha_core.HomeAssistant,
+            connection,
+            msg: str,
+    ):
+        """Handle to subscribe to the playback state of an account"""
+        account = msg.get("account")
+        if account is not None and account not in spotcast_controller.accounts:
             connection.send_message(
-                websocket_api.result_message(msg["id"], resp))
+                websocket_api.error_message(
+                    msg["id"], "unknown_account", f"Unknown account {account}"
+                )
+            )
+            return
 
-        hass.async_create_task(get_player())
+        @callback
+        def send(diff: dict) -> None:
+            connection.send_message(websocket_api.event_message(msg["id"], diff))
+
+        connection.send_message(websocket_api.result_message(msg["id"]))
+        connection.subscriptions[msg["id"]] = pollers.get(account).subscribe(send)
+
+    @callback
+    def websocket_handle_diagnostics(
+            hass: ha_core.HomeAssistant,
+            connection,
+            msg: str,
+    ):
+        """Handle to get spotcast runtime diagnostics"""
+        resp = get_diagnostics(hass)
+        connection.send_message(websocket_api.result_message(msg["id"], resp))
+
+    @callback
+    def websocket_handle_metrics(
+            hass: ha_core.HomeAssistant,
+            connection,
+            msg: str,
+    ):
+        """Handle to get the latency percentiles of spotcast.start stages"""
+        resp = metrics.summary()
+        connection.send_message(websocket_api.result_message(msg["id"], resp))
 
     @callback
     def websocket_handle_accounts(
@@ -175,9 +451,13 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
     ):
         """Handle to get accounts"""
         _LOGGER.debug("websocket_handle_accounts msg: %s", msg)
+        resp = get_accounts()
+        connection.send_message(websocket_api.result_message(msg["id"], resp))
+
+    def get_accounts() -> list:
         resp = list(accounts.keys()) if accounts is not None else []
         resp.append("default")
-        connection.send_message(websocket_api.result_message(msg["id"], resp))
+        return resp
 
     @callback
     def websocket_handle_castdevices(
@@ -186,45 +466,138 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
     ):
         """Handle to get cast devices for debug purposes"""
         _LOGGER.debug("websocket_handle_castdevices msg: %s", msg)
+        hass.async_create_task(
+            async_send_query(connection, msg, async_get_castdevices)
+        )
 
-        known_devices = get_cast_devices(hass)
-        _LOGGER.debug("%s", known_devices)
-        resp = [
+    async def async_get_castdevices(msg: dict) -> list:
+        devices = await spotcast_data.cast_devices.async_get()
+        return [
             {
-                "uuid": str(cast_info.cast_info.uuid),
-                "model_name": cast_info.cast_info.model_name,
-                "friendly_name": cast_info.cast_info.friendly_name,
+                "uuid": device["uuid"],
+                "model_name": device["model_name"],
+                "friendly_name": device["name"],
             }
-            for cast_info in known_devices
+            for device in devices
         ]
 
+    async def async_immediate(result):
+        return result
+
+    # commands a spotcast/batch message can run, with their schema
+    batch_queries = {
+        WS_TYPE_SPOTCAST_PLAYLISTS: (
+            SCHEMA_PLAYLISTS,
+            async_get_playlists,
+        ),
+        WS_TYPE_SPOTCAST_DEVICES: (
+            SCHEMA_WS_DEVICES,
+            lambda msg: async_coalesced(msg, get_devices),
+        ),
+        WS_TYPE_SPOTCAST_PLAYER: (SCHEMA_WS_PLAYER, async_get_player),
+        WS_TYPE_SPOTCAST_ACCOUNTS: (
+            SCHEMA_WS_ACCOUNTS,
+            lambda msg: async_immediate(get_accounts()),
+        ),
+        WS_TYPE_SPOTCAST_CASTDEVICES: (SCHEMA_WS_CASTDEVICES, async_get_castdevices),
+        WS_TYPE_SPOTCAST_DIAGNOSTICS: (
+            SCHEMA_WS_DIAGNOSTICS,
+            lambda msg: async_immediate(get_diagnostics(hass)),
+        ),
+        WS_TYPE_SPOTCAST_METRICS: (
+            SCHEMA_WS_METRICS,
+            lambda msg: async_immediate(metrics.summary()),
+        ),
+    }
+
+    async def async_batch_query(msg_id: int, request: dict) -> dict:
+        """Run one request of a batch, reporting its error instead of
+        raising it"""
+        if request["type"] not in batch_queries:
+            return {
+                "success": False,
+                "error": {
+                    "code": "unknown_command",
+                    "message": f"{request['type']} cannot be batched",
+                },
+            }
+
+        schema, query = batch_queries[request["type"]]
+        try:
+            msg = schema({**request, "id": msg_id})
+        except vol.Invalid as exc:
+            return {
+                "success": False,
+                "error": {"code": "invalid_format", "message": str(exc)},
+            }
+
+        try:
+            result = await query(msg)
+        except Exception as exc:  # pylint: disable=broad-except
+            _LOGGER.error("%s failed: %s", msg["type"], exc)
+            return {
+                "success": False,
+                "error": {"code": "spotcast_error", "message": str(exc)},
+            }
+        return {"success": True, "result": result}
+
+    async def async_send_batch(connection, msg: dict) -> None:
+        """Answer msg with the results of all its requests, run
+        concurrently, in the order of the requests"""
+        results = await asyncio.gather(
+            *(async_batch_query(msg["id"], request) for request in msg["requests"])
+        )
+        resp = [
+            {"type": request["type"], **result}
+            for request, result in zip(msg["requests"], results)
+        ]
         connection.send_message(websocket_api.result_message(msg["id"], resp))
 
-    def start_casting(call: ha_core.ServiceCall):
-        """service called."""
-        uri = call.data.get(CONF_SPOTIFY_URI)
-        category = call.data.get(CONF_SPOTIFY_CATEGORY)
-        country = call.data.get(CONF_SPOTIFY_COUNTRY)
-        limit = call.data.get(CONF_SPOTIFY_LIMIT)
-        artistName = call.data.get(CONF_SPOTIFY_ARTIST_NAME)
-        albumName = call.data.get(CONF_SPOTIFY_ALBUM_NAME)
-        playlistName = call.data.get(CONF_SPOTIFY_PLAYLIST_NAME)
-        trackName = call.data.get(CONF_SPOTIFY_TRACK_NAME)
-        showName = call.data.get(CONF_SPOTIFY_SHOW_NAME)
-        episodeName = call.data.get(CONF_SPOTIFY_EPISODE_NAME)
-        audiobookName = call.data.get(CONF_SPOTIFY_AUDIOBOOK_NAME)
-        genreName = call.data.get(CONF_SPOTIFY_GENRE_NAME)
-        random_song = call.data.get(CONF_RANDOM, False)
-        repeat = call.data.get(CONF_REPEAT, False)
-        shuffle = call.data.get(CONF_SHUFFLE, False)
-        start_volume = call.data.get(CONF_START_VOL)
-        spotify_device_id = call.data.get(CONF_SPOTIFY_DEVICE_ID)
-        position = call.data.get(CONF_OFFSET)
-        force_playback = call.data.get(CONF_FORCE_PLAYBACK)
-        account = call.data.get(CONF_SPOTIFY_ACCOUNT)
-        ignore_fully_played = call.data.get(CONF_IGNORE_FULLY_PLAYED)
-        device_name = call.data.get(CONF_DEVICE_NAME)
-        entity_id = call.data.get(CONF_ENTITY_ID)
+    @callback
+    def websocket_handle_batch(
+            hass: ha_core.HomeAssistant,
+            connection,
+            msg: str,
+    ):
+        """Handle to run several requests in one message"""
+        _LOGGER.debug("websocket_handle_batch msg: %s", msg)
+        hass.async_create_task(async_send_batch(connection, msg))
+
+    def is_transfer(data: dict) -> bool:
+        """Whether a start has nothing to play and transfers the current
+        playback instead"""
+        return is_empty_str(data.get(CONF_SPOTIFY_URI)) and all(
+            is_empty_str(data.get(key))
+            for key in (
+                CONF_SPOTIFY_ARTIST_NAME,
+                CONF_SPOTIFY_PLAYLIST_NAME,
+                CONF_SPOTIFY_TRACK_NAME,
+                CONF_SPOTIFY_SHOW_NAME,
+                CONF_SPOTIFY_EPISODE_NAME,
+                CONF_SPOTIFY_AUDIOBOOK_NAME,
+                CONF_SPOTIFY_GENRE_NAME,
+            )
+        )
+
+    def resolve_content(data: dict, client) -> StartContent | None:
+        """Resolve what a start plays: the category, the search and the
+        random position. None if there is nothing to play"""
+        uri = data.get(CONF_SPOTIFY_URI)
+        category = data.get(CONF_SPOTIFY_CATEGORY)
+        country = data.get(CONF_SPOTIFY_COUNTRY)
+        limit = data.get(CONF_SPOTIFY_LIMIT)
+        artistName = data.get(CONF_SPOTIFY_ARTIST_NAME)
+        albumName = data.get(CONF_SPOTIFY_ALBUM_NAME)
+        playlistName = data.get(CONF_SPOTIFY_PLAYLIST_NAME)
+        trackName = data.get(CONF_SPOTIFY_TRACK_NAME)
+        showName = data.get(CONF_SPOTIFY_SHOW_NAME)
+        episodeName = data.get(CONF_SPOTIFY_EPISODE_NAME)
+        audiobookName = data.get(CONF_SPOTIFY_AUDIOBOOK_NAME)
+        genreName = data.get(CONF_SPOTIFY_GENRE_NAME)
+        random_song = data.get(CONF_RANDOM, False)
+        position = data.get(CONF_OFFSET)
+        account = data.get(CONF_SPOTIFY_ACCOUNT)
+        ignore_fully_played = data.get(CONF_IGNORE_FULLY_PLAYED)
 
         # if no market information try to get global setting
         if is_empty_str(country):
@@ -233,8 +606,6 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
             except KeyError:
                 country = None
 
-        client = spotcast_controller.get_spotify_client(account)
-
         # verify the uri provided and clean-up if required
         if not is_empty_str(uri):
 
@@ -243,7 +614,7 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
 
             if not is_valid_uri(uri):
                 _LOGGER.error("Invalid URI provided, aborting casting")
-                return
+                return None
 
             # force first two elements of uri to lowercase
             uri = uri.split(":")
@@ -251,104 +622,234 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
             uri[1] = uri[1].lower()
             uri = ":".join(uri)
 
+        searchResults = iter(())
+        if not is_empty_str(category):
+            with metrics.stage(STAGE_SEARCH):
+                uri = get_random_playlist_from_category(
+                    client, category, country, limit)
+
+            if uri is None:
+                _LOGGER.error("No playlist returned. Stop service call")
+                return None
+        elif is_empty_str(uri):
+            # get uri from search request, later pages are only
+            # fetched once the queue needs them, and never past what
+            # it can hold
+            searchResults = iter_search_results(
+                spotify_client=client,
+                limit=min(limit, QUEUE_LIMIT + 1),
+                artistName=artistName,
+                country=country,
+                albumName=albumName,
+                playlistName=playlistName,
+                trackName=trackName,
+                showName=showName,
+                episodeName=episodeName,
+                audiobookName=audiobookName,
+                genreName=genreName,
+                library=(
+                    spotcast_controller.get_library(account)
+                    if library_mirror
+                    else None
+                ),
+            )
+            # play the first track
+            with metrics.stage(STAGE_SEARCH):
+                firstResult = next(searchResults, None)
+            if firstResult is not None:
+                uri = firstResult["uri"]
+
+            # the queue would page through the whole search for tracks
+            # that cannot be there
+            if not search_yields_tracks(
+                artistName=artistName,
+                albumName=albumName,
+                trackName=trackName,
+                playlistName=playlistName,
+                showName=showName,
+                episodeName=episodeName,
+                audiobookName=audiobookName,
+                genreName=genreName,
+            ):
+                searchResults = iter(())
+
+        with metrics.stage(STAGE_RESOLVE):
+            playback = spotcast_controller.get_playback(
+                client, uri, random_song, position, ignore_fully_played
+            )
+        return StartContent(playback, searchResults)
+
+    def prepare_start(
+        data: dict, chromecast=None, content: StartContent | None = None
+    ) -> StartPlan | None:
+        """Resolve everything a start needs up to the playback itself,
+        over the connection `chromecast` when given. Plays `content`
+        when it was resolved already. None if there is nothing to start"""
+        spotify_device_id = data.get(CONF_SPOTIFY_DEVICE_ID)
+        force_playback = data.get(CONF_FORCE_PLAYBACK)
+        account = data.get(CONF_SPOTIFY_ACCOUNT)
+        device_name = data.get(CONF_DEVICE_NAME)
+        entity_id = data.get(CONF_ENTITY_ID)
+
+        with metrics.stage(STAGE_TOKEN):
+            client = spotcast_controller.get_spotify_client(account)
+
+        transfer = is_transfer(data)
+        if content is None and not transfer:
+            content = resolve_content(data, client)
+            if content is None:
+                return None
+
+        # a speaker kept warm already has its Connect device
+        warm = False
+        if not spotify_device_id and keep_warm is not None:
+            spotify_device_id = keep_warm.get_device_id(
+                account, device_name, entity_id
+            )
+            warm = spotify_device_id is not None
+
         # first, rely on spotify id given in config otherwise get one
         if not spotify_device_id:
             spotify_device_id = spotcast_controller.get_spotify_device_id(
-                account, spotify_device_id, device_name, entity_id
+                account, spotify_device_id, device_name, entity_id, chromecast
             )
 
-        if (
-            is_empty_str(uri)
-            and len(
-                list(
-                    filter(
-                        lambda x: not is_empty_str(x),
-                        [
-                            artistName,
-                            playlistName,
-                            trackName,
-                            showName,
-                            episodeName,
-                            audiobookName,
-                            genreName,
-                        ],
-                    )
-                )
-            )
-            == 0
-        ):
+        if transfer:
             _LOGGER.debug("Transfering playback")
-            current_playback = client.current_playback()
+            with metrics.stage(STAGE_RESOLVE):
+                current_playback = client.current_playback()
             if current_playback is not None:
                 _LOGGER.debug("Current_playback from spotify: %s",
                               current_playback)
                 force_playback = True
-            _LOGGER.debug("Force playback: %s", force_playback)
-            client.transfer_playback(
-                device_id=spotify_device_id, force_play=force_playback
-            )
-        elif not is_empty_str(category):
-            uri = get_random_playlist_from_category(
-                client, category, country, limit)
-
-            if uri is None:
-                _LOGGER.error("No playlist returned. Stop service call")
-                return None
-
-            spotcast_controller.play(
+            return StartPlan(
+                data,
                 client,
                 spotify_device_id,
-                uri,
-                random_song,
-                position,
-                ignore_fully_played,
+                transfer=True,
+                force_playback=force_playback,
+                warm=warm,
             )
-        else:
-            searchResults = []
-            if is_empty_str(uri):
-                # get uri from search request
-                searchResults = get_search_results(
-                    spotify_client=client,
-                    limit=limit,
-                    artistName=artistName,
-                    country=country,
-                    albumName=albumName,
-                    playlistName=playlistName,
-                    trackName=trackName,
-                    showName=showName,
-                    episodeName=episodeName,
-                    audiobookName=audiobookName,
-                    genreName=genreName,
+
+        return StartPlan(
+            data,
+            client,
+            spotify_device_id,
+            content.playback,
+            queue=iter(content.queue),
+            warm=warm,
+        )
+
+    def start_playback(plan: StartPlan) -> None:
+        """Issue the playback of a resolved start"""
+        with metrics.stage(STAGE_PLAY):
+            if plan.transfer:
+                _LOGGER.debug("Force playback: %s", plan.force_playback)
+                plan.client.transfer_playback(
+                    device_id=plan.device_id, force_play=plan.force_playback
+                )
+            elif plan.playback is not None:
+                _LOGGER.debug(
+                    "Playing %s on device-id: %s", plan.playback, plan.device_id
+                )
+                plan.client.start_playback(
+                    device_id=plan.device_id, **plan.playback
                 )
-                # play the first track
-                if len(searchResults) > 0:
-                    uri = searchResults[0]["uri"]
 
-            spotcast_controller.play(
-                client,
-                spotify_device_id,
-                uri,
-                random_song,
-                position,
-                ignore_fully_played,
-            )
+    def finish_start(plan: StartPlan) -> None:
+        """Queue the remaining search results and apply the volume,
+        shuffle and repeat settings once the playback started"""
+        client = plan.client
+        spotify_device_id = plan.device_id
+        repeat = plan.data.get(CONF_REPEAT, False)
+        shuffle = plan.data.get(CONF_SHUFFLE, False)
+        start_volume = plan.data.get(CONF_START_VOL)
+
+        with metrics.stage(STAGE_QUEUE):
+            add_tracks_to_queue(client, plan.queue)
+
+        # a newer start of the device stops this one around every sleep
+        with metrics.stage(STAGE_POST_PLAY):
+            if start_volume <= 100:
+                _LOGGER.debug("Setting volume to %d", start_volume)
+                raise_if_superseded()
+                time.sleep(2)
+                raise_if_superseded()
+                client.volume(volume_percent=start_volume,
+                              device_id=spotify_device_id)
+            if shuffle:
+                _LOGGER.debug("Turning shuffle on")
+                raise_if_superseded()
+                time.sleep(3)
+                raise_if_superseded()
+                client.shuffle(state=shuffle, device_id=spotify_device_id)
+            if repeat:
+                _LOGGER.debug("Turning repeat on")
+                raise_if_superseded()
+                time.sleep(3)
+                raise_if_superseded()
+                client.repeat(state=repeat, device_id=spotify_device_id)
+
+    def start_casting(
+        data: dict,
+        plan: StartPlan | None = None,
+        chromecast=None,
+        content: StartContent | None = None,
+    ):
+        """service called. Uses the plan of a prepared start when given"""
+        from spotipy import SpotifyException
 
-            if len(searchResults) > 1:
-                add_tracks_to_queue(client, searchResults[1:])
-
-        if start_volume <= 100:
-            _LOGGER.debug("Setting volume to %d", start_volume)
-            time.sleep(2)
-            client.volume(volume_percent=start_volume,
-                          device_id=spotify_device_id)
-        if shuffle:
-            _LOGGER.debug("Turning shuffle on")
-            time.sleep(3)
-            client.shuffle(state=shuffle, device_id=spotify_device_id)
-        if repeat:
-            _LOGGER.debug("Turning repeat on")
-            time.sleep(3)
-            client.repeat(state=repeat, device_id=spotify_device_id)
+        if plan is not None:
+            try:
+                start_playback(plan)
+            except SpotifyException as exc:
+                if exc.http_status != 404:
+                    raise
+                # the prepared device went away, resolve the start again
+                _LOGGER.warning(
+                    "Device of the prepared start is gone, starting again"
+                )
+                forget_warm_device(plan)
+                data = plan.data
+                plan = None
+
+        if plan is None:
+            plan = prepare_start(data, chromecast, content)
+            if plan is None:
+                return
+            try:
+                start_playback(plan)
+            except SpotifyException as exc:
+                if exc.http_status != 404 or not plan.warm:
+                    raise
+                # the speaker went cold since its last keep-warm check,
+                # launch Spotify on it once more
+                _LOGGER.warning(
+                    "Warm device of %s is gone, launching Spotify again",
+                    get_start_device(plan.data),
+                )
+                forget_warm_device(plan)
+                plan.device_id = spotcast_controller.get_spotify_device_id(
+                    plan.data.get(CONF_SPOTIFY_ACCOUNT),
+                    None,
+                    plan.data.get(CONF_DEVICE_NAME),
+                    plan.data.get(CONF_ENTITY_ID),
+                    chromecast,
+                )
+                start_playback(plan)
+
+        finish_start(plan)
+
+    def forget_warm_device(plan: StartPlan) -> None:
+        """Stop using the keep-warm device a playback failed on"""
+        if not plan.warm or keep_warm is None:
+            return
+        keep_warm.invalidate(
+            plan.data.get(CONF_SPOTIFY_ACCOUNT),
+            plan.data.get(CONF_DEVICE_NAME),
+            plan.data.get(CONF_ENTITY_ID),
+        )
+        plan.warm = False
 
     # Register websocket and service
     websocket_api.async_register_command(
@@ -369,6 +870,12 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
         handler=websocket_handle_player,
         schema=SCHEMA_WS_PLAYER,
     )
+    websocket_api.async_register_command(
+        hass=hass,
+        command_or_handler=WS_TYPE_SPOTCAST_PLAYER_SUBSCRIBE,
+        handler=websocket_handle_player_subscribe,
+        schema=SCHEMA_WS_PLAYER_SUBSCRIBE,
+    )
 
     websocket_api.async_register_command(
         hass=hass,
@@ -384,11 +891,301 @@ def setup(hass: ha_core.HomeAssistant, config: collections.OrderedDict) -> bool:
         schema=SCHEMA_WS_CASTDEVICES,
     )
 
-    hass.services.register(
+    websocket_api.async_register_command(
+        hass=hass,
+        command_or_handler=WS_TYPE_SPOTCAST_DIAGNOSTICS,
+        handler=websocket_handle_diagnostics,
+        schema=SCHEMA_WS_DIAGNOSTICS,
+    )
+
+    websocket_api.async_register_command(
+        hass=hass,
+        command_or_handler=WS_TYPE_SPOTCAST_METRICS,
+        handler=websocket_handle_metrics,
+        schema=SCHEMA_WS_METRICS,
+    )
+
+    websocket_api.async_register_command(
+        hass=hass,
+        command_or_handler=WS_TYPE_SPOTCAST_BATCH,
+        handler=websocket_handle_batch,
+        schema=SCHEMA_WS_BATCH,
+    )
+
+    def get_start_device(data: dict) -> str:
+        return (
+            data.get(CONF_SPOTIFY_DEVICE_ID)
+            or data.get(CONF_ENTITY_ID)
+            or data.get(CONF_DEVICE_NAME)
+        )
+
+    def traced_start_casting(
+        data: dict,
+        start,
+        plan: StartPlan | None,
+        chromecast=None,
+        content: StartContent | None = None,
+    ):
+        with start_scope(start), tracer.trace(
+            "start",
+            account=data.get(CONF_SPOTIFY_ACCOUNT),
+            device=get_start_device(plan.data if plan is not None else data),
+            prepared=plan is not None,
+            direct=chromecast is not None,
+        ):
+            start_casting(data, plan, chromecast, content)
+
+    def traced_prepare_start(data: dict) -> StartPlan | None:
+        with tracer.trace(
+            "prepare",
+            account=data.get(CONF_SPOTIFY_ACCOUNT),
+            device=get_start_device(data),
+        ):
+            return prepare_start(data)
+
+    async def async_start(
+        data: dict, chromecast=None, content: StartContent | None = None
+    ) -> bool:
+        """Start playback on one device, over the connection `chromecast`
+        when given, playing `content` when it was resolved already.
+        Returns False when the start was dropped as a repeat or
+        superseded by a newer one"""
+        # a start by handle runs on the device of the prepared start
+        target = prepared.get_data(data.get(CONF_HANDLE)) or data
+        device = (target.get(CONF_SPOTIFY_ACCOUNT), get_start_device(target))
+        key = json.dumps(dict(data), sort_keys=True, default=str)
+
+        async def job(start):
+            # total includes the time spent waiting for a cast worker
+            with metrics.stage(STAGE_TOTAL):
+                plan = await prepared.take(data)
+                try:
+                    await spotcast_executor.run(
+                        LANE_CAST,
+                        traced_start_casting,
+                        data,
+                        start,
+                        plan,
+                        chromecast,
+                        content,
+                    )
+                except StartSuperseded:
+                    raise
+                except Exception:
+                    # the device of a warm speaker may be gone
+                    if keep_warm is not None:
+                        keep_warm.invalidate(
+                            target.get(CONF_SPOTIFY_ACCOUNT),
+                            target.get(CONF_DEVICE_NAME),
+                            target.get(CONF_ENTITY_ID),
+                        )
+                    raise
+            # subscribers see the new playback without waiting for the
+            # next poll
+            pollers.wake(target.get(CONF_SPOTIFY_ACCOUNT))
+            return True
+
+        return bool(await coordinator.run(device, key, job))
+
+    # lets the cast platform start without the service bus
+    hass.data[DOMAIN]["start"] = async_start
+
+    async def async_start_casting(call: ha_core.ServiceCall):
+        await async_start(call.data)
+
+    async def async_prepare(call: ha_core.ServiceCall):
+        """Resolve a start ahead of time. Its plan is kept for ttl
+        seconds, for a start with the same handle or parameters. The
+        launch takes its turn with the starts of the device"""
+        data = {
+            key: value
+            for key, value in call.data.items()
+            if key not in (CONF_HANDLE, CONF_TTL)
+        }
+        handle = call.data.get(CONF_HANDLE) or uuid.uuid4().hex
+        result = {
+            "handle": handle,
+            "device": get_start_device(data),
+            "account": data.get(CONF_SPOTIFY_ACCOUNT),
+        }
+        begin = time.monotonic()
+        device = (data.get(CONF_SPOTIFY_ACCOUNT), get_start_device(data))
+
+        async def job(_):
+            return await spotcast_executor.run(
+                LANE_CAST, traced_prepare_start, data
+            )
+
+        # a start taking this plan waits for it instead of superseding it
+        task = hass.async_create_task(
+            coordinator.run(device, ("prepare", handle), job, replace=False)
+        )
+        prepared.add(handle, data, task)
+
+        try:
+            plan = await asyncio.shield(task)
+        except Exception as exc:
+            prepared.discard(handle, task)
+            result["outcome"] = "error"
+            result["error"] = str(exc)
+            raise
+        else:
+            if plan is None:
+                prepared.discard(handle, task)
+                result["outcome"] = "error"
+            else:
+                prepared.keep(handle, task, call.data[CONF_TTL])
+                result["outcome"] = "ok"
+                result["ttl"] = call.data[CONF_TTL]
+        finally:
+            result["duration_ms"] = round((time.monotonic() - begin) * 1000, 1)
+            hass.bus.async_fire(EVENT_PREPARED, result)
+
+    async def async_start_one(
+        data: dict, content: StartContent | None = None
+    ) -> dict:
+        result = {
+            "device": get_start_device(data),
+            "account": data.get(CONF_SPOTIFY_ACCOUNT),
+        }
+        begin = time.monotonic()
+
+        try:
+            started = await async_start(data, content=content)
+            result["outcome"] = "ok" if started else "skipped"
+        except Exception as exc:  # pylint: disable=broad-except
+            _LOGGER.error("Start on %s failed: %s", result["device"], exc)
+            result["outcome"] = "error"
+            result["error"] = str(exc)
+
+        result["duration_ms"] = round((time.monotonic() - begin) * 1000, 1)
+        return result
+
+    def resolve_shared_content(data: dict) -> StartContent | None:
+        """Content of a start on several devices. Only the first search
+        result is fetched here, the pages after it are fetched once for
+        all devices as their queues get to them"""
+        with metrics.stage(STAGE_TOKEN):
+            client = spotcast_controller.get_spotify_client(
+                data.get(CONF_SPOTIFY_ACCOUNT)
+            )
+        content = resolve_content(data, client)
+        if content is not None:
+            content.queue = SharedResults(iter(content.queue))
+        return content
+
+    async def async_start_multiple(call: ha_core.ServiceCall):
+        """Start the same content on every target at once. The content
+        is resolved once, then each target goes through the start path
+        of its own device, so the launches run side by side in the cast
+        pool. A Spotify account plays on one device only, so the targets
+        after the first one of an account are rejected"""
+        shared = {
+            key: value
+            for key, value in call.data.items()
+            if key not in (CONF_ENTITY_ID, CONF_DEVICE_NAME, CONF_DEVICES)
+        }
+        targets = [
+            {CONF_ENTITY_ID: entity_id}
+            for entity_id in call.data.get(CONF_ENTITY_ID, [])
+        ]
+        targets += [
+            {CONF_DEVICE_NAME: name}
+            for name in call.data.get(CONF_DEVICE_NAME, [])
+        ]
+        targets += call.data.get(CONF_DEVICES, [])
+
+        begin = time.monotonic()
+        starts = []
+        rejected = []
+        by_account = {}
+        for target in targets:
+            data = {**shared, **target}
+            account = data.get(CONF_SPOTIFY_ACCOUNT) or "default"
+            if account not in by_account:
+                by_account[account] = data
+                starts.append(data)
+                continue
+
+            first = get_start_device(by_account[account])
+            _LOGGER.warning(
+                "Not starting on %s, account %s already starts on %s",
+                get_start_device(data),
+                account,
+                first,
+            )
+            rejected.append(
+                {
+                    "device": get_start_device(data),
+                    "account": data.get(CONF_SPOTIFY_ACCOUNT),
+                    "outcome": "rejected",
+                    "error": f"account {account} already starts on {first}",
+                    "duration_ms": 0.0,
+                }
+            )
+
+        content = None
+        error = None
+        if starts and not is_transfer(shared):
+            try:
+                content = await spotcast_executor.run(
+                    LANE_API, resolve_shared_content, starts[0]
+                )
+            except Exception as exc:  # pylint: disable=broad-except
+                _LOGGER.error("Could not resolve the start content: %s", exc)
+                error = str(exc)
+            else:
+                if content is None:
+                    error = "nothing to play"
+
+        if error is None:
+            results = await asyncio.gather(
+                *(async_start_one(data, content) for data in starts)
+            )
+        else:
+            results = [
+                {
+                    "device": get_start_device(data),
+                    "account": data.get(CONF_SPOTIFY_ACCOUNT),
+                    "outcome": "error",
+                    "error": error,
+                    "duration_ms": 0.0,
+                }
+                for data in starts
+            ]
+        results = [*results, *rejected]
+        duration_ms = round((time.monotonic() - begin) * 1000, 1)
+
+        _LOGGER.info(
+            "Started %d of %d devices in %.0f ms",
+            sum(result["outcome"] == "ok" for result in results),
+            len(results),
+            duration_ms,
+        )
+        hass.bus.async_fire(
+            EVENT_START_MULTIPLE,
+            {"duration_ms": duration_ms, "devices": results},
+        )
+
+    hass.services.async_register(
         domain=DOMAIN,
         service="start",
-        service_func=start_casting,
+        service_func=async_start_casting,
         schema=SERVICE_START_COMMAND_SCHEMA,
     )
 
+    hass.services.async_register(
+        domain=DOMAIN,
+        service="prepare",
+        service_func=async_prepare,
+        schema=SERVICE_PREPARE_COMMAND_SCHEMA,
+    )
+
+    hass.services.async_register(
+        domain=DOMAIN,
+        service="start_multiple",
+        service_func=async_start_multiple,
+        schema=SERVICE_START_MULTIPLE_COMMAND_SCHEMA,
+    )
+
     return True
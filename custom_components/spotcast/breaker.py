@@ -0,0 +1,198 @@
+"""Circuit breakers failing fast on speakers and endpoints that keep
+failing"""
+
+from __future__ import annotations
+
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator
+
+from .error import CircuitOpenError, StartSuperseded
+
+_LOGGER = logging.getLogger(__name__)
+
+FAILURE_THRESHOLD = 3
+COOLDOWN = 60.0
+
+STATE_CLOSED = "closed"
+STATE_OPEN = "open"
+STATE_HALF_OPEN = "half_open"
+
+# ids, numbers and other variable parts of a Web API path
+_PATH_PARAMETER = re.compile(r"^(?:[0-9A-Za-z]{22}|\d+|spotify:.*)$")
+
+
+def endpoint_name(url: str, prefix: str) -> str:
+    """Name of the endpoint of a Web API url, without its query and with
+    ids replaced, so every url of one endpoint shares a breaker"""
+    path = url.split("?")[0]
+    if path.startswith(prefix):
+        path = path[len(prefix):]
+
+    return "/".join(
+        "{id}" if _PATH_PARAMETER.match(part) else part
+        for part in path.strip("/").split("/")
+    )
+
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures and then fails every
+    call at once. After `cooldown` seconds a single call is let through
+    as a probe: its success closes the breaker, its failure opens it
+    again"""
+
+    def __init__(
+        self,
+        name: str,
+        threshold: int = FAILURE_THRESHOLD,
+        cooldown: float = COOLDOWN,
+        label: str | None = None,
+    ) -> None:
+        self.name = name
+        self.label = label or name
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.state = STATE_CLOSED
+        self.failures = 0
+        self.rejected = 0
+        self._opened = 0.0
+        self._probe_started = 0.0
+        self._lock = threading.Lock()
+
+    def check(self) -> None:
+        """Raise CircuitOpenError unless a call may go through"""
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return
+
+            now = time.monotonic()
+
+            # a probe that never reported back does not hold the breaker
+            if (
+                self.state == STATE_HALF_OPEN
+                and now - self._probe_started > self.cooldown
+            ):
+                self.state = STATE_OPEN
+
+            if self.state == STATE_OPEN and now - self._opened >= self.cooldown:
+                _LOGGER.debug("Probing %s", self.label)
+                self.state = STATE_HALF_OPEN
+                self._probe_started = now
+                return
+
+            self.rejected += 1
+            if self.state == STATE_HALF_OPEN:
+                retry = "a probe is checking it"
+            else:
+                retry_in = max(0.0, self._opened + self.cooldown - now)
+                retry = f"not trying again for {retry_in:.0f}s"
+
+        raise CircuitOpenError(
+            f"{self.label} failed {self.failures} times in a row, {retry}"
+        )
+
+    def record_success(self) -> None:
+        with self._lock:
+            if self.state != STATE_CLOSED:
+                _LOGGER.info("%s recovered", self.label)
+            self.state = STATE_CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+
+            if self.state == STATE_HALF_OPEN or self.failures >= self.threshold:
+                if self.state == STATE_CLOSED:
+                    _LOGGER.warning(
+                        "%s failed %d times in a row, failing fast for %ds",
+                        self.label,
+                        self.failures,
+                        self.cooldown,
+                    )
+                self.state = STATE_OPEN
+                self._opened = time.monotonic()
+
+    def release(self) -> None:
+        """Let another probe through when the current call ended without
+        telling whether the target works"""
+        with self._lock:
+            if self.state == STATE_HALF_OPEN:
+                self.state = STATE_OPEN
+
+    @contextmanager
+    def guard(
+        self,
+        is_failure: Callable[[Exception], bool] | None = None,
+        check: bool = True,
+    ) -> Iterator[None]:
+        """Check the breaker and record the outcome of the enclosed call.
+        An exception `is_failure` rejects still shows the target answered"""
+        if check:
+            self.check()
+
+        try:
+            yield
+        except StartSuperseded:
+            self.release()
+            raise
+        except Exception as exc:
+            if is_failure is None or is_failure(exc):
+                self.record_failure()
+            else:
+                self.record_success()
+            raise
+        except BaseException:
+            self.release()
+            raise
+
+        self.record_success()
+
+    def stats(self) -> dict:
+        with self._lock:
+            retry_in = 0.0
+            if self.state == STATE_OPEN:
+                retry_in = max(
+                    0.0, self._opened + self.cooldown - time.monotonic()
+                )
+            return {
+                "label": self.label,
+                "state": self.state,
+                "failures": self.failures,
+                "rejected": self.rejected,
+                "retry_in": round(retry_in, 1),
+            }
+
+
+class CircuitBreakers:
+    """The breakers of all speakers and endpoints, created on first use"""
+
+    def __init__(
+        self, threshold: int = FAILURE_THRESHOLD, cooldown: float = COOLDOWN
+    ) -> None:
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self._breakers = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str, label: str | None = None) -> CircuitBreaker:
+        """Breaker of `name`, shown as `label` in errors and logs"""
+        with self._lock:
+            if name not in self._breakers:
+                self._breakers[name] = CircuitBreaker(
+                    name, self.threshold, self.cooldown, label
+                )
+            return self._breakers[name]
+
+    def stats(self) -> dict:
+        """State of the breakers that saw failures"""
+        with self._lock:
+            breakers = list(self._breakers.values())
+        return {
+            breaker.name: breaker.stats()
+            for breaker in breakers
+            if breaker.failures or breaker.rejected
+        }
@@ -0,0 +1,154 @@
+"""Cache of the Spotify media browser nodes shown for cast devices"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import Counter, OrderedDict
+from typing import TYPE_CHECKING, Awaitable, Callable
+
+import homeassistant.core as ha_core
+
+from .const import DOMAIN
+from .singleflight import SingleFlight
+
+if TYPE_CHECKING:
+    from homeassistant.components.media_player import BrowseMedia
+
+_LOGGER = logging.getLogger(__name__)
+
+BROWSE_TTL = 300.0
+MAX_NODES = 500
+
+# children of the open node fetched ahead of a click, in order
+PREFETCH_LIMIT = 8
+
+
+class BrowseCache:
+    """Browse nodes by `(media_content_type, media_content_id)`. The
+    content ids of the spotify integration name its config entry, so
+    each account has its own nodes. A node is fetched again once it is
+    `BROWSE_TTL` seconds old, and the expandable children of the last
+    opened node are fetched in the background"""
+
+    def __init__(self, hass: ha_core.HomeAssistant) -> None:
+        self.hass = hass
+        self._nodes = OrderedDict()
+        self._inflight = SingleFlight()
+        self._prefetch = None
+        self.counts = Counter()
+
+    async def async_get(
+        self,
+        media_content_type: str | None,
+        media_content_id: str | None,
+        fetch: Callable[[str | None, str | None], Awaitable[BrowseMedia]],
+    ) -> BrowseMedia:
+        """Node of the media browser, from the cache when fresh. Starts
+        the prefetch of its children"""
+        node = self._lookup(media_content_type, media_content_id)
+        if node is not None:
+            self.counts["hits"] += 1
+        else:
+            self.counts["misses"] += 1
+            node = await self._async_fetch(
+                media_content_type, media_content_id, fetch
+            )
+
+        self._start_prefetch(node, fetch)
+        return node
+
+    def _lookup(
+        self, media_content_type: str | None, media_content_id: str | None
+    ) -> BrowseMedia | None:
+        key = (media_content_type, media_content_id)
+        entry = self._nodes.get(key)
+        if entry is None:
+            return None
+
+        fetched, node = entry
+        if time.monotonic() - fetched > BROWSE_TTL:
+            del self._nodes[key]
+            return None
+
+        self._nodes.move_to_end(key)
+        return node
+
+    async def _async_fetch(
+        self,
+        media_content_type: str | None,
+        media_content_id: str | None,
+        fetch: Callable[[str | None, str | None], Awaitable[BrowseMedia]],
+    ) -> BrowseMedia:
+        key = (media_content_type, media_content_id)
+
+        async def fetch_node() -> BrowseMedia:
+            node = await fetch(media_content_type, media_content_id)
+            self._nodes[key] = (time.monotonic(), node)
+            self._nodes.move_to_end(key)
+            while len(self._nodes) > MAX_NODES:
+                self._nodes.popitem(last=False)
+            return node
+
+        # a click on a node being prefetched waits for that fetch
+        return await self._inflight.run(key, fetch_node, group="browse")
+
+    @ha_core.callback
+    def _start_prefetch(
+        self,
+        node: BrowseMedia,
+        fetch: Callable[[str | None, str | None], Awaitable[BrowseMedia]],
+    ) -> None:
+        children = [
+            child
+            for child in node.children or []
+            if child.can_expand
+            and self._lookup(child.media_content_type, child.media_content_id)
+            is None
+        ][:PREFETCH_LIMIT]
+
+        # only the node open now is worth prefetching for
+        if self._prefetch is not None:
+            self._prefetch.cancel()
+            self._prefetch = None
+
+        if children:
+            self._prefetch = self.hass.async_create_task(
+                self._async_prefetch(children, fetch)
+            )
+
+    async def _async_prefetch(
+        self,
+        children: list[BrowseMedia],
+        fetch: Callable[[str | None, str | None], Awaitable[BrowseMedia]],
+    ) -> None:
+        for child in children:
+            try:
+                await self._async_fetch(
+                    child.media_content_type, child.media_content_id, fetch
+                )
+            except asyncio.CancelledError:
+                raise
+            except Exception as exc:  # pylint: disable=broad-except
+                _LOGGER.debug(
+                    "Could not prefetch %s: %s", child.media_content_id, exc
+                )
+                return
+            self.counts["prefetched"] += 1
+
+    def stats(self) -> dict:
+        return {
+            "nodes": len(self._nodes),
+            "hits": self.counts["hits"],
+            "misses": self.counts["misses"],
+            "prefetched": self.counts["prefetched"],
+        }
+
+
+def get_browse_cache(hass: ha_core.HomeAssistant) -> BrowseCache:
+    """The browse cache, created on the first browse"""
+    data = hass.data.setdefault(DOMAIN, {})
+    if "browse_cache" not in data:
+        data["browse_cache"] = BrowseCache(hass)
+    return data["browse_cache"]
@@ -1,12 +1,17 @@
 from __future__ import annotations
 
 import logging
+import time
+from functools import partial
 
 import homeassistant.core as ha_core
 from homeassistant.components import spotify as ha_spotify
 from homeassistant.components.media_player import BrowseMedia
 from pychromecast import Chromecast
 
+from .browse import get_browse_cache
+from .const import DOMAIN, SERVICE_START_COMMAND_SCHEMA
+
 _LOGGER = logging.getLogger(__name__)
 
 
@@ -15,7 +20,9 @@ async def async_get_media_browser_root_object(
 ) -> list[BrowseMedia]:
     """Create a root object for media browsing."""
     try:
-        result = await ha_spotify.async_browse_media(hass, None, None)
+        result = await get_browse_cache(hass).async_get(
+            None, None, partial(async_fetch_node, hass)
+        )
     except KeyError:
         _LOGGER.debug(
             "failed to call spotify.async_browse_media, the Home Assistant spotify "
@@ -38,13 +45,26 @@ async def async_browse_media(
     # Check if this media is handled by Spotify, if it isn't just return None.
     if ha_spotify.is_spotify_media_type(media_content_type):
         # Browse deeper in the tree
-        result = await ha_spotify.async_browse_media(
-            hass, media_content_type, media_content_id, can_play_artist=False
+        result = await get_browse_cache(hass).async_get(
+            media_content_type, media_content_id, partial(async_fetch_node, hass)
         )
     _LOGGER.debug("async_browse_media return: %s", result)
     return result
 
 
+async def async_fetch_node(
+    hass: ha_core.HomeAssistant,
+    media_content_type: str | None,
+    media_content_id: str | None,
+) -> BrowseMedia:
+    """Fetch a node of the media browser from the spotify integration"""
+    if media_content_type is None:
+        return await ha_spotify.async_browse_media(hass, None, None)
+    return await ha_spotify.async_browse_media(
+        hass, media_content_type, media_content_id, can_play_artist=False
+    )
+
+
 async def async_play_media(
     hass: ha_core.HomeAssistant,
     cast_entity_id,
@@ -60,6 +80,33 @@ async def async_play_media(
         # Get the spotify URI
         spotify_uri = ha_spotify.spotify_uri_from_media_browser_url(media_id)
         data = {"entity_id": cast_entity_id, "uri": spotify_uri}
-        await hass.services.async_call("spotcast", "start", data, blocking=False)
+
+        start = hass.data.get(DOMAIN, {}).get("start")
+        if start is None:
+            await hass.services.async_call("spotcast", "start", data, blocking=False)
+            return True
+
+        # start straight away, launching Spotify over the connection the
+        # cast integration already holds
+        hass.async_create_task(
+            async_start_direct(start, SERVICE_START_COMMAND_SCHEMA(data), chromecast)
+        )
         return True
     return False
+
+
+async def async_start_direct(start, data: dict, chromecast: Chromecast) -> None:
+    begin = time.monotonic()
+    try:
+        await start(data, chromecast)
+    except Exception as exc:  # pylint: disable=broad-except
+        _LOGGER.error(
+            "Could not start %s on %s: %s", data["uri"], data["entity_id"], exc
+        )
+        return
+    _LOGGER.debug(
+        "Started %s on %s in %.0f ms",
+        data["uri"],
+        data["entity_id"],
+        (time.monotonic() - begin) * 1000,
+    )
@@ -0,0 +1,123 @@
+"""Rate limit aware access to the Spotify Web API. Importing this
+module loads spotipy and requests"""
+
+from __future__ import annotations
+
+import logging
+
+import requests
+import spotipy
+from spotipy import SpotifyException
+
+from .breaker import CircuitBreakers, endpoint_name
+from .error import RateLimitedError
+from .ratelimit import (
+    MAX_RETRY_AFTER,
+    PRIORITY_INTERACTIVE,
+    RateLimiter,
+    get_retry_after,
+)
+from .tracing import trace_span
+from .watchdog import blocking
+
+_LOGGER = logging.getLogger(__name__)
+
+API_PREFIX = "https://api.spotify.com/v1/"
+
+MAX_RATE_LIMIT_RETRIES = 5
+
+# 429 is handled by RateLimitedSpotify, the other codes keep the retries
+# of spotipy
+RETRY_STATUS_CODES = (500, 502, 503, 504)
+
+
+def is_endpoint_failure(exc: Exception) -> bool:
+    """Whether exc shows the endpoint is down, rather than a refused or
+    rate limited request"""
+    if isinstance(exc, SpotifyException):
+        # spotipy reports 5xx responses that exhausted their retries as
+        # a 429 with this message
+        return (exc.http_status or 0) >= 500 or (
+            exc.http_status == 429 and "Max Retries" in str(exc.msg)
+        )
+    return isinstance(exc, requests.exceptions.RequestException)
+
+
+class RateLimitedSpotify(spotipy.Spotify):
+    """Spotify client that paces its requests through the rate limiter
+    of its account and honors the Retry-After header of 429 responses.
+    With `breakers`, requests to an endpoint that keeps failing fail at
+    once"""
+
+    def __init__(
+        self,
+        rate_limiter: RateLimiter,
+        priority: int = PRIORITY_INTERACTIVE,
+        breakers: CircuitBreakers | None = None,
+        **kwargs,
+    ) -> None:
+        kwargs.setdefault("status_forcelist", RETRY_STATUS_CODES)
+        super().__init__(**kwargs)
+        self.prefix = API_PREFIX
+        self.rate_limiter = rate_limiter
+        self.priority = priority
+        self.breakers = breakers
+
+    def _build_session(self):
+        super()._build_session()
+
+        # 429 responses must reach _internal_call instead of being
+        # retried by urllib3 inside a single request
+        for adapter in self._session.adapters.values():
+            adapter.max_retries.respect_retry_after_header = False
+
+    @blocking
+    def _internal_call(self, method, url, payload, params):
+        with trace_span("api", method=method, endpoint=url) as span:
+            if self.breakers is None:
+                return self._paced_call(method, url, payload, params, span)
+
+            endpoint = f"{method} {endpoint_name(url, self.prefix)}"
+            breaker = self.breakers.get(
+                f"api {endpoint}", f"Spotify endpoint {endpoint}"
+            )
+            with breaker.guard(is_endpoint_failure):
+                return self._paced_call(method, url, payload, params, span)
+
+    def _paced_call(self, method, url, payload, params, span):
+        attempt = 0
+
+        while True:
+            self.rate_limiter.acquire(self.priority)
+
+            try:
+                return super()._internal_call(method, url, payload, dict(params))
+            except SpotifyException as exc:
+                if span is not None:
+                    span.set(http_status=exc.http_status)
+
+                if exc.http_status != 429 or attempt >= MAX_RATE_LIMIT_RETRIES:
+                    raise
+
+                retry_after = get_retry_after(exc)
+                if retry_after > MAX_RETRY_AFTER:
+                    # waiting that long would stall every caller of
+                    # the account
+                    self.rate_limiter.refuse()
+                    raise RateLimitedError(
+                        f"Spotify asked to wait {retry_after:.0f}s before"
+                        f" calling {url} again"
+                    ) from exc
+
+                attempt += 1
+
+                if span is not None:
+                    span.set(retries=attempt)
+                _LOGGER.warning(
+                    "Rate limited by Spotify on %s, retrying in %.1fs (%d/%d)",
+                    url,
+                    retry_after,
+                    attempt,
+                    MAX_RATE_LIMIT_RETRIES,
+                )
+                self.rate_limiter.block(retry_after)
@@ -1,5 +1,7 @@
 from __future__ import annotations
 
+from datetime import timedelta
+
 import homeassistant.helpers.config_validation as cv
 import voluptuous as vol
 from homeassistant.components import websocket_api
@@ -7,6 +9,11 @@ from homeassistant.const import CONF_ENTITY_ID, CONF_OFFSET, CONF_REPEAT
 
 APP_SPOTIFY = "CC32E753"
 
+# directory under the Home Assistant config directory holding the files
+# of spotcast
+STORAGE_DIR = ".spotcast"
+TRACE_FILE = "trace.jsonl"
+
 DOMAIN = "spotcast"
 
 CONF_SPOTIFY_DEVICE_ID = "spotify_device_id"
@@ -32,6 +39,32 @@ CONF_SP_DC = "sp_dc"
 CONF_SP_KEY = "sp_key"
 CONF_START_VOL = "start_volume"
 CONF_IGNORE_FULLY_PLAYED = "ignore_fully_played"
+CONF_LIBRARY_MIRROR = "library_mirror"
+CONF_CAST_WORKERS = "cast_workers"
+CONF_API_WORKERS = "api_workers"
+CONF_TRACE = "trace"
+CONF_START_WINDOW = "start_window"
+CONF_DEVICES = "devices"
+CONF_KEEP_WARM = "keep_warm"
+CONF_HANDLE = "handle"
+CONF_TTL = "ttl"
+CONF_CIRCUIT_BREAKER = "circuit_breaker"
+CONF_FAILURE_THRESHOLD = "failure_threshold"
+CONF_COOLDOWN = "cooldown"
+CONF_PROBE = "probe"
+CONF_ENABLED = "enabled"
+CONF_MIN_INTERVAL = "min_interval"
+CONF_MAX_INTERVAL = "max_interval"
+CONF_MAX_CONCURRENT = "max_concurrent"
+CONF_WATCHDOG = "watchdog"
+CONF_THRESHOLD = "threshold"
+
+EVENT_START_MULTIPLE = "spotcast_start_multiple"
+EVENT_PREPARED = "spotcast_prepared"
+CONF_TRACE_MAX_BYTES = "max_bytes"
+CONF_TRACE_BACKUP_COUNT = "backup_count"
+
+LIBRARY_SYNC_INTERVAL = timedelta(minutes=30)
 
 WS_TYPE_SPOTCAST_PLAYLISTS = "spotcast/playlists"
 
@@ -62,6 +95,14 @@ SCHEMA_WS_PLAYER = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
     }
 )
 
+WS_TYPE_SPOTCAST_PLAYER_SUBSCRIBE = "spotcast/player/subscribe"
+SCHEMA_WS_PLAYER_SUBSCRIBE = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
+    {
+        vol.Required("type"): WS_TYPE_SPOTCAST_PLAYER_SUBSCRIBE,
+        vol.Optional("account"): str,
+    }
+)
+
 WS_TYPE_SPOTCAST_ACCOUNTS = "spotcast/accounts"
 SCHEMA_WS_ACCOUNTS = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
     {
@@ -76,6 +117,32 @@ SCHEMA_WS_CASTDEVICES = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
     }
 )
 
+WS_TYPE_SPOTCAST_BATCH = "spotcast/batch"
+BATCH_MAX_REQUESTS = 20
+SCHEMA_WS_BATCH = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
+    {
+        vol.Required("type"): WS_TYPE_SPOTCAST_BATCH,
+        vol.Required("requests"): vol.All(
+            [vol.Schema({vol.Required("type"): str}, extra=vol.ALLOW_EXTRA)],
+            vol.Length(min=1, max=BATCH_MAX_REQUESTS),
+        ),
+    }
+)
+
+WS_TYPE_SPOTCAST_DIAGNOSTICS = "spotcast/diagnostics"
+SCHEMA_WS_DIAGNOSTICS = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
+    {
+        vol.Required("type"): WS_TYPE_SPOTCAST_DIAGNOSTICS,
+    }
+)
+
+WS_TYPE_SPOTCAST_METRICS = "spotcast/metrics"
+SCHEMA_WS_METRICS = websocket_api.BASE_COMMAND_MESSAGE_SCHEMA.extend(
+    {
+        vol.Required("type"): WS_TYPE_SPOTCAST_METRICS,
+    }
+)
+
 SERVICE_START_COMMAND_SCHEMA = vol.Schema(
     {
         vol.Optional(CONF_DEVICE_NAME): cv.string,
@@ -101,9 +168,106 @@ SERVICE_START_COMMAND_SCHEMA = vol.Schema(
         vol.Optional(CONF_OFFSET, default=0): cv.string,
         vol.Optional(CONF_START_VOL, default=101): cv.positive_int,
         vol.Optional(CONF_IGNORE_FULLY_PLAYED, default=False): cv.boolean,
+        vol.Optional(CONF_HANDLE): cv.string,
+    }
+)
+
+SERVICE_PREPARE_COMMAND_SCHEMA = SERVICE_START_COMMAND_SCHEMA.extend(
+    {
+        vol.Optional(CONF_TTL, default=30): vol.All(
+            vol.Coerce(int), vol.Range(min=1, max=600)
+        ),
     }
 )
 
+START_TARGET_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            vol.Exclusive(CONF_DEVICE_NAME, "device"): cv.string,
+            vol.Exclusive(CONF_SPOTIFY_DEVICE_ID, "device"): cv.string,
+            vol.Exclusive(CONF_ENTITY_ID, "device"): cv.string,
+            vol.Optional(CONF_SPOTIFY_ACCOUNT): cv.string,
+        }
+    ),
+    cv.has_at_least_one_key(
+        CONF_DEVICE_NAME, CONF_SPOTIFY_DEVICE_ID, CONF_ENTITY_ID
+    ),
+)
+
+SERVICE_START_MULTIPLE_COMMAND_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            **{
+                key: value
+                for key, value in SERVICE_START_COMMAND_SCHEMA.schema.items()
+                if key
+                not in (
+                    CONF_DEVICE_NAME,
+                    CONF_SPOTIFY_DEVICE_ID,
+                    CONF_ENTITY_ID,
+                    CONF_HANDLE,
+                )
+            },
+            vol.Optional(CONF_DEVICE_NAME): vol.All(cv.ensure_list, [cv.string]),
+            vol.Optional(CONF_ENTITY_ID): cv.entity_ids,
+            vol.Optional(CONF_DEVICES): vol.All(
+                cv.ensure_list, [START_TARGET_SCHEMA]
+            ),
+        }
+    ),
+    cv.has_at_least_one_key(CONF_DEVICE_NAME, CONF_ENTITY_ID, CONF_DEVICES),
+)
+
+TRACE_SCHEMA = vol.Schema(
+    {
+        vol.Optional(CONF_TRACE_MAX_BYTES, default=5_000_000): cv.positive_int,
+        vol.Optional(CONF_TRACE_BACKUP_COUNT, default=3): cv.positive_int,
+    }
+)
+
+CIRCUIT_BREAKER_SCHEMA = vol.Schema(
+    {
+        vol.Optional(CONF_FAILURE_THRESHOLD, default=3): cv.positive_int,
+        vol.Optional(CONF_COOLDOWN, default=60): vol.All(
+            vol.Coerce(float), vol.Range(min=1)
+        ),
+    }
+)
+
+PROBE_SCHEMA = vol.Schema(
+    {
+        vol.Optional(CONF_ENABLED, default=True): cv.boolean,
+        vol.Optional(CONF_MIN_INTERVAL, default=30): vol.All(
+            vol.Coerce(float), vol.Range(min=10)
+        ),
+        vol.Optional(CONF_MAX_INTERVAL, default=300): vol.All(
+            vol.Coerce(float), vol.Range(min=10)
+        ),
+        vol.Optional(CONF_MAX_CONCURRENT, default=4): vol.All(
+            vol.Coerce(int), vol.Range(min=1)
+        ),
+    }
+)
+
+WATCHDOG_SCHEMA = vol.Schema(
+    {
+        vol.Optional(CONF_THRESHOLD, default=0.1): vol.All(
+            vol.Coerce(float), vol.Range(min=0.01)
+        ),
+    }
+)
+
+KEEP_WARM_SCHEMA = vol.All(
+    vol.Schema(
+        {
+            vol.Exclusive(CONF_DEVICE_NAME, "device"): cv.string,
+            vol.Exclusive(CONF_ENTITY_ID, "device"): cv.entity_id,
+            vol.Optional(CONF_SPOTIFY_ACCOUNT): cv.string,
+        }
+    ),
+    cv.has_at_least_one_key(CONF_DEVICE_NAME, CONF_ENTITY_ID),
+)
+
 ACCOUNTS_SCHEMA = vol.Schema(
     {
         vol.Required(CONF_SP_DC): cv.string,
@@ -119,6 +283,25 @@ SPOTCAST_CONFIG_SCHEMA = vol.Schema(
                 vol.Required(CONF_SP_KEY): cv.string,
                 vol.Optional(CONF_ACCOUNTS): cv.schema_with_slug_keys(ACCOUNTS_SCHEMA),
                 vol.Optional(CONF_SPOTIFY_COUNTRY): cv.string,
+                vol.Optional(CONF_LIBRARY_MIRROR, default=False): cv.boolean,
+                vol.Optional(CONF_CAST_WORKERS, default=8): vol.All(
+                    vol.Coerce(int), vol.Range(min=1)
+                ),
+                vol.Optional(CONF_API_WORKERS, default=4): vol.All(
+                    vol.Coerce(int), vol.Range(min=1)
+                ),
+                vol.Optional(CONF_TRACE): TRACE_SCHEMA,
+                vol.Optional(CONF_START_WINDOW, default=2.0): vol.All(
+                    vol.Coerce(float), vol.Range(min=0)
+                ),
+                vol.Optional(CONF_KEEP_WARM, default=[]): vol.All(
+                    cv.ensure_list, [KEEP_WARM_SCHEMA]
+                ),
+                vol.Optional(
+                    CONF_CIRCUIT_BREAKER, default={}
+                ): CIRCUIT_BREAKER_SCHEMA,
+                vol.Optional(CONF_PROBE, default={}): PROBE_SCHEMA,
+                vol.Optional(CONF_WATCHDOG): WATCHDOG_SCHEMA,
             }
         ),
     },
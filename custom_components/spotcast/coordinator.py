@@ -0,0 +1,161 @@
+"""Per-device coordination of concurrent spotcast starts"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Awaitable, Callable, Hashable, Iterator
+
+from .error import StartSuperseded
+
+_LOGGER = logging.getLogger(__name__)
+
+_current_start: ContextVar[DeviceStart | None] = ContextVar(
+    "spotcast_current_start", default=None
+)
+
+
+class DeviceStart:
+    """One requested start of a device"""
+
+    def __init__(
+        self, device: Hashable, key: Hashable, replace: bool = True
+    ) -> None:
+        self.device = device
+        self.key = key
+        self.replace = replace
+        self.requested = time.monotonic()
+        self.superseded = False
+        self.task = None
+
+    def supersede(self) -> None:
+        self.superseded = True
+
+
+@contextmanager
+def start_scope(start: DeviceStart) -> Iterator[None]:
+    """Make `start` the start checked at stage boundaries of the
+    enclosed block"""
+    token = _current_start.set(start)
+    try:
+        yield
+    finally:
+        _current_start.reset(token)
+
+
+def raise_if_superseded() -> None:
+    """Stop the current start if a newer one for its device arrived"""
+    start = _current_start.get()
+
+    if start is not None and start.superseded:
+        raise StartSuperseded(f"start of {start.device} superseded")
+
+
+class _DeviceState:
+    def __init__(self) -> None:
+        self.lock = asyncio.Lock()
+        self.running = None
+        self.pending = None
+        self.last_key = None
+        self.last_requested = 0.0
+
+
+class StartCoordinator:
+    """Serializes the starts of each device. Identical requests made
+    within `window` seconds share one start, and a different request
+    replaces the queued one and stops the running one at its next stage
+    boundary, so the newest request wins"""
+
+    def __init__(self, window: float) -> None:
+        self.window = window
+        self._devices = {}
+        self.counts = Counter()
+
+    async def run(
+        self,
+        device: Hashable,
+        key: Hashable,
+        job: Callable[[DeviceStart], Awaitable[Any]],
+        replace: bool = True,
+    ) -> Any:
+        """Run `job(start)` for `device` once it is the device's turn.
+        `key` identifies identical requests. Without `replace`, the job
+        only waits for its turn: it is neither collapsed nor superseded,
+        and does not supersede the others"""
+        state = self._devices.setdefault(device, _DeviceState())
+        self.counts["requests"] += 1
+
+        if not replace:
+            start = DeviceStart(device, key, replace=False)
+            start.task = asyncio.ensure_future(self._run(state, start, job))
+            return await asyncio.shield(start.task)
+
+        latest = state.pending or state.running
+        if latest is not None and latest.key == key and not latest.superseded:
+            self.counts["collapsed"] += 1
+            _LOGGER.debug("Joining in-flight start of %s", device)
+            return await asyncio.shield(latest.task)
+
+        now = time.monotonic()
+        if state.last_key == key and now - state.last_requested < self.window:
+            self.counts["collapsed"] += 1
+            _LOGGER.debug("Dropping repeated start of %s", device)
+            return None
+
+        for previous in (state.pending, state.running):
+            if (
+                previous is not None
+                and previous.replace
+                and not previous.superseded
+            ):
+                _LOGGER.debug("Superseding previous start of %s", device)
+                previous.supersede()
+
+        start = DeviceStart(device, key)
+        state.pending = start
+        start.task = asyncio.ensure_future(self._run(state, start, job))
+
+        # a caller going away must not cancel the start for the ones
+        # that joined it
+        return await asyncio.shield(start.task)
+
+    async def _run(self, state: _DeviceState, start: DeviceStart, job) -> Any:
+        async with state.lock:
+            if state.pending is start:
+                state.pending = None
+
+            if start.superseded:
+                self.counts["superseded"] += 1
+                return None
+
+            state.running = start
+
+            try:
+                result = await job(start)
+            except StartSuperseded:
+                self.counts["superseded"] += 1
+                _LOGGER.info("Start of %s was superseded", start.device)
+                return None
+            finally:
+                state.running = None
+
+            if start.replace:
+                state.last_key = start.key
+                state.last_requested = start.requested
+            self.counts["completed"] += 1
+            return result
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.counts["requests"],
+            "completed": self.counts["completed"],
+            "collapsed": self.counts["collapsed"],
+            "superseded": self.counts["superseded"],
+            "running": sum(
+                state.running is not None for state in self._devices.values()
+            ),
+        }
@@ -1,5 +1,25 @@
+from homeassistant.exceptions import HomeAssistantError
+
+
 class LaunchError(Exception):
     """When an app fails to launch."""
 
+
 class TokenError(Exception):
-    pass
\ No newline at end of file
+    pass
+
+
+class StartSuperseded(Exception):
+    """When a newer start for the same device replaced a running one."""
+
+
+class CircuitOpenError(HomeAssistantError):
+    """When a speaker or endpoint failed too often to be tried again yet."""
+
+
+class DeviceUnreachableError(HomeAssistantError):
+    """When recent probes could not reach a cast device."""
+
+
+class RateLimitedError(HomeAssistantError):
+    """When Spotify asks to wait longer than spotcast retries for."""
@@ -0,0 +1,114 @@
+"""Thread pools dedicated to the blocking work of spotcast"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable
+
+_LOGGER = logging.getLogger(__name__)
+
+LANE_CAST = "cast"
+LANE_API = "api"
+
+WAIT_TIME_SAMPLES = 100
+
+
+class LaneExecutor(ThreadPoolExecutor):
+    """Bounded thread pool that keeps track of its queue depth, the
+    time jobs wait for a worker and the number of busy workers"""
+
+    def __init__(self, name: str, max_workers: int) -> None:
+        super().__init__(
+            max_workers=max_workers, thread_name_prefix=f"spotcast_{name}"
+        )
+        self.name = name
+        self.max_workers = max_workers
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self._wait_times = deque(maxlen=WAIT_TIME_SAMPLES)
+        self._stats_lock = threading.Lock()
+
+    def submit(self, fn: Callable, /, *args, **kwargs) -> Future:
+        submitted = time.monotonic()
+
+        def run():
+            with self._stats_lock:
+                self.queued -= 1
+                self.active += 1
+                self._wait_times.append(time.monotonic() - submitted)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                with self._stats_lock:
+                    self.active -= 1
+                    self.completed += 1
+
+        with self._stats_lock:
+            self.queued += 1
+
+        try:
+            return super().submit(run)
+        except RuntimeError:
+            with self._stats_lock:
+                self.queued -= 1
+            raise
+
+    def stats(self) -> dict:
+        with self._stats_lock:
+            wait_times = list(self._wait_times)
+            return {
+                "workers": self.max_workers,
+                "active": self.active,
+                "queued": self.queued,
+                "completed": self.completed,
+                "wait_avg_ms": (
+                    round(sum(wait_times) / len(wait_times) * 1000, 1)
+                    if wait_times
+                    else None
+                ),
+                "wait_max_ms": (
+                    round(max(wait_times) * 1000, 1) if wait_times else None
+                ),
+            }
+
+
+class SpotcastExecutor:
+    """Separate lanes for cast I/O and Spotify Web API calls, so slow
+    cast launches neither starve API calls nor the shared executor of
+    Home Assistant"""
+
+    def __init__(self, cast_workers: int, api_workers: int) -> None:
+        self.lanes = {
+            LANE_CAST: LaneExecutor(LANE_CAST, cast_workers),
+            LANE_API: LaneExecutor(LANE_API, api_workers),
+        }
+
+    @property
+    def cast(self) -> LaneExecutor:
+        return self.lanes[LANE_CAST]
+
+    @property
+    def api(self) -> LaneExecutor:
+        return self.lanes[LANE_API]
+
+    async def run(self, lane: str, func: Callable, *args, **kwargs) -> Any:
+        """Run a blocking function in a lane and await its result"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(
+            self.lanes[lane], partial(func, *args, **kwargs)
+        )
+
+    def shutdown(self, *_) -> None:
+        _LOGGER.debug("Shutting down spotcast executors")
+        for lane in self.lanes.values():
+            lane.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        return {name: lane.stats() for name, lane in self.lanes.items()}
@@ -5,50 +5,66 @@ import logging
 import random
 import time
 from functools import partial, wraps
+from itertools import islice
+from typing import TYPE_CHECKING, Iterable, Iterator
 
 import homeassistant.core as ha_core
-
-# import for type inference
-import spotipy
-from spotipy import SpotifyException
-from homeassistant.components.cast.media_player import CastDevice
-from homeassistant.components.spotify.media_player import SpotifyMediaPlayer
 from homeassistant.exceptions import HomeAssistantError
 from homeassistant.helpers import entity_platform
 
+from .const import DOMAIN
+from .coordinator import raise_if_superseded
+from .registry import (
+    cast_device_class,
+    iter_platform_entities,
+    spotify_media_player_class,
+)
+
+# spotipy and the media players of the cast and spotify integrations
+# are only imported where they are used, to keep the import of spotcast
+# light while Home Assistant starts
+if TYPE_CHECKING:
+    import spotipy
+    from homeassistant.components.spotify.media_player import SpotifyMediaPlayer
+
+    from .library import SpotifyLibrary
+    from .registry import CastDeviceRegistry
+
 _LOGGER = logging.getLogger(__name__)
 
+# the Web API returns at most 50 items per type and page, and no results
+# past an offset of 1000
+SEARCH_PAGE_SIZE = 50
+SEARCH_MAX_RESULTS = 1000
+# tracks queued after the first search result, whatever the search limit
+QUEUE_LIMIT = 20
+SEARCH_RESULT_ORDER = ["track", "album", "playlist", "show", "audiobook", "episode"]
+
 
 def get_spotify_media_player(
     hass: ha_core.HomeAssistant, spotify_user_id: str
 ) -> SpotifyMediaPlayer:
     """Get the spotify media player entity from hass."""
-    platforms = entity_platform.async_get_platforms(hass, "spotify")
-    spotify_media_player = None
-    for platform in platforms:
-        if platform.domain != "media_player":
-            continue
-
-        for entity in platform.entities.values():
-            if (
-                isinstance(entity, SpotifyMediaPlayer)
-                and entity.unique_id == spotify_user_id
-            ):
-
-                try:
-                    entity_devices = entity._devices
-                except (AttributeError):
-                    entity_devices = entity.data.devices.data
-
-                _LOGGER.debug(
-                    f"get_spotify_devices: {entity.entity_id}: "
-                    f"{entity.name}: %s",
-                    entity_devices,
+    registry = hass.data.get(DOMAIN, {}).get("spotify_registry")
+
+    if registry is not None:
+        spotify_media_player = registry.get_by_unique_id(spotify_user_id)
+    else:
+        spotify_media_player = next(
+            (
+                entity
+                for entity in iter_platform_entities(
+                    hass, "spotify", spotify_media_player_class
                 )
-                spotify_media_player = entity
-                break
+                if entity.unique_id == spotify_user_id
+            ),
+            None,
+        )
 
     if spotify_media_player:
+        _LOGGER.debug(
+            "get_spotify_media_player: %s", spotify_media_player.entity_id
+        )
         return spotify_media_player
     else:
         raise HomeAssistantError("Could not find spotify media player.")
@@ -83,27 +99,68 @@ def get_spotify_install_status(hass):
     return platform_count != 0
 
 
+def get_cast_registry(hass: ha_core.HomeAssistant) -> CastDeviceRegistry | None:
+    """Get the cast device registry, None before spotcast is set up"""
+    return hass.data.get(DOMAIN, {}).get("cast_registry")
+
+
 def get_cast_devices(hass):
-    platforms = entity_platform.async_get_platforms(hass, "cast")
+    registry = get_cast_registry(hass)
+
+    if registry is not None:
+        return registry.cast_infos()
+
     cast_infos = []
-    for platform in platforms:
-        if platform.domain != "media_player":
-            continue
-        for entity in platform.entities.values():
-            if isinstance(entity, CastDevice):
-                _LOGGER.debug(
-                    f"get_cast_devices: {entity.entity_id}: "
-                    f"{entity.name} cast info: % s",
-                    entity._cast_info,
-                )
-                cast_infos.append(entity._cast_info)
+    for entity in iter_platform_entities(hass, "cast", cast_device_class):
+        _LOGGER.debug(
+            f"get_cast_devices: {entity.entity_id}: "
+            f"{entity.name} cast info: % s",
+            entity._cast_info,
+        )
+        cast_infos.append(entity._cast_info)
     return cast_infos
 
 
-# Async wrap sync function
-def async_wrap(func):
+def get_diagnostics(hass: ha_core.HomeAssistant, reports: bool = True) -> dict:
+    """Collect the runtime statistics of spotcast. Without `reports` the
+    watchdog only gives its counts, small enough for state attributes"""
+    data = hass.data[DOMAIN]
+    watchdog = data.get("watchdog")
+    return {
+        "websocket": data["coalescer"].stats(),
+        "executor": data["executor"].stats(),
+        "starts": data["coordinator"].stats(),
+        "prepared": data["prepared"].stats(),
+        "pollers": data["pollers"].stats(),
+        "data": data["data"].stats(),
+        "tokens": data["controller"].token_stats(),
+        "rate_limit": {
+            account: limiter.stats()
+            for account, limiter in data["controller"].rate_limiters.items()
+        },
+        "metrics": data["controller"].metrics.summary(),
+        "breakers": data["controller"].breakers.stats(),
+        "keep_warm": (
+            data["keep_warm"].stats() if "keep_warm" in data else {}
+        ),
+        "browse": (
+            data["browse_cache"].stats() if "browse_cache" in data else {}
+        ),
+        "watchdog": (
+            {}
+            if watchdog is None
+            else watchdog.stats() if reports else watchdog.summary()
+        ),
+    }
+
+
+# Async wrap sync function, optionally bound to a dedicated executor
+def async_wrap(func=None, *, executor=None):
+    if func is None:
+        return partial(async_wrap, executor=executor)
+
     @wraps(func)
-    async def run(*args, loop=None, executor=None, **kwargs):
+    async def run(*args, loop=None, executor=executor, **kwargs):
         if loop is None:
             loop = asyncio.get_event_loop()
         pfunc = partial(func, *args, **kwargs)
@@ -210,7 +267,34 @@ def get_types_string(
     return ",".join(types)
 
 
-def get_search_results(
+def search_yields_tracks(
+    artistName: str,
+    albumName: str,
+    trackName: str,
+    playlistName: str,
+    showName: str,
+    episodeName: str,
+    audiobookName: str,
+    genreName: str,
+) -> bool:
+    """Whether a search by these names can find tracks to queue: a
+    search for a track, or the top tracks of an artist"""
+    if not is_empty_str(trackName):
+        return True
+    return not is_empty_str(artistName) and all(
+        is_empty_str(x)
+        for x in [
+            albumName,
+            playlistName,
+            showName,
+            episodeName,
+            audiobookName,
+            genreName,
+        ]
+    )
+
+
+def iter_search_results(
     spotify_client: spotipy.Spotify,
     limit: int = 10,
     country: str = None,
@@ -222,9 +306,31 @@ def get_search_results(
     episodeName: str = None,
     audiobookName: str = None,
     genreName: str = None,
-):
+    library: SpotifyLibrary = None,
+) -> Iterator[dict]:
+    """Yield search results as they arrive. Remote searches are fetched
+    lazily one page of at most 50 items per type at a time, so `limit`
+    can go beyond the Spotify API page limit"""
     _LOGGER.debug("using search query to find uri")
-    searchResults = []
+
+    # names from the user's own library resolve without a remote search
+    if library is not None and all(
+        is_empty_str(x) for x in [showName, episodeName, audiobookName, genreName]
+    ):
+        searchResults = library.search(
+            playlistName=playlistName,
+            albumName=albumName,
+            trackName=trackName,
+            artistName=artistName,
+        )
+        if len(searchResults) > 0:
+            _LOGGER.debug(
+                "Found %d results in library mirror. First name: %s",
+                len(searchResults),
+                searchResults[0]["name"],
+            )
+            yield from searchResults[:limit]
+            return
 
     if (
         not is_empty_str(artistName)
@@ -249,64 +355,103 @@ def get_search_results(
         searchResults = get_top_tracks(artistName, spotify_client)
         _LOGGER.debug("Playing top tracks for artist: %s",
                       searchResults[0]["name"])
-        return searchResults
-    else:
-        searchString = get_search_string(
-            artistName=artistName,
-            albumName=albumName,
-            trackName=trackName,
-            genreName=genreName,
-            playlistName=playlistName,
-            showName=showName,
-            episodeName=episodeName,
-            audiobookName=audiobookName,
+        yield from searchResults
+        return
+
+    searchString = get_search_string(
+        artistName=artistName,
+        albumName=albumName,
+        trackName=trackName,
+        genreName=genreName,
+        playlistName=playlistName,
+        showName=showName,
+        episodeName=episodeName,
+        audiobookName=audiobookName,
+    )
+
+    searchTypes = get_types_string(
+        artistName=artistName,
+        albumName=albumName,
+        trackName=trackName,
+        playlistName=playlistName,
+        showName=showName,
+        episodeName=episodeName,
+        audiobookName=audiobookName,
+    ).split(",")
+    searchTypes = [x for x in searchTypes if x in SEARCH_RESULT_ORDER]
+
+    offset = 0
+    limit = min(limit, SEARCH_MAX_RESULTS)
+
+    while len(searchTypes) > 0 and offset < limit:
+        page_limit = min(SEARCH_PAGE_SIZE, limit - offset)
+        searchResults = spotify_client.search(
+            q=searchString,
+            limit=page_limit,
+            offset=offset,
+            type=",".join(searchTypes),
+            market=country
         )
 
-        searchTypes = get_types_string(
+        _LOGGER.debug(
+            "Fetched search page at offset %d for %s", offset, searchString
+        )
+
+        # types whose results are exhausted are not requested again
+        nextTypes = []
+        for searchType in SEARCH_RESULT_ORDER:
+            if searchType not in searchTypes:
+                continue
+
+            page = searchResults.get(searchType + "s")
+            if page is None:
+                continue
+
+            for item in page["items"]:
+                if item is not None:
+                    yield item
+
+            if page["next"] is not None:
+                nextTypes.append(searchType)
+
+        searchTypes = nextTypes
+        offset += page_limit
+
+
+def get_search_results(
+    spotify_client: spotipy.Spotify,
+    limit: int = 10,
+    country: str = None,
+    artistName: str = None,
+    albumName: str = None,
+    playlistName: str = None,
+    trackName: str = None,
+    showName: str = None,
+    episodeName: str = None,
+    audiobookName: str = None,
+    genreName: str = None,
+    library: SpotifyLibrary = None,
+) -> list[dict]:
+    compiledResults = list(
+        iter_search_results(
+            spotify_client=spotify_client,
+            limit=limit,
+            country=country,
             artistName=artistName,
             albumName=albumName,
-            trackName=trackName,
             playlistName=playlistName,
+            trackName=trackName,
             showName=showName,
             episodeName=episodeName,
             audiobookName=audiobookName,
+            genreName=genreName,
+            library=library,
         )
-        searchResults = spotify_client.search(
-            q=searchString,
-            limit=limit,
-            offset=0,
-            type=searchTypes,
-            market=country
-        )
-
-        compiledResults = []
-        if "tracks" in searchResults:
-            for item in searchResults["tracks"]["items"]:
-                compiledResults.append(item)
-        if "albums" in searchResults:
-            for item in searchResults["albums"]["items"]:
-                compiledResults.append(item)
-        if "playlists" in searchResults:
-            for item in searchResults["playlists"]["items"]:
-                compiledResults.append(item)
-        if "shows" in searchResults:
-            for item in searchResults["shows"]["items"]:
-                compiledResults.append(item)
-        if "audiobooks" in searchResults:
-            for item in searchResults["audiobooks"]["items"]:
-                compiledResults.append(item)
-        if "episodes" in searchResults:
-            for item in searchResults["episodes"]["items"]:
-                compiledResults.append(item)
+    )
 
-        _LOGGER.debug(
-            "Found %d results for %s. First Track name: %s",
-            len(compiledResults),
-            searchString,
-            compiledResults[0]["name"],
-        )
+    _LOGGER.debug("Found %d results", len(compiledResults))
 
-        return compiledResults
+    return compiledResults
 
 
 def search_tracks(
@@ -334,47 +479,37 @@ def search_tracks(
 
 
 def add_tracks_to_queue(
-    spotify_client: spotipy.Spotify, tracks: list = [], limit: int = 20
+    spotify_client: spotipy.Spotify,
+    tracks: Iterable[dict] = (),
+    limit: int = QUEUE_LIMIT,
 ):
-    filtered = list(filter(lambda x: x["type"] == "track", tracks))
+    """Add tracks to the queue. `tracks` can be a lazy iterator, only as
+    many items as needed to queue `limit` tracks are consumed"""
+    from spotipy import SpotifyException
 
-    if len(filtered) == 0:
-        _LOGGER.debug("Cannot add ZERO tracks to the queue!")
-        return
+    filtered = filter(lambda x: x["type"] == "track", tracks)
+    queued = 0
 
-    for track in filtered[:limit]:
+    for track in islice(filtered, limit):
+        # a newer start of the device stops the queueing of this one
+        raise_if_superseded()
+        queued += 1
         _LOGGER.debug(
             "Adding " + track["name"] +
             " to the playback queue | " + track["uri"]
         )
 
-        max_attemps = 5
-        backoff_rate = 1.2
-        delay = 1
-        current_attempt = 0
-
-        while True:
-            try:
-                spotify_client.add_to_queue(track["uri"])
-            except SpotifyException as exc:
-
-                if current_attempt >= max_attemps:
-                    raise HomeAssistantError(
-                        "Coulddn't addd song to queue"
-                    ) from exc
-
-                _LOGGER.warning("Couldn't add song to queue retrying")
-
-                time.sleep(delay)
-                current_attempt += 1
-                delay *= backoff_rate
-
-                continue
-
-            break
+        # rate limits and server errors are retried by the client
+        try:
+            spotify_client.add_to_queue(track["uri"])
+        except SpotifyException as exc:
+            raise HomeAssistantError("Couldn't add song to queue") from exc
 
         time.sleep(0.5)
 
+    if queued == 0:
+        _LOGGER.debug("Cannot add ZERO tracks to the queue!")
+
 
 def get_random_playlist_from_category(
     spotify_client: spotipy.Spotify,
@@ -382,6 +517,7 @@ def get_random_playlist_from_category(
     country: str = None,
     limit: int = 20,
 ) -> str:
+    from spotipy import SpotifyException
 
     if country is None:
 
@@ -405,9 +541,11 @@ def get_random_playlist_from_category(
     # get list of playlist from category and localisation provided
     try:
         playlists = spotify_client.category_playlists(
-            category_id=category, country=country, limit=limit
+            category_id=category,
+            country=country,
+            limit=min(limit, SEARCH_PAGE_SIZE),
         )["playlists"]["items"]
-    except spotipy.exceptions.SpotifyException as e:
+    except SpotifyException as e:
         _LOGGER.error(e.msg)
         return None
 
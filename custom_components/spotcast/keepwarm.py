@@ -0,0 +1,212 @@
+"""Keeps Spotify launched on configured cast speakers"""
+
+from __future__ import annotations
+
+import logging
+import time
+from datetime import timedelta
+
+import homeassistant.core as ha_core
+from homeassistant.helpers.event import async_track_time_interval
+
+from .const import APP_SPOTIFY
+from .executor import LANE_CAST
+from .ratelimit import PRIORITY_BACKGROUND
+from .spotcast_controller import CAST_DISCONNECT_TIMEOUT, SpotifyCastDevice
+
+_LOGGER = logging.getLogger(__name__)
+
+KEEP_WARM_TICK = timedelta(seconds=30)
+
+# seconds between two checks of a speaker. The interval doubles while
+# the speaker stays warm or is busy with another app, and halves each
+# time Spotify had to be launched again
+KEEP_WARM_INTERVAL = 300
+KEEP_WARM_MIN_INTERVAL = 60
+KEEP_WARM_MAX_INTERVAL = 1800
+
+OUTCOME_WARM = "warm"
+OUTCOME_LAUNCHED = "launched"
+OUTCOME_BUSY = "busy"
+OUTCOME_FAILED = "failed"
+
+
+def entity_friendly_name(
+    hass: ha_core.HomeAssistant, entity_id: str | None
+) -> str | None:
+    state = hass.states.get(entity_id) if entity_id else None
+    return state.attributes.get("friendly_name") if state else None
+
+
+class WarmSpeaker:
+    """A speaker kept warm and the Connect device found for it"""
+
+    def __init__(
+        self, device_name: str = None, entity_id: str = None, account: str = None
+    ) -> None:
+        self.device_name = device_name
+        self.entity_id = entity_id
+        self.account = account
+        self.device_id = None
+        self.interval = KEEP_WARM_INTERVAL
+        self.next_check = 0.0
+        self.outcome = None
+        self.running = False
+
+    def friendly_name(self, hass: ha_core.HomeAssistant) -> str | None:
+        return self.device_name or entity_friendly_name(hass, self.entity_id)
+
+    def matches(
+        self,
+        hass: ha_core.HomeAssistant,
+        account: str,
+        device_name: str,
+        entity_id: str,
+    ) -> bool:
+        if (account or "default") != (self.account or "default"):
+            return False
+        if entity_id is not None and entity_id == self.entity_id:
+            return True
+
+        name = device_name or entity_friendly_name(hass, entity_id)
+        return name is not None and name == self.friendly_name(hass)
+
+    def reschedule(self, outcome: str) -> None:
+        self.outcome = outcome
+
+        if outcome == OUTCOME_LAUNCHED:
+            self.interval = max(KEEP_WARM_MIN_INTERVAL, self.interval / 2)
+        elif outcome == OUTCOME_FAILED:
+            self.interval = KEEP_WARM_MIN_INTERVAL
+        else:
+            self.interval = min(KEEP_WARM_MAX_INTERVAL, self.interval * 2)
+
+        self.next_check = time.monotonic() + self.interval
+
+
+class KeepWarm:
+    """Periodically makes sure every configured speaker runs Spotify and
+    is registered as a Connect device, so a start on it only has to
+    issue the playback"""
+
+    def __init__(self, hass: ha_core.HomeAssistant, controller, executor, speakers):
+        self.hass = hass
+        self.controller = controller
+        self.executor = executor
+        self.speakers = [WarmSpeaker(**speaker) for speaker in speakers]
+        self._unsub = None
+
+    async def async_start(self, *_) -> None:
+        self._unsub = async_track_time_interval(
+            self.hass, self._async_tick, KEEP_WARM_TICK
+        )
+        await self._async_tick()
+
+    async def async_stop(self, *_) -> None:
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
+
+    async def _async_tick(self, *_) -> None:
+        now = time.monotonic()
+
+        for speaker in self.speakers:
+            if speaker.running or speaker.next_check > now:
+                continue
+
+            speaker.running = True
+            self.hass.async_create_task(self._async_check(speaker))
+
+    async def _async_check(self, speaker: WarmSpeaker) -> None:
+        try:
+            outcome = await self.executor.run(LANE_CAST, self.warm, speaker)
+        except Exception as exc:  # pylint: disable=broad-except
+            _LOGGER.warning(
+                "Could not keep %s warm: %s",
+                speaker.device_name or speaker.entity_id,
+                exc,
+            )
+            speaker.device_id = None
+            outcome = OUTCOME_FAILED
+        finally:
+            speaker.running = False
+
+        speaker.reschedule(outcome)
+        _LOGGER.debug(
+            "Keep warm %s: %s, next check in %ds",
+            speaker.device_name or speaker.entity_id,
+            outcome,
+            speaker.interval,
+        )
+
+    def warm(self, speaker: WarmSpeaker) -> str:
+        """Launch Spotify on the speaker unless its Connect device is
+        already known to Spotify or it is busy with another app"""
+        from .client import RateLimitedSpotify
+
+        name = speaker.friendly_name(self.hass)
+        access_token, expires = self.controller.get_token_instance(
+            speaker.account
+        ).get_spotify_token()
+        client = RateLimitedSpotify(
+            self.controller.get_rate_limiter(speaker.account),
+            priority=PRIORITY_BACKGROUND,
+            breakers=self.controller.breakers,
+            auth=access_token,
+        )
+
+        device_id = self.controller._getSpotifyConnectDeviceId(client, name)
+        if device_id is not None:
+            speaker.device_id = device_id
+            return OUTCOME_WARM
+
+        speaker.device_id = None
+        cast_device = SpotifyCastDevice(
+            self.hass,
+            speaker.device_name,
+            speaker.entity_id,
+            self.controller.breakers,
+        )
+
+        try:
+            with cast_device.guard():
+                cast = cast_device.castDevice
+                if not cast.is_idle and cast.app_id != APP_SPOTIFY:
+                    return OUTCOME_BUSY
+
+                cast_device.start_spotify_controller(access_token, expires)
+                speaker.device_id = cast_device.get_spotify_device_id(
+                    client._get("me")["id"]  # pylint: disable=W0212
+                )
+                return OUTCOME_LAUNCHED
+        finally:
+            cast_device.castDevice.disconnect(timeout=CAST_DISCONNECT_TIMEOUT)
+
+    def get_device_id(
+        self, account: str, device_name: str, entity_id: str
+    ) -> str | None:
+        """Connect device id of a warm speaker, None if the speaker is
+        not kept warm or not warm right now"""
+        for speaker in self.speakers:
+            if speaker.matches(self.hass, account, device_name, entity_id):
+                return speaker.device_id
+        return None
+
+    def invalidate(self, account: str, device_name: str, entity_id: str) -> None:
+        """Forget the device of a speaker a start failed on and check it
+        again at the next tick"""
+        for speaker in self.speakers:
+            if speaker.matches(self.hass, account, device_name, entity_id):
+                speaker.device_id = None
+                speaker.next_check = 0.0
+
+    def stats(self) -> dict:
+        return {
+            speaker.device_name or speaker.entity_id: {
+                "account": speaker.account or "default",
+                "warm": speaker.device_id is not None,
+                "last_check": speaker.outcome,
+                "interval": int(speaker.interval),
+            }
+            for speaker in self.speakers
+        }
@@ -0,0 +1,400 @@
+"""Local mirror of a Spotify account library used for name resolution"""
+
+from __future__ import annotations
+
+import bisect
+import logging
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Iterator
+
+if TYPE_CHECKING:
+    import spotipy
+
+_LOGGER = logging.getLogger(__name__)
+
+PAGE_SIZE = 50
+NGRAM_SIZE = 3
+MIN_SIMILARITY = 0.8
+
+KIND_PLAYLIST = "playlist"
+KIND_ALBUM = "album"
+KIND_TRACK = "track"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS playlists (
+    uri TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    owner TEXT,
+    snapshot_id TEXT,
+    tracks_total INTEGER
+);
+CREATE TABLE IF NOT EXISTS albums (
+    uri TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    artists TEXT,
+    added_at TEXT
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    uri TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    artists TEXT,
+    added_at TEXT
+);
+CREATE TABLE IF NOT EXISTS sync_state (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+
+def normalize(string: str) -> str:
+    """Normalize a name for comparison: lowercase, no accents or
+    punctuation, single spaces"""
+    string = unicodedata.normalize("NFKD", string)
+    string = "".join(c for c in string if not unicodedata.combining(c))
+    string = re.sub(r"[^\w\s]", " ", string.casefold())
+    return " ".join(string.split())
+
+
+def ngrams(string: str, size: int = NGRAM_SIZE) -> set[str]:
+    """Return the set of character n-grams of a normalized string"""
+    padded = f" {string} "
+    if len(padded) <= size:
+        return {padded}
+    return {padded[i: i + size] for i in range(len(padded) - size + 1)}
+
+
+class LibraryIndex:
+    """In-memory exact, prefix and n-gram index over the mirrored
+    library entries of one kind"""
+
+    def __init__(self, entries: list[dict]) -> None:
+        self.entries = entries
+        self._exact = {}
+        self._grams = {}
+        self._names = []
+
+        for position, entry in enumerate(entries):
+            name = normalize(entry["name"])
+            self._exact.setdefault(name, []).append(position)
+            self._names.append((name, position))
+            for gram in ngrams(name):
+                self._grams.setdefault(gram, set()).add(position)
+
+        self._names.sort()
+
+    def match(self, name: str, artist_name: str = None) -> list[dict]:
+        """Return the entries matching a name, best match first. Exact
+        matches win over prefix matches which win over n-gram
+        similarity matches"""
+        query = normalize(name)
+
+        if query == "":
+            return []
+
+        positions = self._exact.get(query, [])
+
+        if not positions:
+            positions = self._prefix(query)
+
+        if not positions:
+            positions = self._similar(query)
+
+        results = [self.entries[position] for position in positions]
+
+        if artist_name is not None:
+            artist = normalize(artist_name)
+            results = [
+                entry
+                for entry in results
+                if any(artist in normalize(x["name"]) for x in entry["artists"])
+            ]
+
+        return results
+
+    def _prefix(self, query: str) -> list[int]:
+        start = bisect.bisect_left(self._names, (query, -1))
+        positions = []
+
+        for name, position in self._names[start:]:
+            if not name.startswith(query):
+                break
+            positions.append(position)
+
+        return positions
+
+    def _similar(self, query: str) -> list[int]:
+        query_grams = ngrams(query)
+        shared = {}
+
+        for gram in query_grams:
+            for position in self._grams.get(gram, ()):
+                shared[position] = shared.get(position, 0) + 1
+
+        scored = []
+        for position, count in shared.items():
+            name = normalize(self.entries[position]["name"])
+            score = 2 * count / (len(query_grams) + len(ngrams(name)))
+            if score >= MIN_SIMILARITY:
+                scored.append((score, position))
+
+        scored.sort(key=lambda x: -x[0])
+        return [position for _, position in scored]
+
+
+class SpotifyLibrary:
+    """SQLite mirror of the playlists, saved albums and saved tracks of
+    a Spotify account"""
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        # the lock of the indexes is only held to build or swap them,
+        # syncs are serialized by their own lock
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._indexes = None
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        with self._connect() as connection:
+            connection.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """Open a connection that is committed and closed on exit"""
+        connection = sqlite3.connect(self.path)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    def sync(self, spotify_client: spotipy.Spotify):
+        """Bring the mirror up to date with the account library. Only
+        playlists with a new snapshot_id and items added after the last
+        cursor are written. Searches keep using the previous indexes
+        until the new ones are built"""
+        with self._sync_lock:
+            with self._connect() as connection:
+                self._sync_playlists(connection, spotify_client)
+                self._sync_saved(
+                    connection,
+                    "albums",
+                    "album",
+                    spotify_client.current_user_saved_albums,
+                )
+                self._sync_saved(
+                    connection,
+                    "tracks",
+                    "track",
+                    spotify_client.current_user_saved_tracks,
+                )
+
+            indexes = self._build_indexes()
+            with self._lock:
+                self._indexes = indexes
+
+    def _sync_playlists(
+        self,
+        connection: sqlite3.Connection,
+        spotify_client: spotipy.Spotify,
+    ):
+        known = dict(
+            connection.execute("SELECT uri, snapshot_id FROM playlists")
+        )
+        seen = set()
+        changed = 0
+        offset = 0
+
+        while True:
+            page = spotify_client.current_user_playlists(
+                limit=PAGE_SIZE, offset=offset
+            )
+
+            for playlist in page["items"]:
+                if playlist is None:
+                    continue
+
+                seen.add(playlist["uri"])
+
+                if known.get(playlist["uri"]) == playlist["snapshot_id"]:
+                    continue
+
+                changed += 1
+                connection.execute(
+                    "INSERT OR REPLACE INTO playlists VALUES (?, ?, ?, ?, ?)",
+                    (
+                        playlist["uri"],
+                        playlist["name"],
+                        playlist["owner"]["display_name"],
+                        playlist["snapshot_id"],
+                        playlist["tracks"]["total"],
+                    ),
+                )
+
+            if page["next"] is None:
+                break
+            offset += PAGE_SIZE
+
+        removed = set(known) - seen
+        connection.executemany(
+            "DELETE FROM playlists WHERE uri = ?", [(x,) for x in removed]
+        )
+
+        _LOGGER.debug(
+            "Library playlists synced: %d changed, %d removed", changed, len(removed)
+        )
+
+    def _sync_saved(
+        self,
+        connection: sqlite3.Connection,
+        table: str,
+        key: str,
+        fetch_page,
+        full: bool = False,
+    ):
+        """Sync saved items, newest first, until the stored `added_at`
+        cursor is reached. Falls back to a full resync when the local
+        count drifts from the remote total (items were removed)"""
+        cursor_key = f"{table}_added_at"
+        row = connection.execute(
+            "SELECT value FROM sync_state WHERE key = ?", (cursor_key,)
+        ).fetchone()
+        cursor = None if full or row is None else row[0]
+
+        if full:
+            connection.execute(f"DELETE FROM {table}")
+
+        newest = cursor
+        offset = 0
+        added = 0
+        total = 0
+
+        while True:
+            page = fetch_page(limit=PAGE_SIZE, offset=offset)
+            total = page["total"]
+            reached_cursor = False
+
+            for saved in page["items"]:
+                if cursor is not None and saved["added_at"] <= cursor:
+                    reached_cursor = True
+                    break
+
+                item = saved[key]
+                added += 1
+                connection.execute(
+                    f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?, ?)",
+                    (
+                        item["uri"],
+                        item["name"],
+                        "\x1f".join(x["name"] for x in item["artists"]),
+                        saved["added_at"],
+                    ),
+                )
+
+                if newest is None or saved["added_at"] > newest:
+                    newest = saved["added_at"]
+
+            if reached_cursor or page["next"] is None:
+                break
+            offset += PAGE_SIZE
+
+        if newest is not None:
+            connection.execute(
+                "INSERT OR REPLACE INTO sync_state VALUES (?, ?)",
+                (cursor_key, newest),
+            )
+
+        count = connection.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+        if count != total and not full:
+            _LOGGER.debug(
+                "Library %s count mismatch (%d local, %d remote), full resync",
+                table,
+                count,
+                total,
+            )
+            self._sync_saved(connection, table, key, fetch_page, full=True)
+            return
+
+        _LOGGER.debug("Library %s synced: %d added", table, added)
+
+    def _build_indexes(self) -> dict[str, LibraryIndex]:
+        with self._connect() as connection:
+            playlists = [
+                {
+                    "uri": uri,
+                    "name": name,
+                    "type": KIND_PLAYLIST,
+                    "artists": [],
+                    "owner": {"display_name": owner},
+                }
+                for uri, name, owner in connection.execute(
+                    "SELECT uri, name, owner FROM playlists"
+                )
+            ]
+            saved = {}
+            for table, kind in (("albums", KIND_ALBUM), ("tracks", KIND_TRACK)):
+                saved[kind] = [
+                    {
+                        "uri": uri,
+                        "name": name,
+                        "type": kind,
+                        "artists": [
+                            {"name": x} for x in artists.split("\x1f") if x
+                        ],
+                    }
+                    for uri, name, artists in connection.execute(
+                        f"SELECT uri, name, artists FROM {table} "
+                        "ORDER BY added_at DESC"
+                    )
+                ]
+
+        return {
+            KIND_PLAYLIST: LibraryIndex(playlists),
+            KIND_ALBUM: LibraryIndex(saved[KIND_ALBUM]),
+            KIND_TRACK: LibraryIndex(saved[KIND_TRACK]),
+        }
+
+    def search(
+        self,
+        playlistName: str = None,
+        albumName: str = None,
+        trackName: str = None,
+        artistName: str = None,
+    ) -> list[dict]:
+        """Look up a playlist, saved album or saved track by name. Only
+        a single kind of name can be resolved locally, an empty list is
+        returned for anything else"""
+        names = [
+            (kind, name)
+            for kind, name in (
+                (KIND_PLAYLIST, playlistName),
+                (KIND_ALBUM, albumName),
+                (KIND_TRACK, trackName),
+            )
+            if name is not None and name.strip() != ""
+        ]
+
+        if artistName is not None and artistName.strip() == "":
+            artistName = None
+
+        if len(names) != 1:
+            return []
+
+        kind, name = names[0]
+
+        if kind == KIND_PLAYLIST and artistName is not None:
+            return []
+
+        with self._lock:
+            if self._indexes is None:
+                self._indexes = self._build_indexes()
+            index = self._indexes[kind]
+
+        return index.match(name, artistName)
@@ -0,0 +1,81 @@
+"""Rolling latency metrics of the stages of a spotcast start"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Iterator
+
+from .coordinator import raise_if_superseded
+from .tracing import trace_span
+
+STAGE_WINDOW = 200
+
+STAGE_TOTAL = "total"
+STAGE_TOKEN = "token"
+STAGE_CONNECT_LOOKUP = "connect_device_lookup"
+STAGE_CAST_CONNECT = "cast_connect"
+STAGE_LAUNCH_APP = "launch_app"
+STAGE_DEVICE_POLL = "device_poll"
+STAGE_SEARCH = "search"
+STAGE_RESOLVE = "resolve"
+STAGE_PLAY = "play"
+STAGE_QUEUE = "queue"
+STAGE_POST_PLAY = "post_play"
+
+
+def percentile(values: list[float], quantile: float) -> float:
+    """Nearest-rank percentile of sorted values"""
+    rank = max(1, math.ceil(quantile * len(values)))
+    return values[rank - 1]
+
+
+class StageMetrics:
+    """Keeps the last durations of every stage and reports their
+    percentiles"""
+
+    def __init__(self, window: int = STAGE_WINDOW) -> None:
+        self.window = window
+        self._samples = {}
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def record(self, stage: str, duration: float) -> None:
+        with self._lock:
+            if stage not in self._samples:
+                self._samples[stage] = deque(maxlen=self.window)
+                self._counts[stage] = 0
+            self._samples[stage].append(duration)
+            self._counts[stage] += 1
+
+    @contextmanager
+    def stage(self, name: str, **attributes) -> Iterator[None]:
+        """Time the enclosed block as stage `name`, failures included.
+        The stage is also added to the trace of the call if there is
+        one. A start superseded by a newer one for its device stops
+        here, before the stage begins"""
+        raise_if_superseded()
+        start = time.monotonic()
+        try:
+            with trace_span(name, **attributes):
+                yield
+        finally:
+            self.record(name, time.monotonic() - start)
+
+    def summary(self) -> dict:
+        with self._lock:
+            samples = {stage: sorted(x) for stage, x in self._samples.items()}
+            counts = dict(self._counts)
+
+        return {
+            stage: {
+                "count": counts[stage],
+                "p50_ms": round(percentile(values, 0.50) * 1000, 1),
+                "p95_ms": round(percentile(values, 0.95) * 1000, 1),
+                "p99_ms": round(percentile(values, 0.99) * 1000, 1),
+            }
+            for stage, values in samples.items()
+        }
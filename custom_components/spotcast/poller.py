@@ -0,0 +1,180 @@
+"""Playback state of the accounts, polled once for every subscriber"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import Counter
+from typing import Awaitable, Callable
+
+import homeassistant.core as ha_core
+
+_LOGGER = logging.getLogger(__name__)
+
+PLAYING_INTERVAL = 5.0
+IDLE_INTERVAL = 15.0
+MAX_IDLE_INTERVAL = 120.0
+
+
+def diff_state(old: dict | None, new: dict | None) -> dict | None:
+    """Top level fields of the playback state that changed, None when
+    nothing did. A state appearing or going away is sent whole"""
+    if old is None or new is None:
+        return None if old == new else {"state": new}
+
+    changed = {key: value for key, value in new.items() if old.get(key) != value}
+    removed = [key for key in old if key not in new]
+    if not changed and not removed:
+        return None
+
+    diff = {"changed": changed}
+    if removed:
+        diff["removed"] = removed
+    return diff
+
+
+class PlayerPoller:
+    """Polls the playback state of one account while anybody subscribed
+    and sends what changed to every subscriber. Polls every
+    `PLAYING_INTERVAL` seconds while something plays, and backs off from
+    `IDLE_INTERVAL` up to `MAX_IDLE_INTERVAL` while nothing does"""
+
+    def __init__(
+        self,
+        hass: ha_core.HomeAssistant,
+        account: str,
+        fetch: Callable[[str], Awaitable[dict | None]],
+    ) -> None:
+        self.hass = hass
+        self.account = account
+        self.fetch = fetch
+        self.subscribers = set()
+        self.state = None
+        self.polled = None
+        self.interval = IDLE_INTERVAL
+        self.counts = Counter()
+        self._task = None
+        self._wake = asyncio.Event()
+
+    @ha_core.callback
+    def subscribe(self, send: Callable[[dict], None]) -> Callable[[], None]:
+        """Send the playback state to `send`, then every change of it.
+        Returns the callback ending the subscription"""
+        self.subscribers.add(send)
+        if self.polled is not None:
+            send({"state": self.state})
+
+        if self._task is None:
+            self._task = self.hass.async_create_task(self._async_run())
+
+        @ha_core.callback
+        def unsubscribe() -> None:
+            self.subscribers.discard(send)
+            if not self.subscribers and self._task is not None:
+                self._task.cancel()
+                self._task = None
+
+        return unsubscribe
+
+    @ha_core.callback
+    def wake(self) -> None:
+        """Poll again at once, after a start changed the playback"""
+        self._wake.set()
+
+    def is_fresh(self) -> bool:
+        """Whether the last polled state is recent enough to answer a
+        single player request"""
+        return (
+            self._task is not None
+            and self.polled is not None
+            and time.monotonic() - self.polled <= PLAYING_INTERVAL
+        )
+
+    async def _async_run(self) -> None:
+        while self.subscribers:
+            self._wake.clear()
+            await self._async_poll()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _async_poll(self) -> None:
+        self.counts["polls"] += 1
+        try:
+            state = await self.fetch(self.account)
+        except Exception as exc:  # pylint: disable=broad-except
+            self.counts["errors"] += 1
+            _LOGGER.warning(
+                "Could not poll the player of account %s: %s", self.account, exc
+            )
+            self.interval = min(
+                MAX_IDLE_INTERVAL, max(IDLE_INTERVAL, self.interval * 2)
+            )
+            return
+
+        first = self.polled is None
+        self.polled = time.monotonic()
+        diff = {"state": state} if first else diff_state(self.state, state)
+        self.state = state
+
+        if state is not None and state.get("is_playing"):
+            self.interval = PLAYING_INTERVAL
+        elif diff is not None or self.interval < IDLE_INTERVAL:
+            self.interval = IDLE_INTERVAL
+        else:
+            self.interval = min(MAX_IDLE_INTERVAL, self.interval * 2)
+
+        if diff is None:
+            return
+
+        self.counts["changes"] += 1
+        for send in list(self.subscribers):
+            send(diff)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self.subscribers),
+            "running": self._task is not None,
+            "interval": self.interval,
+            "polls": self.counts["polls"],
+            "changes": self.counts["changes"],
+            "errors": self.counts["errors"],
+        }
+
+
+class PlayerPollers:
+    """The player pollers of all accounts, created on first subscription"""
+
+    def __init__(
+        self,
+        hass: ha_core.HomeAssistant,
+        fetch: Callable[[str], Awaitable[dict | None]],
+    ) -> None:
+        self.hass = hass
+        self.fetch = fetch
+        self._pollers = {}
+
+    def get(self, account: str | None) -> PlayerPoller:
+        account = account or "default"
+        if account not in self._pollers:
+            self._pollers[account] = PlayerPoller(self.hass, account, self.fetch)
+        return self._pollers[account]
+
+    def fresh_state(self, account: str | None) -> tuple[bool, dict | None]:
+        """Whether a poller of `account` polled recently, and the state
+        it found"""
+        poller = self._pollers.get(account or "default")
+        if poller is None or not poller.is_fresh():
+            return False, None
+        return True, poller.state
+
+    @ha_core.callback
+    def wake(self, account: str | None) -> None:
+        poller = self._pollers.get(account or "default")
+        if poller is not None and poller.subscribers:
+            poller.wake()
+
+    def stats(self) -> dict:
+        return {account: poller.stats() for account, poller in self._pollers.items()}
@@ -0,0 +1,195 @@
+"""Starts resolved ahead of time by spotcast.prepare"""
+
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import Counter
+from typing import Any, Iterable, Iterator
+
+from .const import CONF_HANDLE, CONF_TTL
+
+_LOGGER = logging.getLogger(__name__)
+
+
+def start_key(data: dict) -> str:
+    """Identify the parameters of a start, whatever handle it uses"""
+    return json.dumps(
+        {k: v for k, v in data.items() if k not in (CONF_HANDLE, CONF_TTL)},
+        sort_keys=True,
+        default=str,
+    )
+
+
+class StartPlan:
+    """Everything a start resolved before issuing the playback: the
+    client, the Connect device and the arguments of start_playback, or
+    a transfer of the current playback when there is nothing to play.
+    `warm` tells the Connect device came from keep_warm"""
+
+    def __init__(
+        self,
+        data: dict,
+        client,
+        device_id: str,
+        playback: dict | None = None,
+        transfer: bool = False,
+        force_playback: bool = False,
+        queue: Iterator[dict] | None = None,
+        warm: bool = False,
+    ) -> None:
+        self.data = data
+        self.client = client
+        self.device_id = device_id
+        self.playback = playback
+        self.transfer = transfer
+        self.force_playback = force_playback
+        self.queue = queue if queue is not None else iter(())
+        self.warm = warm
+
+
+class StartContent:
+    """What a start plays, independent of its device: the arguments of
+    start_playback and the search results to queue after it. Resolved
+    once by spotcast.start_multiple for all of its devices"""
+
+    def __init__(self, playback: dict | None, queue: Iterable[dict] = ()) -> None:
+        self.playback = playback
+        self.queue = queue
+
+
+_END = object()
+
+
+class SharedResults:
+    """Replays the items of `source` to every iteration, fetching each
+    one only when the first iteration gets to it. Several threads may
+    iterate at once"""
+
+    def __init__(self, source: Iterator[dict]) -> None:
+        self._source = source
+        self._items = []
+        self._done = False
+        self._lock = threading.Lock()
+
+    def __iter__(self) -> Iterator[dict]:
+        position = 0
+        while True:
+            with self._lock:
+                if position == len(self._items):
+                    item = _END if self._done else next(self._source, _END)
+                    if item is _END:
+                        self._done = True
+                        return
+                    self._items.append(item)
+                item = self._items[position]
+            position += 1
+            yield item
+
+
+class _Prepared:
+    def __init__(self, handle: str, data: dict, task: asyncio.Future) -> None:
+        self.handle = handle
+        self.data = data
+        self.key = start_key(data)
+        self.task = task
+        self.expires = None
+
+    def expired(self, now: float) -> bool:
+        return self.expires is not None and self.expires <= now
+
+
+class PreparedStarts:
+    """Plans of prepared starts, by handle and by parameters. A plan is
+    used by one start only and dropped once its ttl ran out"""
+
+    def __init__(self) -> None:
+        self._handles = {}
+        self._keys = {}
+        self.counts = Counter()
+
+    def add(self, handle: str, data: dict, task: asyncio.Future) -> None:
+        """Register the plan of `data` being resolved by `task`,
+        replacing the one prepared under the same handle"""
+        self._purge()
+        self._remove(self._handles.get(handle))
+
+        prepared = _Prepared(handle, data, task)
+        self._handles[handle] = prepared
+        self._keys[prepared.key] = prepared
+        self.counts["prepared"] += 1
+
+    def get_data(self, handle: str | None) -> dict | None:
+        """Parameters of the start prepared under `handle`"""
+        prepared = self._handles.get(handle) if handle else None
+        return prepared.data if prepared is not None else None
+
+    def keep(self, handle: str, task: asyncio.Future, ttl: float) -> None:
+        """Start the ttl of the plan resolved by `task`"""
+        prepared = self._handles.get(handle)
+        if prepared is not None and prepared.task is task:
+            prepared.expires = time.monotonic() + ttl
+
+    def discard(self, handle: str, task: asyncio.Future) -> None:
+        """Forget the plan of `task` when it could not be resolved"""
+        prepared = self._handles.get(handle)
+        if prepared is not None and prepared.task is task:
+            self._remove(prepared)
+
+    async def take(self, data: dict) -> Any:
+        """Plan prepared under the handle of `data`, or for the same
+        parameters. Waits for a plan still being resolved. None if there
+        is none"""
+        self._purge()
+        handle = data.get(CONF_HANDLE)
+        prepared = self._handles.get(handle) if handle else None
+
+        if prepared is None:
+            prepared = self._keys.get(start_key(data))
+
+        if prepared is None:
+            if handle:
+                _LOGGER.warning(
+                    "No prepared start %s, it expired or was already used",
+                    handle,
+                )
+                self.counts["misses"] += 1
+            return None
+
+        self._remove(prepared)
+
+        try:
+            plan = await asyncio.shield(prepared.task)
+        except Exception:  # pylint: disable=broad-except
+            # the failure was reported to the prepare call
+            plan = None
+
+        self.counts["hits" if plan is not None else "misses"] += 1
+        return plan
+
+    def _remove(self, prepared: _Prepared | None) -> None:
+        if prepared is None:
+            return
+        if self._handles.get(prepared.handle) is prepared:
+            del self._handles[prepared.handle]
+        if self._keys.get(prepared.key) is prepared:
+            del self._keys[prepared.key]
+
+    def _purge(self) -> None:
+        now = time.monotonic()
+        for prepared in list(self._handles.values()):
+            if prepared.expired(now):
+                self.counts["expired"] += 1
+                self._remove(prepared)
+
+    def stats(self) -> dict:
+        return {
+            "pending": len(self._handles),
+            "prepared": self.counts["prepared"],
+            "hits": self.counts["hits"],
+            "misses": self.counts["misses"],
+            "expired": self.counts["expired"],
+        }
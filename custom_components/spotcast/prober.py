@@ -0,0 +1,237 @@
+"""Background reachability checks of the known cast devices"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from datetime import timedelta
+
+import homeassistant.core as ha_core
+from homeassistant.helpers.event import async_track_time_interval
+from homeassistant.util import dt
+
+from .const import APP_SPOTIFY
+from .error import DeviceUnreachableError
+from .helpers import get_cast_devices, get_cast_registry
+
+_LOGGER = logging.getLogger(__name__)
+
+PROBE_TICK = timedelta(seconds=10)
+PROBE_TIMEOUT = 3
+
+# a device is only reported unreachable by a start after this many
+# failed probes in a row
+UNREACHABLE_AFTER = 2
+
+
+class CastReachability:
+    """What the last probes of one cast device found"""
+
+    def __init__(self, uuid: str, name: str, interval: float) -> None:
+        self.uuid = uuid
+        self.name = name
+        self.host = None
+        self.port = None
+        self.entity_id = None
+        self.reachable = None
+        self.rtt_ms = None
+        self.app_id = None
+        self.app_name = None
+        self.failures = 0
+        self.checked = 0.0
+        self.last_check = None
+        self.interval = interval
+        self.next_check = 0.0
+        self.running = False
+
+    def is_unreachable(self, max_age: float) -> bool:
+        """Whether recent probes agree the device is unreachable"""
+        return (
+            self.failures >= UNREACHABLE_AFTER
+            and time.monotonic() - self.checked <= max_age
+        )
+
+    def runs_other_app(self, max_age: float) -> bool:
+        """Whether a recent probe saw the device reachable and running an
+        app other than Spotify, so Spotify cannot know it as a Connect
+        device"""
+        return (
+            self.reachable is True
+            and self.app_id is not None
+            and self.app_id != APP_SPOTIFY
+            and time.monotonic() - self.checked <= max_age
+        )
+
+    def as_dict(self) -> dict:
+        return {
+            "reachable": self.reachable,
+            "rtt_ms": self.rtt_ms,
+            "app_id": self.app_id,
+            "app_name": self.app_name,
+            "last_probe": self.last_check,
+        }
+
+
+class CastProber:
+    """Opens a TCP connection to every known cast device from time to
+    time to record whether it is reachable, the round trip time and the
+    app it runs. A device is probed again after `min_interval` seconds
+    while it is unreachable or changed since the last probe, and the
+    interval doubles up to `max_interval` while nothing changes. At most
+    `max_concurrent` probes run at once"""
+
+    def __init__(
+        self,
+        hass: ha_core.HomeAssistant,
+        min_interval: float,
+        max_interval: float,
+        max_concurrent: int,
+    ) -> None:
+        self.hass = hass
+        self.min_interval = min_interval
+        self.max_interval = max(min_interval, max_interval)
+        self.max_concurrent = max_concurrent
+        self.devices = {}
+        self._semaphore = None
+        self._unsub = None
+
+    async def async_start(self, *_) -> None:
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        self._unsub = async_track_time_interval(
+            self.hass, self._async_tick, PROBE_TICK
+        )
+        await self._async_tick()
+
+    async def async_stop(self, *_) -> None:
+        if self._unsub is not None:
+            self._unsub()
+            self._unsub = None
+
+    async def _async_tick(self, *_) -> None:
+        now = time.monotonic()
+        registry = get_cast_registry(self.hass)
+        known = set()
+
+        for cast_info in get_cast_devices(self.hass):
+            uuid = str(cast_info.cast_info.uuid)
+            known.add(uuid)
+
+            device = self.devices.get(uuid)
+            if device is None:
+                device = self.devices[uuid] = CastReachability(
+                    uuid, cast_info.cast_info.friendly_name, self.min_interval
+                )
+
+            device.name = cast_info.cast_info.friendly_name
+            device.host = cast_info.cast_info.host
+            device.port = cast_info.cast_info.port
+            if registry is not None:
+                device.entity_id = registry.get_entity_id_by_uuid(uuid)
+
+            if device.running or device.next_check > now or device.host is None:
+                continue
+
+            device.running = True
+            self.hass.async_create_task(self._async_probe(device))
+
+        for uuid in set(self.devices) - known:
+            del self.devices[uuid]
+
+    async def _async_probe(self, device: CastReachability) -> None:
+        try:
+            async with self._semaphore:
+                reachable, rtt_ms = await self._async_connect(
+                    device.host, device.port
+                )
+        finally:
+            device.running = False
+
+        app_id, app_name = self._running_app(device.entity_id)
+        changed = reachable != device.reachable or app_id != device.app_id
+
+        device.reachable = reachable
+        device.rtt_ms = rtt_ms
+        device.app_id = app_id if reachable else None
+        device.app_name = app_name if reachable else None
+        device.failures = 0 if reachable else device.failures + 1
+        device.checked = time.monotonic()
+        device.last_check = dt.now().isoformat("T")
+
+        if reachable and not changed:
+            device.interval = min(self.max_interval, device.interval * 2)
+        else:
+            device.interval = self.min_interval
+        device.next_check = device.checked + device.interval
+
+        _LOGGER.debug(
+            "Probed %s: reachable %s in %s ms running %s, next probe in %ds",
+            device.name,
+            reachable,
+            rtt_ms,
+            app_name,
+            device.interval,
+        )
+
+    @staticmethod
+    async def _async_connect(host: str, port: int) -> tuple[bool, float | None]:
+        begin = time.monotonic()
+
+        try:
+            _, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port), PROBE_TIMEOUT
+            )
+        except (OSError, asyncio.TimeoutError):
+            return False, None
+
+        rtt_ms = round((time.monotonic() - begin) * 1000, 1)
+        writer.close()
+        return True, rtt_ms
+
+    def _running_app(self, entity_id: str | None) -> tuple[str | None, str | None]:
+        """App reported by the cast integration, which keeps a
+        connection to the device anyway"""
+        state = self.hass.states.get(entity_id) if entity_id else None
+        if state is None:
+            return None, None
+        return state.attributes.get("app_id"), state.attributes.get("app_name")
+
+    def lookup(
+        self, device_name: str | None, entity_id: str | None
+    ) -> CastReachability | None:
+        """Probe results of the cast device a start targets"""
+        registry = get_cast_registry(self.hass)
+        if registry is None:
+            return None
+
+        if entity_id is not None:
+            cast_info = registry.get_by_entity_id(entity_id)
+        elif device_name is not None:
+            # a name that is no cast device, like a Connect only speaker,
+            # must not rebuild the index on every start
+            cast_info = registry.get_by_friendly_name(device_name, rebuild=False)
+        else:
+            cast_info = None
+
+        if cast_info is None:
+            return None
+        return self.devices.get(str(cast_info.cast_info.uuid))
+
+    def max_age(self) -> float:
+        """Age up to which a probe result is trusted by a start"""
+        return 2 * self.min_interval
+
+    def raise_if_unreachable(self, device: CastReachability) -> None:
+        """Fail a start on a device recent probes could not reach, and
+        probe it again at the next tick"""
+        if not device.is_unreachable(self.max_age()):
+            return
+
+        device.next_check = 0.0
+        raise DeviceUnreachableError(
+            f"Cast device {device.name} did not answer the last "
+            f"{device.failures} probes"
+        )
+
+    def stats(self) -> dict:
+        return {device.uuid: device.as_dict() for device in self.devices.values()}
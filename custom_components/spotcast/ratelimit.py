@@ -0,0 +1,113 @@
+"""Request budget of the Spotify Web API shared by the clients of an
+account"""
+
+from __future__ import annotations
+
+import threading
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from spotipy import SpotifyException
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+# sustained requests per second and burst size allowed per account
+REQUEST_RATE = 5.0
+REQUEST_BURST = 20
+
+DEFAULT_RETRY_AFTER = 1.0
+
+# a longer Retry-After fails the request instead of holding the account
+MAX_RETRY_AFTER = 60.0
+
+
+class RateLimiter:
+    """Token bucket shared by every client of one account. Interactive
+    callers are served before background ones, and the whole account
+    pauses while Spotify asks to retry later"""
+
+    def __init__(
+        self, rate: float = REQUEST_RATE, burst: int = REQUEST_BURST
+    ) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.throttled = 0
+        self.refused = 0
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._blocked_until = 0.0
+        self._waiting = [0, 0]
+        self._condition = threading.Condition()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(
+            self.burst, self._tokens + (now - self._updated) * self.rate
+        )
+        self._updated = now
+
+    def acquire(self, priority: int = PRIORITY_INTERACTIVE) -> None:
+        """Block until a request may be sent"""
+        with self._condition:
+            self._waiting[priority] += 1
+
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+
+                    if now < self._blocked_until:
+                        timeout = self._blocked_until - now
+                    elif any(self._waiting[:priority]):
+                        # let higher priority callers go first
+                        timeout = 1 / self.rate
+                    elif self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    else:
+                        timeout = (1 - self._tokens) / self.rate
+
+                    self._condition.wait(timeout)
+            finally:
+                self._waiting[priority] -= 1
+                self._condition.notify_all()
+
+    def block(self, seconds: float) -> None:
+        """Hold every request of the account for `seconds`, at most
+        `MAX_RETRY_AFTER`"""
+        with self._condition:
+            self.throttled += 1
+            self._blocked_until = max(
+                self._blocked_until,
+                time.monotonic() + min(seconds, MAX_RETRY_AFTER),
+            )
+            self._tokens = 0
+
+    def refuse(self) -> None:
+        """Count a request failed for a Retry-After over the bound"""
+        with self._condition:
+            self.refused += 1
+
+    def stats(self) -> dict:
+        with self._condition:
+            now = time.monotonic()
+            self._refill(now)
+            return {
+                "tokens": round(self._tokens, 1),
+                "throttled": self.throttled,
+                "refused": self.refused,
+                "blocked_for": round(max(0.0, self._blocked_until - now), 1),
+                "waiting_interactive": self._waiting[PRIORITY_INTERACTIVE],
+                "waiting_background": self._waiting[PRIORITY_BACKGROUND],
+            }
+
+
+def get_retry_after(exc: SpotifyException) -> float:
+    """Seconds to wait according to the Retry-After header of a 429"""
+    headers = getattr(exc, "headers", None) or {}
+
+    try:
+        return max(0.0, float(headers.get("Retry-After")))
+    except (TypeError, ValueError):
+        return DEFAULT_RETRY_AFTER
@@ -0,0 +1,246 @@
+"""Indexes over the media player entities spotcast looks up"""
+
+from __future__ import annotations
+
+import logging
+import threading
+from typing import TYPE_CHECKING, Callable, Iterator
+
+import homeassistant.core as ha_core
+from homeassistant.helpers import entity_platform
+from homeassistant.helpers.event import (
+    async_track_state_added_domain,
+    async_track_state_removed_domain,
+)
+
+if TYPE_CHECKING:
+    from homeassistant.components.cast.media_player import CastDevice
+    from homeassistant.components.spotify.media_player import SpotifyMediaPlayer
+
+_LOGGER = logging.getLogger(__name__)
+
+MEDIA_PLAYER_DOMAIN = "media_player"
+
+
+def cast_device_class() -> type:
+    from homeassistant.components.cast.media_player import CastDevice
+
+    return CastDevice
+
+
+def spotify_media_player_class() -> type:
+    from homeassistant.components.spotify.media_player import SpotifyMediaPlayer
+
+    return SpotifyMediaPlayer
+
+
+def iter_platform_entities(
+    hass: ha_core.HomeAssistant,
+    platform_name: str,
+    entity_class: Callable[[], type],
+) -> Iterator:
+    """Yield every media player entity provided by the integration
+    `platform_name` of the class returned by `entity_class`. The class
+    is only loaded once the integration has set up a media player
+    platform, which imported its module already"""
+    for platform in entity_platform.async_get_platforms(hass, platform_name):
+        if platform.domain != MEDIA_PLAYER_DOMAIN:
+            continue
+
+        cls = entity_class()
+        for entity in platform.entities.values():
+            if isinstance(entity, cls):
+                yield entity
+
+
+class EntityIndex:
+    """Keeps media player entities of one integration indexed. The
+    index is built once with a full scan and then kept current from
+    the state added and removed events of the media_player domain"""
+
+    platform_name = None
+    # returns the class of the indexed entities
+    entity_class = None
+
+    def __init__(self, hass: ha_core.HomeAssistant) -> None:
+        self.hass = hass
+        self._lock = threading.Lock()
+        self._unsubs = []
+        self._clear()
+
+    @ha_core.callback
+    def async_setup(self) -> None:
+        """Build the index and subscribe to entity lifecycle events"""
+        self.rebuild()
+        self._unsubs = [
+            async_track_state_added_domain(
+                self.hass, MEDIA_PLAYER_DOMAIN, self._async_entity_added
+            ),
+            async_track_state_removed_domain(
+                self.hass, MEDIA_PLAYER_DOMAIN, self._async_entity_removed
+            ),
+        ]
+
+    @ha_core.callback
+    def async_unload(self) -> None:
+        for unsub in self._unsubs:
+            unsub()
+        self._unsubs = []
+
+    def rebuild(self) -> None:
+        """Rebuild the whole index with a scan of the platform"""
+        entities = iter_platform_entities(
+            self.hass, self.platform_name, self.entity_class
+        )
+
+        with self._lock:
+            self._clear()
+            for entity in entities:
+                self._add(entity)
+
+        _LOGGER.debug(
+            "%s index rebuilt with %d entities",
+            self.platform_name,
+            len(self._entities),
+        )
+
+    def entities(self) -> list:
+        with self._lock:
+            return list(self._entities.values())
+
+    def _find_entity(self, entity_id: str):
+        for platform in entity_platform.async_get_platforms(
+            self.hass, self.platform_name
+        ):
+            if platform.domain != MEDIA_PLAYER_DOMAIN:
+                continue
+
+            entity = platform.entities.get(entity_id)
+
+            if isinstance(entity, self.entity_class()):
+                return entity
+
+        return None
+
+    @ha_core.callback
+    def _async_entity_added(self, event: ha_core.Event) -> None:
+        entity = self._find_entity(event.data["entity_id"])
+
+        if entity is None:
+            return
+
+        with self._lock:
+            self._add(entity)
+
+        _LOGGER.debug("%s index added %s", self.platform_name, entity.entity_id)
+
+    @ha_core.callback
+    def _async_entity_removed(self, event: ha_core.Event) -> None:
+        entity_id = event.data["entity_id"]
+
+        with self._lock:
+            entity = self._entities.get(entity_id)
+            if entity is None:
+                return
+            self._remove(entity)
+
+        _LOGGER.debug("%s index removed %s", self.platform_name, entity_id)
+
+    def _clear(self) -> None:
+        self._entities = {}
+
+    def _add(self, entity) -> None:
+        self._entities[entity.entity_id] = entity
+
+    def _remove(self, entity) -> None:
+        self._entities.pop(entity.entity_id, None)
+
+
+class CastDeviceRegistry(EntityIndex):
+    """Cast entities indexed by friendly name, entity_id and UUID"""
+
+    platform_name = "cast"
+    entity_class = staticmethod(cast_device_class)
+
+    def _clear(self) -> None:
+        super()._clear()
+        self._by_name = {}
+        self._by_uuid = {}
+
+    def _add(self, entity: CastDevice) -> None:
+        super()._add(entity)
+        cast_info = entity._cast_info
+        self._by_name[cast_info.friendly_name] = entity
+        self._by_uuid[str(cast_info.cast_info.uuid)] = entity
+
+    def _remove(self, entity: CastDevice) -> None:
+        super()._remove(entity)
+        cast_info = entity._cast_info
+
+        if self._by_name.get(cast_info.friendly_name) is entity:
+            del self._by_name[cast_info.friendly_name]
+
+        if self._by_uuid.get(str(cast_info.cast_info.uuid)) is entity:
+            del self._by_uuid[str(cast_info.cast_info.uuid)]
+
+    def cast_infos(self) -> list:
+        return [entity._cast_info for entity in self.entities()]
+
+    def get_by_friendly_name(self, friendly_name: str, rebuild: bool = True):
+        """Get the cast info of a device by its friendly name. With
+        `rebuild`, a miss or a device renamed since it was indexed
+        triggers one rebuild"""
+        entity = self._by_name.get(friendly_name)
+
+        if entity is None or entity._cast_info.friendly_name != friendly_name:
+            if not rebuild:
+                return None
+            self.rebuild()
+            entity = self._by_name.get(friendly_name)
+
+        return None if entity is None else entity._cast_info
+
+    def get_by_entity_id(self, entity_id: str):
+        entity = self._entities.get(entity_id)
+        return None if entity is None else entity._cast_info
+
+    def get_by_uuid(self, uuid: str):
+        entity = self._by_uuid.get(str(uuid))
+        return None if entity is None else entity._cast_info
+
+    def get_entity_id_by_uuid(self, uuid: str) -> str | None:
+        entity = self._by_uuid.get(str(uuid))
+        return None if entity is None else entity.entity_id
+
+
+class SpotifyPlayerRegistry(EntityIndex):
+    """Spotify media player entities indexed by unique_id, which is the
+    Spotify user id of the account"""
+
+    platform_name = "spotify"
+    entity_class = staticmethod(spotify_media_player_class)
+
+    def _clear(self) -> None:
+        super()._clear()
+        self._by_unique_id = {}
+
+    def _add(self, entity: SpotifyMediaPlayer) -> None:
+        super()._add(entity)
+        self._by_unique_id[entity.unique_id] = entity
+
+    def _remove(self, entity: SpotifyMediaPlayer) -> None:
+        super()._remove(entity)
+
+        if self._by_unique_id.get(entity.unique_id) is entity:
+            del self._by_unique_id[entity.unique_id]
+
+    def get_by_unique_id(self, unique_id: str) -> SpotifyMediaPlayer | None:
+        """Get the media player of a Spotify user. A miss triggers one
+        rebuild"""
+        entity = self._by_unique_id.get(unique_id)
+
+        if entity is None:
+            self.rebuild()
+            entity = self._by_unique_id.get(unique_id)
+
+        return entity
@@ -9,39 +9,47 @@ from datetime import timedelta
 import homeassistant.core as ha_core
 from homeassistant.components.sensor import SensorEntity
 from homeassistant.const import STATE_OK, STATE_UNKNOWN
+from homeassistant.helpers.update_coordinator import CoordinatorEntity
 from homeassistant.util import dt
 
-from .const import CONF_SPOTIFY_COUNTRY, DOMAIN
-from .helpers import get_cast_devices
+from .const import DOMAIN
+from .helpers import get_diagnostics
+from .metrics import STAGE_TOTAL
+from .updates import SpotcastCoordinator
 
 _LOGGER = logging.getLogger(__name__)
 
 SENSOR_SCAN_INTERVAL_SECS = 60
 SCAN_INTERVAL = timedelta(seconds=SENSOR_SCAN_INTERVAL_SECS)
 
+SENSOR_PLAYLIST_LIMIT = 10
 
-def setup_platform(
+
+async def async_setup_platform(
     hass: ha_core.HomeAssistant,
     config: collections.OrderedDict,
-    add_devices,
+    async_add_entities,
     discovery_info=None,
 ):
+    data = hass.data[DOMAIN]["data"]
+    playlists = data.playlists(None)
+
+    async_add_entities(
+        [
+            ChromecastDevicesSensor(data.cast_devices),
+            ChromecastPlaylistSensor(playlists),
+            SpotcastDiagnosticsSensor(hass),
+        ]
+    )
 
-    try:
-        country = config[CONF_SPOTIFY_COUNTRY]
-    except KeyError:
-        country = None
-
-    add_devices([ChromecastDevicesSensor(hass)])
-    add_devices([ChromecastPlaylistSensor(hass, country)])
+    # the sensors get their first data without waiting a whole interval
+    for coordinator in (data.cast_devices, playlists):
+        hass.async_create_task(coordinator.async_request_refresh())
 
 
-class ChromecastDevicesSensor(SensorEntity):
-    def __init__(self, hass):
-        self.hass = hass
-        self._state = STATE_UNKNOWN
-        self._chromecast_devices = []
-        self._attributes = {"devices_json": [], "devices": [], "last_update": None}
+class ChromecastDevicesSensor(CoordinatorEntity, SensorEntity):
+    def __init__(self, coordinator: SpotcastCoordinator):
+        super().__init__(coordinator)
         _LOGGER.debug("initiating sensor")
 
     @property
@@ -50,77 +58,83 @@ class ChromecastDevicesSensor(SensorEntity):
 
     @property
     def state(self):
-        return self._state
+        return STATE_OK if self.coordinator.data is not None else STATE_UNKNOWN
 
     @property
     def extra_state_attributes(self):
         """Return the state attributes."""
-        return self._attributes
-
-    def update(self):
-        _LOGGER.debug("Getting chromecast devices")
-
-        known_devices = get_cast_devices(self.hass)
-        _LOGGER.debug("sensor devices %s", known_devices)
+        prober = self.hass.data.get(DOMAIN, {}).get("prober")
+        probes = prober.stats() if prober is not None else {}
 
         chromecasts = [
-            {
-                "uuid": str(cast_info.cast_info.uuid),
-                "model_name": cast_info.cast_info.model_name,
-                "name": cast_info.cast_info.friendly_name,
-                "manufacturer": cast_info.cast_info.manufacturer,
-                "cast_type": cast_info.cast_info.cast_type,
-            }
-            for cast_info in known_devices
+            {**device, **probes.get(device["uuid"], {})}
+            for device in self.coordinator.data or []
         ]
+        return {
+            "devices_json": json.dumps(chromecasts, ensure_ascii=False),
+            "devices": chromecasts,
+            "last_update": self.coordinator.last_update,
+        }
 
-        self._attributes["devices_json"] = json.dumps(chromecasts, ensure_ascii=False)
-        self._attributes["devices"] = chromecasts
-        self._attributes["last_update"] = dt.now().isoformat("T")
-        self._state = STATE_OK
 
+class ChromecastPlaylistSensor(CoordinatorEntity, SensorEntity):
+    def __init__(self, coordinator: SpotcastCoordinator):
+        super().__init__(coordinator)
+        _LOGGER.debug("initiating playlist sensor")
+
+    @property
+    def name(self):
+        return "Playlists sensor"
 
-class ChromecastPlaylistSensor(SensorEntity):
-    def __init__(self, hass: ha_core, country=None):
+    @property
+    def state(self):
+        return STATE_OK if self.coordinator.data is not None else STATE_UNKNOWN
+
+    @property
+    def extra_state_attributes(self):
+        """Return the state attributes."""
+        resp = self.coordinator.data
+        items = resp["items"][:SENSOR_PLAYLIST_LIMIT] if resp is not None else []
+        return {
+            "playlists": [{"uri": x["uri"], "name": x["name"]} for x in items],
+            "last_update": self.coordinator.last_update,
+        }
+
+
+class SpotcastDiagnosticsSensor(SensorEntity):
+    """Latency percentiles of spotcast.start stages and runtime
+    statistics. The state is the p95 of a whole start in ms"""
+
+    def __init__(self, hass: ha_core.HomeAssistant):
         self.hass = hass
         self._state = STATE_UNKNOWN
-        self.country = country
-        self._attributes = {"playlists": [], "last_update": None}
-        _LOGGER.debug("initiating playlist sensor")
+        self._attributes = {"last_update": None}
+        _LOGGER.debug("initiating diagnostics sensor")
 
     @property
     def name(self):
-        return "Playlists sensor"
+        return "Spotcast diagnostics"
 
     @property
     def state(self):
         return self._state
 
+    @property
+    def unit_of_measurement(self):
+        return "ms"
+
     @property
     def extra_state_attributes(self):
         """Return the state attributes."""
         return self._attributes
 
-    def update(self):
-        _LOGGER.debug("Getting playlists")
-
-        if self.country is not None:
-            country_code = self.country
-        else:
-            # kept the country code to SE if not provided by the user for retrocompatibility
-            country_code = "SE"
-
-        playlist_type = "user"
-        locale = "en"
-        limit = 10
-        account = None
-
-        resp = self.hass.data[DOMAIN]["controller"].get_playlists(
-            account, playlist_type, country_code, locale, limit
-        )
-        self._attributes["playlists"] = [
-            {"uri": x["uri"], "name": x["name"]} for x in resp["items"]
-        ]
+    async def async_update(self):
+        # the statistics belong to the event loop and take no I/O to
+        # collect, so they are read on it rather than in the executor.
+        # The watchdog stacks would bloat the state of the sensor
+        diagnostics = get_diagnostics(self.hass, reports=False)
+        total = diagnostics["metrics"].get(STAGE_TOTAL)
 
+        self._attributes = diagnostics
         self._attributes["last_update"] = dt.now().isoformat("T")
-        self._state = STATE_OK
+        self._state = None if total is None else total["p95_ms"]
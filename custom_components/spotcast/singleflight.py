@@ -0,0 +1,56 @@
+"""Coalescing of concurrent identical requests"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+from collections import Counter
+from typing import Any, Awaitable, Callable, Hashable
+
+_LOGGER = logging.getLogger(__name__)
+
+
+class SingleFlight:
+    """Runs at most one computation per key at a time. Callers asking
+    for a key that is already in flight wait for that computation and
+    share its result instead of starting their own"""
+
+    def __init__(self) -> None:
+        self._inflight = {}
+        self.requests = Counter()
+        self.coalesced = Counter()
+
+    async def run(
+        self,
+        key: Hashable,
+        factory: Callable[[], Awaitable[Any]],
+        group: str = None,
+    ) -> Any:
+        """Return the result of `factory()` for `key`, joining the
+        in-flight computation if there is one. `group` is the name the
+        request is counted under, defaults to the key"""
+        group = key if group is None else group
+        self.requests[group] += 1
+
+        task = self._inflight.get(key)
+
+        if task is None:
+            task = asyncio.ensure_future(factory())
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        else:
+            self.coalesced[group] += 1
+            _LOGGER.debug("Coalesced request %s onto in-flight computation", key)
+
+        # a waiter going away must not cancel the computation for the
+        # others
+        return await asyncio.shield(task)
+
+    def stats(self) -> dict:
+        return {
+            group: {
+                "requests": self.requests[group],
+                "coalesced": self.coalesced[group],
+            }
+            for group in self.requests
+        }
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import asyncio
 import collections
 import json
 import logging
@@ -7,23 +8,58 @@ import random
 import time
 from asyncio import run_coroutine_threadsafe
 from collections import OrderedDict
+from contextlib import nullcontext
 from datetime import datetime
+from typing import TYPE_CHECKING
 
-import aiohttp
 import homeassistant.core as ha_core
-import pychromecast
-import spotipy
-from homeassistant.components.cast.helpers import ChromeCastZeroconf
 from homeassistant.exceptions import HomeAssistantError
-from requests import TooManyRedirects
-from .spotify_controller import SpotifyController
+from .breaker import CircuitBreakers
 from .error import TokenError
-from .const import CONF_SP_DC, CONF_SP_KEY
-from .helpers import get_cast_devices, get_spotify_devices, get_spotify_media_player
-from .spotify_controller import SpotifyController
+from .const import CONF_SP_DC, CONF_SP_KEY, STORAGE_DIR
+from .helpers import (
+    get_cast_devices,
+    get_cast_registry,
+    get_spotify_devices,
+    get_spotify_media_player,
+)
+from .library import SpotifyLibrary
+from .metrics import (
+    STAGE_CAST_CONNECT,
+    STAGE_CONNECT_LOOKUP,
+    STAGE_DEVICE_POLL,
+    STAGE_LAUNCH_APP,
+    StageMetrics,
+)
+from .ratelimit import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    RateLimiter,
+)
+from .watchdog import blocking, in_loop
+
+# aiohttp, pychromecast, requests and spotipy are imported where they
+# are first used, so that loading spotcast does not slow down the start
+# of Home Assistant
+if TYPE_CHECKING:
+    import pychromecast
+    import spotipy
 
 _LOGGER = logging.getLogger(__name__)
 
+TOKEN_URL = (
+    "https://open.spotify.com/get_access_token?reason=transport&"
+    "productType=web_player"
+)
+
+# seconds the token warm-up at setup may take before it is given up,
+# tokens not fetched by then are fetched at their first use
+TOKEN_WARM_UP_TIMEOUT = 30
+
+# seconds to wait for the connection to a cast device
+CAST_CONNECT_TIMEOUT = 10
+CAST_DISCONNECT_TIMEOUT = 5
+
 
 class SpotifyCastDevice:
     """Represents a spotify device."""
@@ -31,12 +67,33 @@ class SpotifyCastDevice:
     hass = None
     castDevice = None
     spotifyController = None
+    breaker = None
 
     def __init__(
-        self, hass: ha_core.HomeAssistant, call_device_name: str, call_entity_id: str
+        self,
+        hass: ha_core.HomeAssistant,
+        call_device_name: str,
+        call_entity_id: str,
+        breakers: CircuitBreakers | None = None,
+        chromecast: pychromecast.Chromecast | None = None,
     ) -> None:
-        """Initialize a spotify cast device."""
+        """Initialize a spotify cast device. With `breakers`, a device that
+        keeps failing is not connected to until its breaker lets a probe
+        through. A `chromecast` already connected, by the cast
+        integration, is used instead of a connection of our own"""
         self.hass = hass
+        self.breakers = breakers
+        self.borrowed = chromecast is not None
+
+        if chromecast is not None:
+            if breakers is not None:
+                self.breaker = breakers.get(
+                    f"cast {chromecast.uuid}",
+                    f"Cast device {chromecast.cast_info.friendly_name}",
+                )
+                self.breaker.check()
+            self.castDevice = chromecast
+            return
 
         # Get device name from either device_name or entity_id
         device_name = None
@@ -46,6 +103,15 @@ class SpotifyCastDevice:
                 raise HomeAssistantError(
                     "Either entity_id or device_name must be specified"
                 )
+
+            registry = get_cast_registry(hass)
+            cast_info = (
+                registry.get_by_entity_id(entity_id) if registry is not None else None
+            )
+            if cast_info is not None:
+                self.castDevice = self._connect(cast_info)
+                return
+
             entity_states = hass.states.get(entity_id)
             if entity_states is None:
                 _LOGGER.error("Could not find entity_id: %s", entity_id)
@@ -59,27 +125,72 @@ class SpotifyCastDevice:
 
         # Find chromecast device
         self.castDevice = self.get_chromecast_device(device_name)
-        _LOGGER.debug("Found cast device: %s", self.castDevice)
-        self.castDevice.wait()
+
+    @staticmethod
+    def _chromecast_from_cast_info(cast_info) -> pychromecast.Chromecast:
+        import pychromecast
+        from homeassistant.components.cast.helpers import ChromeCastZeroconf
+
+        return pychromecast.get_chromecast_from_cast_info(
+            cast_info.cast_info, ChromeCastZeroconf.get_zeroconf()
+        )
+
+    @blocking
+    def _connect(self, cast_info) -> pychromecast.Chromecast:
+        if self.breakers is not None:
+            self.breaker = self.breakers.get(
+                f"cast {cast_info.cast_info.uuid}",
+                f"Cast device {cast_info.cast_info.friendly_name}",
+            )
+            self.breaker.check()
+
+        cast = self._chromecast_from_cast_info(cast_info)
+        _LOGGER.debug("Found cast device: %s", cast)
+
+        try:
+            cast.wait(timeout=CAST_CONNECT_TIMEOUT)
+            if not cast.status_event.is_set():
+                raise HomeAssistantError(
+                    "Could not connect to cast device {}".format(
+                        cast_info.cast_info.friendly_name
+                    )
+                )
+        except Exception:
+            if self.breaker is not None:
+                self.breaker.record_failure()
+            cast.disconnect(timeout=CAST_DISCONNECT_TIMEOUT)
+            raise
+
+        return cast
+
+    def guard(self):
+        """Record the outcome of the enclosed work with the device in its
+        breaker"""
+        if self.breaker is None:
+            return nullcontext()
+        return self.breaker.guard(check=False)
 
     def get_chromecast_device(self, device_name: str) -> None:
         # Get cast from discovered devices of cast platform
-        known_devices = get_cast_devices(self.hass)
-
-        _LOGGER.debug("Chromecast devices: %s", known_devices)
-        cast_info = next(
-            (
-                castinfo
-                for castinfo in known_devices
-                if castinfo.friendly_name == device_name
-            ),
-            None,
-        )
+        registry = get_cast_registry(self.hass)
+
+        if registry is not None:
+            cast_info = registry.get_by_friendly_name(device_name)
+        else:
+            known_devices = get_cast_devices(self.hass)
+            _LOGGER.debug("Chromecast devices: %s", known_devices)
+            cast_info = next(
+                (
+                    castinfo
+                    for castinfo in known_devices
+                    if castinfo.friendly_name == device_name
+                ),
+                None,
+            )
+
         _LOGGER.debug("cast info: %s", cast_info)
         if cast_info:
-            return pychromecast.get_chromecast_from_cast_info(
-                cast_info.cast_info, ChromeCastZeroconf.get_zeroconf()
-            )
+            return self._connect(cast_info)
         _LOGGER.error(
             "Could not find device %s from hass.data",
             device_name,
@@ -88,7 +199,10 @@ class SpotifyCastDevice:
             "Could not find device with name {}".format(device_name)
         )
 
+    @blocking
     def start_spotify_controller(self, access_token: str, expires: int):
+        from .spotify_controller import SpotifyController
+
         sp = SpotifyController(self.castDevice, access_token, expires)
         self.castDevice.register_handler(sp)
         sp.launch_app()
@@ -104,6 +218,15 @@ class SpotifyCastDevice:
 
         self.spotifyController = sp
 
+    def release(self) -> None:
+        """Remove our Spotify handler from a connection of the cast
+        integration, which keeps it open after the start"""
+        if self.borrowed and self.spotifyController is not None:
+            self.castDevice.socket_client.unregister_handler(
+                self.spotifyController
+            )
+
+    @blocking
     def get_spotify_device_id(self, user_id) -> None:
         spotify_media_player = get_spotify_media_player(self.hass, user_id)
         max_retries = 5
@@ -145,6 +268,8 @@ class SpotifyToken:
     sp_key = None
     _access_token = None
     _token_expires = 0
+    _refresh = None
+    _last_error = None
 
     def __init__(self, hass: ha_core.HomeAssistant, sp_dc: str, sp_key: str):
         self.hass = hass
@@ -162,11 +287,19 @@ class SpotifyToken:
         _LOGGER.debug("expires: %s time: %s", self._token_expires, time.time())
         return self._access_token
 
+    @blocking
     def get_spotify_token(self) -> tuple[str, int]:
+        from requests import TooManyRedirects
+
+        # waiting on the loop for a refresh scheduled on it never ends
+        if in_loop(self.hass):
+            raise HomeAssistantError(
+                "get_spotify_token cannot be called from the event loop, "
+                "await async_refresh instead"
+            )
+
         try:
-            self._access_token, self._token_expires = run_coroutine_threadsafe(
-                self.start_session(), self.hass.loop
-            ).result()
+            run_coroutine_threadsafe(self.async_refresh(), self.hass.loop).result()
             expires = self._token_expires - int(time.time())
             return self._access_token, expires
         except TooManyRedirects:
@@ -178,8 +311,42 @@ class SpotifyToken:
         except (TokenError, Exception):  # noqa: E722
             raise HomeAssistantError("Could not get spotify token.")
 
+    async def async_refresh(self) -> None:
+        """Fetch a new token. Refreshes requested while one is running
+        share its session request"""
+        if self._refresh is None:
+            self._refresh = asyncio.ensure_future(self._async_fetch())
+            self._refresh.add_done_callback(self._refresh_done)
+        await asyncio.shield(self._refresh)
+
+    def _refresh_done(self, refresh: asyncio.Future) -> None:
+        self._refresh = None
+        # the failure is raised to the callers, if any are left
+        if not refresh.cancelled():
+            refresh.exception()
+
+    async def _async_fetch(self) -> None:
+        try:
+            self._access_token, self._token_expires = await self.start_session()
+        except Exception as exc:
+            self._last_error = str(exc) or type(exc).__name__
+            raise
+        self._last_error = None
+
+    def status(self) -> dict:
+        """Readiness of the token, its remaining lifetime in seconds and
+        the error of the last failed refresh"""
+        ttl = int(float(self._token_expires) - time.time())
+        return {
+            "ready": ttl > 0,
+            "ttl": max(ttl, 0),
+            "error": self._last_error,
+        }
+
     async def start_session(self):
         """ Starts session to get access token. """
+        import aiohttp
+
         cookies = {"sp_dc": self.sp_dc, "sp_key": self.sp_key}
 
         async with aiohttp.ClientSession(cookies=cookies) as session:
@@ -193,10 +360,7 @@ class SpotifyToken:
             }
 
             async with session.get(
-                (
-                    "https://open.spotify.com/get_access_token?reason="
-                    "transport&productType=web_player"
-                ),
+                TOKEN_URL,
                 allow_redirects=False,
                 headers=headers,
             ) as response:
@@ -240,11 +404,18 @@ class SpotcastController:
         sp_dc: str,
         sp_key: str,
         accs: collections.OrderedDict,
+        breakers: CircuitBreakers | None = None,
+        prober=None,
     ) -> None:
         if accs:
             self.accounts = accs
         self.accounts["default"] = OrderedDict([("sp_dc", sp_dc), ("sp_key", sp_key)])
         self.hass = hass
+        self.libraries = {}
+        self.rate_limiters = {}
+        self.metrics = StageMetrics()
+        self.breakers = breakers if breakers is not None else CircuitBreakers()
+        self.prober = prober
 
     def get_token_instance(self, account: str = None) -> any:
         """Get token instance for account"""
@@ -261,8 +432,86 @@ class SpotcastController:
             self.spotifyTokenInstances[account] = SpotifyToken(self.hass, dc, key)
         return self.spotifyTokenInstances[account]
 
-    def get_spotify_client(self, account: str) -> spotipy.Spotify:
-        return spotipy.Spotify(auth=self.get_token_instance(account).access_token)
+    async def async_warm_tokens(self, *_) -> None:
+        """Fetch the token of every configured account at once, so the
+        first start of an account does not wait for it"""
+        accounts = list(self.accounts)
+        try:
+            results = await asyncio.wait_for(
+                asyncio.gather(
+                    *(
+                        self.get_token_instance(account).async_refresh()
+                        for account in accounts
+                    ),
+                    return_exceptions=True,
+                ),
+                TOKEN_WARM_UP_TIMEOUT,
+            )
+        except asyncio.TimeoutError:
+            _LOGGER.warning("Spotify tokens were not ready after %ds",
+                            TOKEN_WARM_UP_TIMEOUT)
+            return
+
+        for account, result in zip(accounts, results):
+            if isinstance(result, Exception):
+                _LOGGER.warning(
+                    "Could not get the token of account %s: %s", account, result
+                )
+        _LOGGER.debug("Spotify tokens ready: %s", self.token_stats())
+
+    def token_stats(self) -> dict:
+        """Token status of every configured account"""
+        return {
+            account: (
+                self.spotifyTokenInstances[account].status()
+                if account in self.spotifyTokenInstances
+                else {"ready": False, "ttl": 0, "error": None}
+            )
+            for account in self.accounts
+        }
+
+    def get_rate_limiter(self, account: str = None) -> RateLimiter:
+        """Get the rate limiter shared by every client of account"""
+        if account is None:
+            account = "default"
+
+        if account not in self.rate_limiters:
+            self.rate_limiters[account] = RateLimiter()
+        return self.rate_limiters[account]
+
+    def get_spotify_client(
+        self, account: str, priority: int = PRIORITY_INTERACTIVE
+    ) -> spotipy.Spotify:
+        from .client import RateLimitedSpotify
+
+        return RateLimitedSpotify(
+            self.get_rate_limiter(account),
+            priority=priority,
+            breakers=self.breakers,
+            auth=self.get_token_instance(account).access_token,
+        )
+
+    def get_library(self, account: str = None) -> SpotifyLibrary:
+        """Get the local library mirror for account"""
+        if account is None:
+            account = "default"
+
+        if account not in self.libraries:
+            path = self.hass.config.path(STORAGE_DIR, f"library_{account}.db")
+            self.libraries[account] = SpotifyLibrary(path)
+        return self.libraries[account]
+
+    def sync_libraries(self, *_) -> None:
+        """Sync the library mirror of every configured account"""
+        for account in self.accounts:
+            try:
+                self.get_library(account).sync(
+                    self.get_spotify_client(account, PRIORITY_BACKGROUND)
+                )
+            except Exception as exc:  # pylint: disable=broad-except
+                _LOGGER.warning(
+                    "Could not sync library of account %s: %s", account, exc
+                )
 
     def _getSpotifyConnectDeviceId(self, client, device_name):
         media_player = get_spotify_media_player(self.hass, client._get("me")["id"])
@@ -272,28 +521,77 @@ class SpotcastController:
                 return device["id"]
         return None
 
-    def get_spotify_device_id(self, account, spotify_device_id, device_name, entity_id):
-        # login as real browser to get powerful token
-        access_token, expires = self.get_token_instance(account).get_spotify_token()
+    @blocking
+    def get_spotify_device_id(
+        self,
+        account,
+        spotify_device_id,
+        device_name,
+        entity_id,
+        chromecast: pychromecast.Chromecast | None = None,
+    ):
+        """Spotify Connect id of the device, launching Spotify on it if
+        needed, over `chromecast` when one is given"""
+        from .client import RateLimitedSpotify
+
+        # login as real browser to get powerful token. The token stage
+        # of a start is timed where it gets its client
+        access_token, expires = self.get_token_instance(
+            account
+        ).get_spotify_token()
         # get the spotify web api client
-        client = spotipy.Spotify(auth=access_token)
+        client = RateLimitedSpotify(
+            self.get_rate_limiter(account),
+            breakers=self.breakers,
+            auth=access_token,
+        )
+        probe = (
+            self.prober.lookup(device_name, entity_id)
+            if self.prober is not None and not spotify_device_id
+            else None
+        )
         # first, rely on spotify id given in config
-        if not spotify_device_id:
+        if not spotify_device_id and not (
+            probe is not None and probe.runs_other_app(self.prober.max_age())
+        ):
             # if not present, check if there's a spotify connect device
-            # with that name
-            spotify_device_id = self._getSpotifyConnectDeviceId(client, device_name)
+            # with that name. A speaker running another app is not one
+            with self.metrics.stage(STAGE_CONNECT_LOOKUP):
+                spotify_device_id = self._getSpotifyConnectDeviceId(
+                    client,
+                    device_name
+                    if chromecast is None
+                    else chromecast.cast_info.friendly_name,
+                )
         if not spotify_device_id:
+            if probe is not None:
+                self.prober.raise_if_unreachable(probe)
             # if still no id available, check cast devices and launch
             # the app on chromecast
-            spotify_cast_device = SpotifyCastDevice(
-                self.hass,
-                device_name,
-                entity_id,
-            )
+            with self.metrics.stage(STAGE_CAST_CONNECT):
+                spotify_cast_device = SpotifyCastDevice(
+                    self.hass,
+                    device_name,
+                    entity_id,
+                    self.breakers,
+                    chromecast,
+                )
             me_resp = client._get("me")
-            spotify_cast_device.start_spotify_controller(access_token, expires)
-            # Make sure it is started
-            spotify_device_id = spotify_cast_device.get_spotify_device_id(me_resp["id"])
+            try:
+                with spotify_cast_device.guard():
+                    with self.metrics.stage(STAGE_LAUNCH_APP):
+                        spotify_cast_device.start_spotify_controller(
+                            access_token, expires
+                        )
+                    # Make sure it is started
+                    with self.metrics.stage(STAGE_DEVICE_POLL):
+                        spotify_device_id = (
+                            spotify_cast_device.get_spotify_device_id(
+                                me_resp["id"]
+                            )
+                        )
+            finally:
+                spotify_cast_device.release()
         return spotify_device_id
 
     def play(
@@ -311,7 +609,24 @@ class SpotcastController:
             uri,
             spotify_device_id,
         )
+        playback = self.get_playback(
+            client, uri, random_song, position, ignore_fully_played, country_code
+        )
+        if playback is not None:
+            client.start_playback(device_id=spotify_device_id, **playback)
 
+    def get_playback(
+        self,
+        client: spotipy.Spotify,
+        uri: str,
+        random_song: bool,
+        position: str,
+        ignore_fully_played: str,
+        country_code: str = None,
+    ) -> dict | None:
+        """Resolve the arguments of start_playback for uri, picking the
+        episode of a show and the random position. None if there is
+        nothing to play"""
         if uri.find("show") > 0:
             show_episodes_info = client.show_episodes(uri, market=country_code)
             if show_episodes_info and len(show_episodes_info["items"]) > 0:
@@ -331,14 +646,15 @@ class SpotcastController:
                     ),
                     episode_uri,
                 )
-                client.start_playback(device_id=spotify_device_id, uris=[episode_uri])
+                return {"uris": [episode_uri]}
+            return None
         elif uri.find("episode") > 0:
             _LOGGER.debug("Playing episode using uris= for uri: %s", uri)
-            client.start_playback(device_id=spotify_device_id, uris=[uri])
+            return {"uris": [uri]}
 
         elif uri.find("track") > 0:
             _LOGGER.debug("Playing track using uris= for uri: %s", uri)
-            client.start_playback(device_id=spotify_device_id, uris=[uri])
+            return {"uris": [uri]}
         else:
             if uri == "random":
                 _LOGGER.debug(
@@ -347,7 +663,7 @@ class SpotcastController:
                 playlists = client.user_playlists("me", 50)
                 no_playlists = len(playlists["items"])
                 uri = playlists["items"][random.randint(0, no_playlists - 1)]["uri"]
-            kwargs = {"device_id": spotify_device_id, "context_uri": uri}
+            kwargs = {"context_uri": uri}
 
             if random_song:
                 if uri.find("album") > 0:
@@ -371,8 +687,9 @@ class SpotcastController:
                 uri,
                 random_song,
             )
-            client.start_playback(**kwargs)
+            return kwargs
 
+    @blocking
     def get_playlists(
         self,
         account: str,
@@ -381,7 +698,7 @@ class SpotcastController:
         locale: str,
         limit: int,
     ) -> dict:
-        client = self.get_spotify_client(account)
+        client = self.get_spotify_client(account, PRIORITY_BACKGROUND)
         resp = {}
 
         if playlist_type == "discover-weekly":
@@ -26,6 +26,8 @@ TYPE_ADD_USER = "addUser"
 TYPE_ADD_USER_RESPONSE = "addUserResponse"
 TYPE_ADD_USER_ERROR = "addUserError"
 
+DEVICE_AUTH_URL = "https://spclient.wg.spotify.com/device-auth/v1/refresh"
+
 
 # pylint: disable=too-many-instance-attributes
 class SpotifyController(BaseController):
@@ -64,7 +66,7 @@ class SpotifyController(BaseController):
             )
 
             response = requests.post(
-                "https://spclient.wg.spotify.com/device-auth/v1/refresh",
+                DEVICE_AUTH_URL,
                 headers=headers,
                 data=request_body,
             )
@@ -99,8 +101,15 @@ class SpotifyController(BaseController):
         if self.access_token is None or self.expires is None:
             raise ValueError("access_token and expires cannot be empty")
 
-        def callback(*_):
+        def callback(*args):
             """Callback function"""
+            # pychromecast reports (msg_sent, response), a failed launch
+            # must not fall through to the handshake
+            if args and not args[0]:
+                self.logger.warning("Could not launch the Spotify app")
+                self.waiting.set()
+                return
+
             self.send_message(
                 {
                     "type": TYPE_GET_INFO,
@@ -114,6 +123,7 @@ class SpotifyController(BaseController):
 
         self.device = None
         self.credential_error = False
+        self.is_launched = False
         self.waiting.clear()
         self.launch(callback_function=callback)
 
@@ -0,0 +1,148 @@
+"""Optional per-call span trees written as JSON Lines"""
+
+from __future__ import annotations
+
+import json
+import logging
+import os
+import queue
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from logging.handlers import QueueListener, RotatingFileHandler
+from typing import Iterator
+
+_LOGGER = logging.getLogger(__name__)
+
+OUTCOME_OK = "ok"
+
+_current_span: ContextVar[Span | None] = ContextVar(
+    "spotcast_current_span", default=None
+)
+
+
+class Span:
+    """A timed stage of a traced call, with its attributes and
+    children"""
+
+    def __init__(self, name: str, **attributes) -> None:
+        self.name = name
+        self.attributes = attributes
+        self.children = []
+        self.outcome = None
+        self.start = time.time()
+        self._start_monotonic = time.monotonic()
+        self.duration = None
+
+    def set(self, **attributes) -> None:
+        self.attributes.update(attributes)
+
+    def finish(self, outcome: str) -> None:
+        self.duration = time.monotonic() - self._start_monotonic
+        if self.outcome is None:
+            self.outcome = outcome
+
+    def as_dict(self) -> dict:
+        return {
+            "name": self.name,
+            "start": round(self.start, 6),
+            "end": round(self.start + (self.duration or 0), 6),
+            "duration_ms": round((self.duration or 0) * 1000, 1),
+            "outcome": self.outcome,
+            **{k: v for k, v in self.attributes.items() if v is not None},
+            "children": [child.as_dict() for child in self.children],
+        }
+
+
+@contextmanager
+def _enter(span: Span) -> Iterator[Span]:
+    token = _current_span.set(span)
+    try:
+        yield span
+    except BaseException as exc:
+        span.finish(f"error: {type(exc).__name__}")
+        raise
+    else:
+        span.finish(OUTCOME_OK)
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def trace_span(name: str, **attributes) -> Iterator[Span | None]:
+    """Record the enclosed block as a child of the current span. Does
+    nothing when the call is not traced"""
+    parent = _current_span.get()
+
+    if parent is None:
+        yield None
+        return
+
+    span = Span(name, **attributes)
+    parent.children.append(span)
+
+    with _enter(span):
+        yield span
+
+
+class Tracer:
+    """Writes the span tree of each traced call as one JSON line. Lines
+    are handed to a background thread that owns the size-rotated file,
+    so tracing never blocks the traced call on disk I/O"""
+
+    def __init__(
+        self, path: str = None, max_bytes: int = 0, backup_count: int = 0
+    ) -> None:
+        self.path = path
+        self._queue = None
+        self._listener = None
+
+        if path is None:
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        handler = RotatingFileHandler(
+            path,
+            maxBytes=max_bytes,
+            backupCount=backup_count,
+            encoding="utf-8",
+            delay=True,
+        )
+        handler.setFormatter(logging.Formatter("%(message)s"))
+
+        self._queue = queue.SimpleQueue()
+        self._listener = QueueListener(self._queue, handler)
+        self._listener.start()
+
+    @property
+    def enabled(self) -> bool:
+        return self._queue is not None
+
+    @contextmanager
+    def trace(self, name: str, **attributes) -> Iterator[Span | None]:
+        """Trace the enclosed block as the root span of a call"""
+        if not self.enabled:
+            yield None
+            return
+
+        span = Span(name, **attributes)
+
+        try:
+            with _enter(span):
+                yield span
+        finally:
+            self._write(span)
+
+    def _write(self, span: Span) -> None:
+        try:
+            line = json.dumps(span.as_dict(), default=str)
+        except (TypeError, ValueError) as exc:
+            _LOGGER.warning("Could not serialize trace of %s: %s", span.name, exc)
+            return
+
+        self._queue.put_nowait(logging.makeLogRecord({"msg": line}))
+
+    def shutdown(self, *_) -> None:
+        if self._listener is not None:
+            self._listener.stop()
+            self._listener = None
@@ -0,0 +1,152 @@
+"""Cast devices and playlists fetched once per interval for the sensors
+and the websocket commands"""
+
+from __future__ import annotations
+
+import logging
+import time
+from collections import Counter
+from datetime import timedelta
+from typing import Any, Awaitable, Callable
+
+import homeassistant.core as ha_core
+from homeassistant.helpers.update_coordinator import DataUpdateCoordinator
+from homeassistant.util import dt
+
+from .executor import LANE_API, SpotcastExecutor
+from .helpers import get_cast_devices
+from .singleflight import SingleFlight
+
+_LOGGER = logging.getLogger(__name__)
+
+UPDATE_INTERVAL = timedelta(seconds=60)
+
+# user playlists are fetched once at the largest page size of the Web
+# API, and every consumer gets the number it asked for
+PLAYLIST_LIMIT = 50
+USER_PLAYLIST_TYPES = ("user", "default", "")
+
+
+class SpotcastCoordinator(DataUpdateCoordinator):
+    """Refreshes its data every `UPDATE_INTERVAL` while a sensor listens,
+    and on demand for the websocket commands when it is older than
+    that. Concurrent demands share one fetch"""
+
+    def __init__(
+        self,
+        hass: ha_core.HomeAssistant,
+        name: str,
+        fetch: Callable[[], Awaitable[Any]],
+    ) -> None:
+        super().__init__(
+            hass,
+            _LOGGER,
+            name=name,
+            update_interval=UPDATE_INTERVAL,
+            update_method=fetch,
+        )
+        self.last_update = None
+        self.counts = Counter()
+        self._fetched = None
+        self._inflight = SingleFlight()
+
+    async def _async_update_data(self) -> Any:
+        self.counts["fetches"] += 1
+        data = await super()._async_update_data()
+        self._fetched = time.monotonic()
+        self.last_update = dt.now().isoformat("T")
+        return data
+
+    def is_fresh(self) -> bool:
+        return (
+            self.data is not None
+            and self.last_update_success
+            and time.monotonic() - self._fetched
+            < self.update_interval.total_seconds()
+        )
+
+    async def async_get(self) -> Any:
+        """The data, fetched first when it is older than the interval.
+        Raises the error of a failed fetch"""
+        if self.is_fresh():
+            self.counts["hits"] += 1
+            return self.data
+        return await self._inflight.run("refresh", self._async_fetch_now)
+
+    async def _async_fetch_now(self) -> Any:
+        data = await self._async_update_data()
+        self.async_set_updated_data(data)
+        return data
+
+    def stats(self) -> dict:
+        return {
+            "fetches": self.counts["fetches"],
+            "hits": self.counts["hits"],
+            "last_update": self.last_update,
+        }
+
+
+def slice_playlists(resp: dict, limit: int) -> dict:
+    """User playlists as fetched with `limit`"""
+    return {**resp, "items": resp["items"][:limit], "limit": limit}
+
+
+class SpotcastData:
+    """The coordinators of the cast device list and of the user
+    playlists of every account"""
+
+    def __init__(
+        self,
+        hass: ha_core.HomeAssistant,
+        controller,
+        executor: SpotcastExecutor,
+    ) -> None:
+        self.hass = hass
+        self.controller = controller
+        self.executor = executor
+        self.cast_devices = SpotcastCoordinator(
+            hass, "spotcast cast devices", self._async_fetch_cast_devices
+        )
+        self._playlists = {}
+
+    async def _async_fetch_cast_devices(self) -> list[dict]:
+        return [
+            {
+                "uuid": str(cast_info.cast_info.uuid),
+                "model_name": cast_info.cast_info.model_name,
+                "name": cast_info.cast_info.friendly_name,
+                "manufacturer": cast_info.cast_info.manufacturer,
+                "cast_type": cast_info.cast_info.cast_type,
+            }
+            for cast_info in get_cast_devices(self.hass)
+        ]
+
+    def playlists(self, account: str | None) -> SpotcastCoordinator:
+        """Coordinator of the user playlists of `account`"""
+        account = account or "default"
+        if account not in self._playlists:
+
+            async def fetch() -> dict:
+                return await self.executor.run(
+                    LANE_API,
+                    self.controller.get_playlists,
+                    account,
+                    "user",
+                    None,
+                    "en",
+                    PLAYLIST_LIMIT,
+                )
+
+            self._playlists[account] = SpotcastCoordinator(
+                self.hass, f"spotcast playlists {account}", fetch
+            )
+        return self._playlists[account]
+
+    def stats(self) -> dict:
+        return {
+            "cast_devices": self.cast_devices.stats(),
+            "playlists": {
+                account: coordinator.stats()
+                for account, coordinator in self._playlists.items()
+            },
+        }
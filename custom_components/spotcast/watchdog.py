@@ -0,0 +1,183 @@
+"""Detection of spotcast code blocking the event loop"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from functools import wraps
+from typing import Callable
+
+import homeassistant.core as ha_core
+from homeassistant.util import dt
+
+_LOGGER = logging.getLogger(__name__)
+
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MAX_REPORTS = 20
+STACK_LIMIT = 30
+
+# the watchdog of the running instance, None unless it is enabled
+_active: LoopWatchdog | None = None
+
+
+def in_loop(hass: ha_core.HomeAssistant) -> bool:
+    """Whether the caller runs on the event loop of Home Assistant"""
+    try:
+        return asyncio.get_running_loop() is hass.loop
+    except RuntimeError:
+        return False
+
+
+def blocking(func: Callable) -> Callable:
+    """Mark `func` as blocking, so the watchdog reports it when it is
+    called on the event loop"""
+
+    @wraps(func)
+    def run(*args, **kwargs):
+        watchdog = _active
+        if watchdog is not None and watchdog.is_loop_thread():
+            watchdog.report_loop_call(func.__qualname__)
+        return func(*args, **kwargs)
+
+    return run
+
+
+def _spotcast_frames(frame) -> list[traceback.FrameSummary]:
+    stack = traceback.extract_stack(frame, limit=STACK_LIMIT)
+    return [entry for entry in stack if entry.filename.startswith(PACKAGE_DIR)]
+
+
+class LoopWatchdog:
+    """Reports blocking spotcast calls made on the event loop thread,
+    and stalls of the loop longer than `threshold` seconds while it runs
+    spotcast code. A heartbeat scheduled on the loop is watched by a
+    thread, which takes the stack of the loop thread once the heartbeat
+    is late"""
+
+    def __init__(self, hass: ha_core.HomeAssistant, threshold: float) -> None:
+        self.hass = hass
+        self.threshold = threshold
+        self.tick = threshold / 2
+        self.reports = deque(maxlen=MAX_REPORTS)
+        self.counts = Counter()
+        self.last_block_ms = None
+        self._loop_thread_id = None
+        self._last_beat = 0.0
+        self._stall = None
+        self._handle = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_loop_thread(self) -> bool:
+        return threading.get_ident() == self._loop_thread_id
+
+    @ha_core.callback
+    def async_start(self, *_) -> None:
+        global _active  # pylint: disable=global-statement
+
+        self._loop_thread_id = threading.get_ident()
+        self._beat()
+        self._thread = threading.Thread(
+            target=self._watch, name="spotcast watchdog", daemon=True
+        )
+        self._thread.start()
+        _active = self
+
+    @ha_core.callback
+    def async_stop(self, *_) -> None:
+        global _active  # pylint: disable=global-statement
+
+        if _active is self:
+            _active = None
+        self._stop.set()
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+    @ha_core.callback
+    def _beat(self) -> None:
+        self._last_beat = time.monotonic()
+        self._handle = self.hass.loop.call_later(self.tick, self._beat)
+
+    def report_loop_call(self, name: str) -> None:
+        """Record a blocking call made on the event loop"""
+        stack = traceback.extract_stack(sys._getframe(2), limit=STACK_LIMIT)
+        self.counts["loop_calls"] += 1
+        self._record("loop_call", name, None, stack)
+
+    def _watch(self) -> None:
+        while not self._stop.wait(self.tick):
+            late = time.monotonic() - self._last_beat - self.tick
+
+            if late <= self.threshold:
+                if self._stall is not None:
+                    self._end_stall()
+                continue
+
+            if self._stall is None:
+                frame = sys._current_frames().get(self._loop_thread_id)
+                stack = _spotcast_frames(frame) if frame is not None else []
+                # stalls outside spotcast are not ours to report
+                self._stall = {"stack": stack, "spotcast": bool(stack)}
+            self._stall["duration"] = late
+
+    def _end_stall(self) -> None:
+        stall, self._stall = self._stall, None
+        if not stall["spotcast"]:
+            self.counts["other_stalls"] += 1
+            return
+
+        self.counts["stalls"] += 1
+        stack = stall["stack"]
+        self._record("stall", stack[-1].name, stall["duration"], stack)
+
+    def _record(
+        self,
+        kind: str,
+        name: str,
+        duration: float | None,
+        stack: list[traceback.FrameSummary],
+    ) -> None:
+        report = {
+            "kind": kind,
+            "call": name,
+            "duration_ms": round(duration * 1000) if duration is not None else None,
+            "time": dt.now().isoformat("T"),
+            "stack": traceback.format_list(stack),
+        }
+        self.reports.append(report)
+        if kind == "stall":
+            self.last_block_ms = report["duration_ms"]
+
+        if kind == "stall":
+            _LOGGER.warning(
+                "%s blocked the event loop for at least %d ms:\n%s",
+                name,
+                report["duration_ms"],
+                "".join(report["stack"]),
+            )
+        else:
+            _LOGGER.warning(
+                "%s called on the event loop:\n%s", name, "".join(report["stack"])
+            )
+
+    def summary(self) -> dict:
+        """The counts and the duration of the last stall, without the
+        stacks of the reports"""
+        return {
+            "threshold_ms": round(self.threshold * 1000),
+            "loop_calls": self.counts["loop_calls"],
+            "stalls": self.counts["stalls"],
+            "other_stalls": self.counts["other_stalls"],
+            "last_block_ms": self.last_block_ms,
+        }
+
+    def stats(self) -> dict:
+        return {**self.summary(), "reports": list(self.reports)}